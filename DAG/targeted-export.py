@@ -14,6 +14,7 @@ from kubernetes.client import models as k8s_models
 MYSQL_DATABASE_PASSWORD=os.environ.get('MYSQL_DATABASE_PASSWORD')
 MYSQL_DATABASE_USER=os.environ.get('MYSQL_DATABASE_USER')
 MYSQL_DATABASE_INSTANCE=os.environ.get('MYSQL_DATABASE_INSTANCE')
+MYSQL_DATABASE_REPLICAS=os.environ.get('MYSQL_DATABASE_REPLICAS', '') # comma separated read replicas for the edge pods
 PR_BUCKET = os.environ.get('PR_BUCKET')
 UNI_BUCKET = os.environ.get('UNI_BUCKET')
 TMP_BUCKET = os.environ.get('TMP_BUCKET')
@@ -23,6 +24,8 @@ EVIDENCE_LIMIT = 5
 # STEP_SIZE = 75000 ### STEP_SIZE doesn't seem to be used
 ASSERTION_LIMIT = 100000 # This is the default in Edgar's original implementation so keeping it for now
 CHUNK_SIZE = '25000'
+# The per-shard files in data/kgx-build/ that the merge, operations and metadata targets read every one of
+SHARD_FILES = 'edges_* operations_*.json edge_metadata_*.json parquet/edges_* jsonl/edges_*'
 
 # # for testing
 # ASSERTION_LIMIT = 25000
@@ -42,41 +45,6 @@ default_args = {
 }
 
 
-def output_operations(**kwargs):
-    operations_dict = {}
-    with open(kwargs['edges_filename'], 'r') as infile:
-        for line in infile:
-            columns = line.split('\t')
-            if len(columns) < 13:
-                print('not enough columns')
-                print(line)
-                continue
-            subject_namespace = columns[0].split(':')[0]
-            object_namespace = columns[2].split(':')[0]
-            predicate = 'no_predicate'
-            if columns[1] == 'biolink:treats':
-                predicate = 'treats'
-            elif columns[1] == 'biolink:contributes_to':
-                predicate = 'contributes_to'
-            elif columns[1] == 'biolink:affects':
-                if columns[3] == 'biolink:causes':
-                    if columns[8] == 'activity_or_abundance' and columns[9] == 'increased':
-                        predicate = 'positively_regulates'
-                    elif columns[8] == 'activity_or_abundance' and columns[9] == 'decreased':
-                        predicate = 'negatively_regulates'
-                elif columns[3] == 'biolink:contributes_to':
-                    if columns[7] == 'gain_of_function_variant_form':
-                        predicate = 'gain_of_function_contributes_to'
-                    elif columns[7] == 'loss_of_function_variant_form':
-                        predicate = 'loss_of_function_contributes_to'
-            key = subject_namespace + '_' + predicate + '_' + object_namespace
-            if key in operations_dict:
-                operations_dict[key] += 1
-            else:
-                operations_dict[key] = 1
-    with open(kwargs['output_filename'], 'w') as outfile:
-        x = outfile.write(json.dumps(operations_dict))
-
 # TODO: we are able to read the assertion count after querying for it, but not sure how to get it from XComArgs as an integer to use it in generate_edge_export_arguments
 def read_assertion_count_from_file(ti, **kwargs):
     file_path = kwargs['file_path']
@@ -161,6 +129,7 @@ with models.DAG(dag_id='targeted-export', schedule_interval= '0 23 * * 6', defau
                 'MYSQL_DATABASE_PASSWORD': MYSQL_DATABASE_PASSWORD,
                 'MYSQL_DATABASE_USER': MYSQL_DATABASE_USER,
                 'MYSQL_DATABASE_INSTANCE': MYSQL_DATABASE_INSTANCE,
+                'MYSQL_DATABASE_REPLICAS': MYSQL_DATABASE_REPLICAS,
             },
             container_resources=k8s_models.V1ResourceRequirements(
                 limits={"memory": "1G", "cpu": "1000m"},
@@ -169,9 +138,32 @@ with models.DAG(dag_id='targeted-export', schedule_interval= '0 23 * * 6', defau
             image='gcr.io/translator-text-workflow-dev/kgx-export:latest'
         ).expand(arguments=generate_edge_export_arguments(ASSERTION_LIMIT, CHUNK_SIZE, EVIDENCE_LIMIT, TMP_BUCKET))
     
-    cat_edge_files = BashOperator(
-        task_id='targeted-cat-edge-files',
-        bash_command=f"cd /home/airflow/gcs/data/kgx-build/ && cat edges*.tsv > edges.tsv && cp edges.tsv /home/airflow/gcs/data/kgx-export/")
+    merge_edge_files = KubernetesPodOperator(
+        task_id='targeted-merge-edge-files',
+        name='merge-edge-files',
+        config_file="/home/airflow/composer_kube_config",
+        namespace='composer-user-workloads',
+        image_pull_policy='Always',
+        arguments=['-t', 'merge', '-b', TMP_BUCKET],
+        image='gcr.io/translator-text-workflow-dev/kgx-export:latest')
+
+    validate_files = KubernetesPodOperator(
+        task_id='targeted-validate-files',
+        name='validate-files',
+        config_file="/home/airflow/composer_kube_config",
+        namespace='composer-user-workloads',
+        image_pull_policy='Always',
+        arguments=['-t', 'validate', '-b', TMP_BUCKET, '--workers', '4'],
+        image='gcr.io/translator-text-workflow-dev/kgx-export:latest')
+
+    diff_edge_files = KubernetesPodOperator(
+        task_id='targeted-diff-edge-files',
+        name='diff-edge-files',
+        config_file="/home/airflow/composer_kube_config",
+        namespace='composer-user-workloads',
+        image_pull_policy='Always',
+        arguments=['-t', 'diff', '-b', TMP_BUCKET, '--previous_bucket', UNI_BUCKET],
+        image='gcr.io/translator-text-workflow-dev/kgx-export:latest')
 
     generate_metadata = KubernetesPodOperator(
         task_id='targeted-metadata',
@@ -182,17 +174,14 @@ with models.DAG(dag_id='targeted-export', schedule_interval= '0 23 * * 6', defau
         arguments=['-t', 'metadata', '-b', TMP_BUCKET],
         image='gcr.io/translator-text-workflow-dev/kgx-export:latest')
     
-    generate_bte_operations = PythonOperator(
+    generate_bte_operations = KubernetesPodOperator(
         task_id='generate_bte_operations',
-        python_callable=output_operations,
-        provide_context=True,
-        op_kwargs={'edges_filename': '/home/airflow/gcs/data/kgx-export/edges.tsv',
-                   'output_filename': '/home/airflow/gcs/data/kgx-export/operations.json'},
-        dag=dag)
-    
-    compress_edge_file = BashOperator(
-        task_id='targeted-compress',
-        bash_command=f"cd /home/airflow/gcs/data/kgx-export/ && gzip -f edges.tsv")
+        name='bte-operations',
+        config_file="/home/airflow/composer_kube_config",
+        namespace='composer-user-workloads',
+        image_pull_policy='Always',
+        arguments=['-t', 'operations', '-b', TMP_BUCKET],
+        image='gcr.io/translator-text-workflow-dev/kgx-export:latest')
     
     publish_files = BashOperator(
         task_id='targeted-publish',
@@ -200,6 +189,12 @@ with models.DAG(dag_id='targeted-export', schedule_interval= '0 23 * * 6', defau
     
     clean_up = BashOperator(
         task_id='clean-up',
-        bash_command=f"cd /home/airflow/gcs/data/kgx-build/ && rm *.tsv")
+        bash_command=f"cd /home/airflow/gcs/data/kgx-build/ && rm -f {SHARD_FILES}")
+
+    # a failed run (or one with a different number of shards) leaves shard files behind, which would be merged and
+    # counted again with this run's
+    clear_shard_files = BashOperator(
+        task_id='clear-shard-files',
+        bash_command=f"mkdir -p /home/airflow/gcs/data/kgx-build/ && cd /home/airflow/gcs/data/kgx-build/ && rm -f {SHARD_FILES}")
 
-    export_nodes >> export_assertion_count >> read_assertion_count >> export_edges >> cat_edge_files >> generate_bte_operations >> compress_edge_file >> generate_metadata >> publish_files >> clean_up
+    clear_shard_files >> export_nodes >> export_assertion_count >> read_assertion_count >> export_edges >> merge_edge_files >> validate_files >> diff_edge_files >> generate_bte_operations >> generate_metadata >> publish_files >> clean_up
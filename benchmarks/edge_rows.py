@@ -0,0 +1,105 @@
+"""
+Compare fetch time, formatting throughput and retained memory for SQLAlchemy Row objects against the raw DB-API
+EdgeRecord path.
+
+Usage: python benchmarks/edge_rows.py [-a ASSERTIONS] [-e EVIDENCE_PER_ASSERTION] [-r REPEAT]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import services
+import targeted
+
+PREDICATES = ['biolink:entity_negatively_regulates_entity', 'biolink:entity_positively_regulates_entity',
+              'biolink:treats']
+
+
+def populate(session, assertion_count: int, evidence_count: int) -> list[str]:
+    session.execute(text(f'CREATE TABLE edge_rows ({", ".join(services.EDGE_QUERY_FIELDS)})'))
+    insert = text(f'INSERT INTO edge_rows VALUES ({", ".join(":" + field for field in services.EDGE_QUERY_FIELDS)})')
+    rows = []
+    for i in range(assertion_count):
+        for j in range(evidence_count):
+            rows.append({
+                'assertion_id': f'{i:064x}', 'evidence_id': f'{i:032x}{j:032x}',
+                'association_curie': 'biolink:ChemicalToGeneAssociation', 'predicate_curie': random.choice(PREDICATES),
+                'subject_curie': f'CHEBI:{i % 5000}', 'object_curie': f'UniProtKB:P{i % 7000:05d}',
+                'document_id': f'PMID:{random.randint(10000000, 39999999)}', 'document_zone': 'abstract',
+                'document_year_published': random.randint(1975, 2024), 'score': random.random(),
+                'sentence': ' '.join(['lorem ipsum dolor sit amet'] * random.randint(2, 20)),
+                'subject_span': '0|5', 'object_span': '10|15', 'evidence_count': evidence_count
+            })
+    session.execute(insert, rows)
+    session.execute(text('CREATE TABLE concept_idf (concept_curie TEXT, idf REAL)'))
+    session.execute(text('INSERT INTO concept_idf VALUES (:curie, :idf)'),
+                    [{'curie': f'CHEBI:{i}', 'idf': random.uniform(1, 50)} for i in range(5000)] +
+                    [{'curie': f'UniProtKB:P{i:05d}', 'idf': random.uniform(1, 50)} for i in range(7000)])
+    session.commit()
+    return [f'{i:064x}' for i in range(assertion_count)]
+
+
+def format_chunk(rows, idf_weights: dict) -> int:
+    edge_dict = targeted.create_edge_dict(rows, idf_weights)
+    targeted.uniquify_edge_dict(edge_dict)
+    services.score_edge_dict(edge_dict)
+    count = 0
+    for assertion_rows in edge_dict.values():
+        for predicate in set(row.predicate_curie for row in assertion_rows):
+            if services.get_edge(assertion_rows, predicate):
+                count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-a', '--assertions', default=5000, type=int)
+    parser.add_argument('-e', '--evidence', default=5, type=int)
+    parser.add_argument('-r', '--repeat', default=3, type=int)
+    args = parser.parse_args()
+
+    random.seed(0)
+    engine = create_engine('sqlite://')
+    session = sessionmaker(bind=engine)()
+    ids = populate(session, args.assertions, args.evidence)
+    idf_weights = targeted.get_idf_weights(session)
+    query = text(f'SELECT {", ".join(services.EDGE_QUERY_FIELDS)} FROM edge_rows WHERE assertion_id IN :ids '
+                 'ORDER BY assertion_id').bindparams(bindparam('ids', expanding=True))
+
+    strategies = {
+        'row': lambda: [row for row in session.execute(query, {'ids': ids})],
+        'record': lambda: [services.make_edge_record(row, strings, idf_weights)
+                           for strings in [{}] for row in session.execute(query, {'ids': ids})],
+        'raw': lambda: [services.make_edge_record(row, strings, idf_weights)
+                        for strings in [{}] for row in targeted.fetch_raw_rows(session, query, {'ids': ids})],
+    }
+    for name, fetch in strategies.items():
+        fetch_times = []
+        format_times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            rows = fetch()
+            fetched = time.perf_counter()
+            edge_count = format_chunk(rows, idf_weights)
+            fetch_times.append(fetched - start)
+            format_times.append(time.perf_counter() - fetched)
+        rows = None
+        tracemalloc.start()
+        rows = fetch()
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f'{name}: {len(rows)} rows, {edge_count} edges, '
+              f'fetch {min(fetch_times):.3f}s, format {min(format_times):.3f}s, '
+              f'total {min(fetch_times) + min(format_times):.3f}s, retained {retained / 1024 / 1024:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
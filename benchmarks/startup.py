@@ -0,0 +1,101 @@
+"""
+Measure the import cost paid by each exporter target before it does any work, using python -X importtime.
+
+The file-only targets are run through exporter.main with the GCP storage helpers replaced by no-ops, so the imports
+made inside the target functions are measured too; the benchmark fails if one of them loads SQLAlchemy. The database
+targets only load their modules, since running them needs a database.
+
+Usage: python benchmarks/startup.py [-t TARGET ...] [-s] [-n TOP] [-r REPEAT]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import exporter
+
+# Runs a file target with no input files: it fails as soon as it reads one, after the imports on its way in
+FILE_TARGET_CODE = """
+import sys
+import services
+services.get_from_gcp = services.upload_to_gcp = lambda *args, **kwargs: None
+services.list_gcp_blobs = lambda *args, **kwargs: []
+import exporter
+try:
+    exporter.main(['-t', {target!r}, '-b', 'benchmark'])
+except Exception:
+    pass
+print('sqlalchemy' in sys.modules)
+"""
+DATABASE_TARGET_CODE = """
+import sys
+import exporter
+exporter.load_target_modules({target!r}, {from_snapshot!r})
+print('sqlalchemy' in sys.modules)
+"""
+
+
+def measure_imports(target: str, from_snapshot: bool = False) -> tuple[list[tuple[str, int, int, int]], bool]:
+    """
+    Run the entry path of a target in a fresh interpreter, in an empty working directory
+
+    :param target: the export target
+    :param from_snapshot: whether a database target reads a local snapshot
+    :returns a list of (module, self microseconds, cumulative microseconds, nesting depth) tuples in import order
+    and whether SQLAlchemy was loaded, or None if one of the target's modules could not be imported
+    """
+    if target in exporter.FILE_TARGETS:
+        code = FILE_TARGET_CODE.format(target=target)
+    else:
+        code = DATABASE_TARGET_CODE.format(target=target, from_snapshot=from_snapshot)
+    with tempfile.TemporaryDirectory() as directory:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=directory, capture_output=True,
+                                text=True, env=dict(os.environ, PYTHONPATH=ROOT))
+    if result.returncode != 0:
+        print(f'{target:<12} failed: {result.stderr.strip().splitlines()[-1]}')
+        return None
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative, module = line[len('import time:'):].split('|')
+        depth = (len(module) - len(module.lstrip()) - 1) // 2
+        imports.append((module.strip(), int(self_time), int(cumulative), depth))
+    return imports, result.stdout.strip().splitlines()[-1] == 'True'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--target', nargs='*', default=exporter.FILE_TARGETS + exporter.DATABASE_TARGETS)
+    parser.add_argument('-n', '--top', type=int, default=5, help='number of slowest top-level imports to show')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-s', '--snapshot', action='store_true',
+                        help='measure the edges and worker targets reading a local snapshot')
+    args = parser.parse_args()
+
+    loading_database = []
+    for target in args.target:
+        measured = [measure_imports(target, args.snapshot and target in exporter.SNAPSHOT_TARGETS)
+                    for _ in range(args.repeat)]
+        if None in measured:
+            continue
+        runs = [imports for imports, _ in measured]
+        if target in exporter.FILE_TARGETS and any(sqlalchemy for _, sqlalchemy in measured):
+            loading_database.append(target)
+        totals = sorted(sum(item[1] for item in run) for run in runs)
+        best = min(runs, key=lambda run: sum(item[1] for item in run))
+        # site and its dependencies are imported by the interpreter before the exporter, whatever the target
+        top_level = [(module, cumulative) for module, _, cumulative, depth in best if depth == 0 and module != 'site']
+        print(f'{target:<12} {len(best):>5} modules  median {totals[len(totals) // 2] / 1000:8.1f} ms')
+        for module, cumulative in sorted(top_level, key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f'    {module:<40} {cumulative / 1000:8.1f} ms')
+    if loading_database:
+        sys.exit(f'File targets loading SQLAlchemy: {", ".join(loading_database)}')
+
+
+if __name__ == '__main__':
+    main()
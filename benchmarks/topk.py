@@ -0,0 +1,89 @@
+"""
+Compare the top-k evidence selection strategies of the edge query on a synthetic targeted schema.
+
+SQLite has no LATERAL joins, so only the window and heap strategies run against the default in-memory database. Pass
+--url with a MySQL database that has the targeted schema to compare all three.
+
+Usage: python benchmarks/topk.py [-a ASSERTIONS] [-e MAX_EVIDENCE] [-l LIMIT ...] [-r REPEAT] [--url URL]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import targeted
+
+PREDICATES = ['biolink:entity_negatively_regulates_entity', 'biolink:entity_positively_regulates_entity',
+              'biolink:treats']
+
+
+def populate(session, assertion_count: int, max_evidence: int) -> list[str]:
+    session.execute(text("ATTACH DATABASE ':memory:' AS targeted"))
+    session.execute(text('CREATE TABLE targeted.assertion (assertion_id TEXT PRIMARY KEY, association_curie TEXT, '
+                         'subject_curie TEXT, object_curie TEXT)'))
+    session.execute(text('CREATE TABLE targeted.evidence (evidence_id TEXT PRIMARY KEY, assertion_id TEXT, '
+                         'predicate_curie TEXT, document_id TEXT, document_zone TEXT, document_year_published INTEGER, '
+                         'score REAL, sentence TEXT, subject_span TEXT, object_span TEXT)'))
+    session.execute(text('CREATE INDEX targeted.evidence_assertion ON evidence (assertion_id, predicate_curie)'))
+    assertions = []
+    evidence = []
+    for i in range(assertion_count):
+        assertions.append({'assertion_id': f'{i:064x}', 'association_curie': 'biolink:ChemicalToGeneAssociation',
+                           'subject_curie': f'CHEBI:{i % 5000}', 'object_curie': f'UniProtKB:P{i % 7000:05d}'})
+        # a few assertions have many evidence records, as in the real data
+        for j in range(min(int(random.paretovariate(1.2)), max_evidence)):
+            evidence.append({'evidence_id': f'{i:032x}{j:032x}', 'assertion_id': f'{i:064x}',
+                             'predicate_curie': random.choice(PREDICATES),
+                             'document_id': f'PMID:{random.randint(10000000, 39999999)}',
+                             'document_zone': random.choice(['abstract', 'abstract', 'title', 'REF']),
+                             'document_year_published': random.randint(1975, 2024), 'score': random.random(),
+                             'sentence': 'lorem ipsum dolor sit amet', 'subject_span': '0|5', 'object_span': '10|15'})
+    session.execute(text('INSERT INTO targeted.assertion VALUES '
+                         '(:assertion_id, :association_curie, :subject_curie, :object_curie)'), assertions)
+    session.execute(text('INSERT INTO targeted.evidence VALUES (:evidence_id, :assertion_id, :predicate_curie, '
+                         ':document_id, :document_zone, :document_year_published, :score, :sentence, '
+                         ':subject_span, :object_span)'), evidence)
+    session.commit()
+    print(f'{assertion_count} assertions, {len(evidence)} evidence records')
+    return [assertion['assertion_id'] for assertion in assertions]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-a', '--assertions', default=20000, type=int)
+    parser.add_argument('-e', '--evidence', default=500, type=int, help='maximum evidence records per assertion')
+    parser.add_argument('-l', '--limit', nargs='*', default=[5, 0], type=int, help='edge limits (0 is no limit)')
+    parser.add_argument('-c', '--chunk_size', default=1000, type=int)
+    parser.add_argument('-r', '--repeat', default=3, type=int)
+    parser.add_argument('--url', help='a database URL with the targeted schema (default: synthetic SQLite)')
+    args = parser.parse_args()
+
+    random.seed(0)
+    if args.url:
+        session = sessionmaker(bind=create_engine(args.url))()
+        ids = targeted.get_assertion_ids(session, limit=args.assertions)
+        strategies = targeted.TOP_K_STRATEGIES
+    else:
+        session = sessionmaker(bind=create_engine('sqlite://'))()
+        ids = populate(session, args.assertions, args.evidence)
+        strategies = [strategy for strategy in targeted.TOP_K_STRATEGIES if strategy != 'lateral']
+
+    for edge_limit in args.limit:
+        for strategy in strategies:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                row_count = sum(len(rows) for rows in targeted.get_edge_data(
+                    session, ids, args.chunk_size, edge_limit, idf_weights={}, top_k=strategy))
+                times.append(time.perf_counter() - start)
+            print(f'limit {edge_limit:>3} {strategy:<8} {row_count:>8} rows  {min(times):.3f}s')
+
+
+if __name__ == '__main__':
+    main()
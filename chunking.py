@@ -0,0 +1,90 @@
+import logging
+import os
+import resource
+
+DEFAULT_MEMORY_BUDGET = 768 * 1024 * 1024  # bytes; the edge export pods are limited to 1 GiB
+DEFAULT_TARGET_SECONDS = 30.0
+MIN_CHUNK_SIZE = 10
+MAX_CHUNK_SIZE = 100000
+MAX_GROWTH = 2.0  # a chunk is at most this many times larger than the one before it
+# Formatting a chunk (edge dict, JSON attributes, output lines) takes several times the memory of its fetched rows
+FORMAT_MEMORY_FACTOR = 4.0
+RECORD_OVERHEAD = 600  # approximate bytes per EdgeRecord besides its sentence (slots, ids, spans, scores)
+
+
+def get_rss_bytes() -> int:
+    """
+    Get the resident set size of this process
+
+    :returns the current RSS in bytes, or the peak RSS if /proc is not available
+    """
+    try:
+        with open('/proc/self/statm', 'r') as infile:
+            return int(infile.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):  # pragma: no cover
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def estimate_record_bytes(record) -> int:
+    """
+    Estimate the memory held by one fetched evidence row
+
+    :param record: an EdgeRecord
+    :returns the approximate size in bytes, dominated by the sentence length
+    """
+    return RECORD_OVERHEAD + len(record.sentence) if record.sentence else RECORD_OVERHEAD
+
+
+class AdaptiveChunkSizer:
+    """
+    Chooses the number of assertions in each chunk of the edge query from what the previous chunks cost.
+
+    The next chunk is the largest that is expected to fit in the memory left under the budget (from the observed
+    RSS, rows per assertion and bytes per row) and to finish within the target query time, growing by at most
+    MAX_GROWTH per chunk. When several shards run in one process, each sizer leaves room for the other shards'
+    chunks.
+    """
+
+    def __init__(self, initial_size: int = 100, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 target_seconds: float = DEFAULT_TARGET_SECONDS, min_size: int = MIN_CHUNK_SIZE,
+                 max_size: int = MAX_CHUNK_SIZE, concurrency: int = 1):
+        self.size = max(min_size, min(initial_size, max_size))
+        self.memory_budget = memory_budget
+        self.target_seconds = target_seconds
+        self.concurrency = max(concurrency, 1)
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def next_size(self) -> int:
+        return self.size
+
+    def observe(self, assertion_count: int, row_count: int, row_bytes: int, seconds: float, rss: int = None) -> int:
+        """
+        Update the chunk size from the cost of the chunk that was just fetched
+
+        :param assertion_count: the number of assertions in the chunk
+        :param row_count: the number of evidence rows fetched for the chunk
+        :param row_bytes: the estimated size of the fetched rows in bytes
+        :param seconds: the time taken by the query
+        :param rss: the resident set size after the fetch (measured if not given)
+        :returns the size of the next chunk
+        """
+        if assertion_count == 0:
+            return self.size
+        rss = rss if rss is not None else get_rss_bytes()
+        chunk_bytes = row_bytes / assertion_count * FORMAT_MEMORY_FACTOR
+        # the rows of the chunk just fetched are still held, so they count as available for the next one
+        available = self.memory_budget - rss + row_bytes
+        sizes = {'growth': int(self.size * MAX_GROWTH)}
+        if chunk_bytes > 0:
+            sizes['memory'] = int(max(available, 0) / (chunk_bytes * self.concurrency))
+        if seconds > 0:
+            sizes['latency'] = int(assertion_count * self.target_seconds / seconds)
+        limit = min(sizes, key=sizes.get)
+        size = max(self.min_size, min(sizes[limit], self.max_size))
+        if size != self.size:
+            logging.info(f'Chunk size {self.size} -> {size} ({limit} bound): {assertion_count} assertions, '
+                         f'{row_count} rows, {row_bytes / max(row_count, 1):.0f} bytes/row, {seconds:.2f}s, '
+                         f'RSS {rss / 1024 / 1024:.0f} of {self.memory_budget / 1024 / 1024:.0f} MiB')
+        self.size = size
+        return size
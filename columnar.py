@@ -0,0 +1,142 @@
+"""
+Parquet output of the KGX nodes and edges, written alongside the TSV files.
+
+The columns are typed (confidence_score is a float, supporting_study_results and supporting_publications are lists,
+empty qualifiers are null), so queries over a subset of the columns never parse the _attributes JSON. Each chunk of
+edges is written as one row group, and the shard files are merged by assertion id like the TSV files (see
+merge_files). pyarrow is only needed when columnar output is requested.
+"""
+import heapq
+import itertools
+import json
+import logging
+from operator import itemgetter
+
+import services
+
+STRING = 'string'
+FLOAT = 'float'
+LIST = 'list'
+NODE_COLUMNS = (('id', STRING), ('name', STRING), ('category', STRING))
+EDGE_COLUMNS = ((('subject', STRING), ('predicate', STRING), ('object', STRING)) +
+                tuple((qualifier, STRING) for qualifier in services.QUALIFIER_COLUMNS) +
+                (('id', STRING), ('relation', STRING), ('confidence_score', FLOAT),
+                 ('supporting_study_results', LIST), ('supporting_publications', LIST), ('_attributes', STRING)))
+COMPRESSION = 'zstd'
+SHARD_PREFIX = 'parquet/'  # the edge shard files are uploaded under this build prefix, apart from the TSV shards
+MERGE_BATCH_SIZE = 100000  # the rows read from each shard at a time, and the rows of each merged row group
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError('Columnar output needs pyarrow; install it with pip install pyarrow') from error
+    return pyarrow
+
+
+def convert_value(value, kind: str):
+    """
+    Convert a KGX column value to its columnar type
+
+    :param value: the value, as written to the TSV file
+    :param kind: STRING, FLOAT or LIST
+    :returns the typed value, or None for an empty string or float
+    """
+    if kind == LIST:
+        return value.split('|') if value else []
+    if value is None or value == '':
+        return None
+    return float(value) if kind == FLOAT else str(value)
+
+
+class ColumnarWriter:
+    """
+    Writes KGX rows to a Parquet file, one row group per call to write_rows
+    """
+
+    def __init__(self, filename: str, columns: tuple[tuple[str, str], ...] = EDGE_COLUMNS,
+                 compression: str = COMPRESSION):
+        self.pyarrow = import_pyarrow()
+        types = {STRING: self.pyarrow.string(), FLOAT: self.pyarrow.float64(),
+                 LIST: self.pyarrow.list_(self.pyarrow.string())}
+        self.columns = columns
+        self.schema = self.pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = self.pyarrow.parquet.ParquetWriter(filename, self.schema, compression=compression)
+        self.row_count = 0
+
+    def write_rows(self, rows: list[list]) -> None:
+        """
+        Write a chunk of rows as one row group
+
+        :param rows: the KGX rows (lists of column values in the order of the TSV file)
+        """
+        if not rows:
+            return
+        arrays = [self.pyarrow.array([convert_value(value, kind) for value in values], type=field.type)
+                  for (_, kind), field, values in zip(self.columns, self.schema, zip(*rows))]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema), row_group_size=len(rows))
+        self.row_count += len(rows)
+
+    def close(self) -> int:
+        """
+        Finish the file
+
+        :returns the number of rows written
+        """
+        self.writer.close()
+        return self.row_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def merge_files(input_filenames: list[str], output_filename: str, batch_size: int = MERGE_BATCH_SIZE) -> dict[str, int]:
+    """
+    Merge shard Parquet files into a single file ordered by assertion id, like merge.merge_edge_files does for the TSV
+    files
+
+    The shards are streamed through a k-way merge one record batch at a time. Exact duplicate rows (e.g. from
+    overlapping shard ranges) are written once, and the rows of each assertion are written in a fixed order so the
+    output does not depend on the order of the inputs.
+
+    :param input_filenames: the shard filenames, each sorted by assertion id and with the same schema
+    :param output_filename: the output filename
+    :param batch_size: the number of rows read from a shard at a time, and the number of rows in each row group
+    :returns counts of the files and rows read, rows written and duplicate rows dropped
+    """
+    pyarrow = import_pyarrow()
+    stats = {'files': len(input_filenames), 'rows_read': 0, 'rows_written': 0, 'duplicates': 0}
+    if not input_filenames:
+        return stats
+    schema = pyarrow.parquet.read_schema(input_filenames[0])
+
+    def keyed(filename: str):
+        for batch in pyarrow.parquet.ParquetFile(filename).iter_batches(batch_size=batch_size):
+            for row in batch.to_pylist():
+                yield row['id'], row
+
+    pending = []
+    with pyarrow.parquet.ParquetWriter(output_filename, schema, compression=COMPRESSION) as writer:
+        merged = heapq.merge(*[keyed(filename) for filename in input_filenames], key=itemgetter(0))
+        for _, group in itertools.groupby(merged, key=itemgetter(0)):
+            rows = {}
+            for _, row in group:
+                stats['rows_read'] += 1
+                rows.setdefault(json.dumps(row), row)
+            pending.extend(rows[key] for key in sorted(rows))
+            if len(pending) >= batch_size:
+                writer.write_table(pyarrow.Table.from_pylist(pending, schema=schema), row_group_size=len(pending))
+                stats['rows_written'] += len(pending)
+                pending = []
+        if pending:
+            writer.write_table(pyarrow.Table.from_pylist(pending, schema=schema), row_group_size=len(pending))
+            stats['rows_written'] += len(pending)
+    stats['duplicates'] = stats['rows_read'] - stats['rows_written']
+    logging.info(f'Merged {stats["files"]} Parquet files: {stats["rows_read"]} rows read, {stats["rows_written"]} '
+                 f'written, {stats["duplicates"]} duplicates dropped')
+    return stats
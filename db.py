@@ -0,0 +1,367 @@
+import logging
+import threading
+import time
+from typing import Union
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 5
+DEFAULT_POOL_RECYCLE = 1800  # seconds; Cloud SQL drops idle connections well after this
+DEFAULT_POOL_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 5
+# MySQL client/server error codes that indicate a dropped connection or a conflict that is safe to retry
+TRANSIENT_MYSQL_ERRORS = {1205, 1213, 2003, 2006, 2013, 2055}
+# the subset of those that mean the server could not be reached, so other endpoints should be used for a while
+DISCONNECT_MYSQL_ERRORS = {2003, 2006, 2013, 2055}
+ROUTING_STRATEGIES = ['round_robin', 'least_outstanding']
+DEFAULT_ROUTING = 'least_outstanding'
+DEFAULT_FAILED_ENDPOINT_DELAY = 30  # seconds before an endpoint whose connection failed is tried again
+
+
+def create_db_engine(url: str, creator=None, pool_size: int = DEFAULT_POOL_SIZE,
+                     max_overflow: int = DEFAULT_MAX_OVERFLOW, pool_recycle: int = DEFAULT_POOL_RECYCLE,
+                     pool_pre_ping: bool = True, pool_timeout: int = DEFAULT_POOL_TIMEOUT, **kwargs) -> Engine:
+    """
+    Create an engine with a connection pool that can be shared by several sessions and threads
+
+    :param url: the database URL
+    :param creator: an optional function returning new DB-API connections (e.g. from the Cloud SQL connector)
+    :param pool_size: the number of connections kept open in the pool
+    :param max_overflow: the number of additional connections allowed when the pool is exhausted
+    :param pool_recycle: the age in seconds after which a pooled connection is replaced
+    :param pool_pre_ping: whether to test each connection when it is checked out of the pool
+    :param pool_timeout: the number of seconds to wait for a connection when the pool is exhausted
+    :returns the engine
+    """
+    if creator is not None:
+        kwargs['creator'] = creator
+    logging.info(f'Creating engine with pool size {pool_size} (+{max_overflow}), recycle {pool_recycle}s, '
+                 f'pre-ping {pool_pre_ping}')
+    return create_engine(url, echo=False, poolclass=QueuePool, pool_size=pool_size, max_overflow=max_overflow,
+                         pool_recycle=pool_recycle, pool_pre_ping=pool_pre_ping, pool_timeout=pool_timeout, **kwargs)
+
+
+def create_session_factory(engine: Engine) -> scoped_session:
+    """
+    Create a session factory that gives each thread its own session, all sharing the engine's connection pool
+
+    :param engine: the engine
+    :returns a thread-local session registry; calling it returns the current thread's session
+    """
+    return scoped_session(sessionmaker(bind=engine))
+
+
+class EndpointRouter:
+    """
+    Chooses an engine for each new transaction from several equivalent database endpoints (e.g. a primary and its read
+    replicas)
+
+    The queries running on each endpoint are counted through engine events. An endpoint that could not be reached is
+    skipped until failed_endpoint_delay seconds have passed or check_health finds it working again; if every endpoint
+    has failed, all of them are tried.
+    """
+
+    def __init__(self, engines: list[Engine], strategy: str = DEFAULT_ROUTING,
+                 failed_endpoint_delay: float = DEFAULT_FAILED_ENDPOINT_DELAY):
+        """
+        :param engines: the engines of the endpoints
+        :param strategy: round_robin to use the endpoints in turn, or least_outstanding to use the endpoint with the
+        fewest running queries (in turn when there is a tie)
+        :param failed_endpoint_delay: the number of seconds an endpoint is skipped after its connection fails
+        :raises ValueError: if there are no engines or the strategy is unknown
+        """
+        if not engines:
+            raise ValueError('At least one database endpoint is needed')
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f'Unknown routing strategy {strategy}, expected one of {ROUTING_STRATEGIES}')
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.failed_endpoint_delay = failed_endpoint_delay
+        self.outstanding = [0] * len(self.engines)
+        self.queries = [0] * len(self.engines)
+        self.failed_at = [None] * len(self.engines)
+        self.running = set()
+        self.next_index = 0
+        self.lock = threading.Lock()
+        for index, engine in enumerate(self.engines):
+            self.listen(index, engine)
+
+    def listen(self, index: int, engine: Engine) -> None:
+        """
+        Count the queries running on an endpoint, and mark it as failed when its connection fails
+
+        :param index: the index of the endpoint's engine
+        :param engine: the engine
+        """
+        def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            with self.lock:
+                self.running.add(id(context) if context is not None else id(cursor))
+                self.outstanding[index] += 1
+                self.queries[index] += 1
+
+        def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            self.finish_query(index, id(context) if context is not None else id(cursor))
+            self.failed_at[index] = None
+
+        def handle_error(context):
+            if context.execution_context is not None or context.cursor is not None:
+                self.finish_query(index, id(context.execution_context) if context.execution_context is not None
+                                  else id(context.cursor))
+            if is_disconnect_error(context.original_exception, context.is_disconnect, context.connection is None):
+                self.mark_failed(index)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(engine, 'handle_error', handle_error)
+
+    def finish_query(self, index: int, key: int) -> None:
+        with self.lock:
+            if key in self.running:
+                self.running.remove(key)
+                self.outstanding[index] -= 1
+
+    def query_failed(self, engine: Engine, key: int, is_disconnect: bool) -> None:
+        """
+        Record the failure of a query that SQLAlchemy did not run, so its handle_error event did not fire (see
+        raise_dbapi_error)
+
+        :param engine: the engine of the endpoint the query ran on
+        :param key: the id of the query's DB-API cursor
+        :param is_disconnect: whether the endpoint could not be reached
+        """
+        if engine not in self.engines:
+            return
+        index = self.engines.index(engine)
+        self.finish_query(index, key)
+        if is_disconnect:
+            self.mark_failed(index)
+
+    def mark_failed(self, index: int) -> None:
+        """
+        Skip an endpoint until failed_endpoint_delay seconds have passed
+
+        :param index: the index of the endpoint's engine
+        """
+        if self.failed_at[index] is None:
+            logging.warning(f'Database endpoint {index} failed, using the other endpoints for '
+                            f'{self.failed_endpoint_delay}s')
+        self.failed_at[index] = time.monotonic()
+
+    def is_available(self, index: int, now: float) -> bool:
+        failed_at = self.failed_at[index]
+        return failed_at is None or now - failed_at >= self.failed_endpoint_delay
+
+    def choose_engine(self) -> Engine:
+        """
+        Choose the engine for a new connection
+
+        :returns the engine
+        """
+        count = len(self.engines)
+        now = time.monotonic()
+
+        def turn(index: int) -> int:  # how many endpoints after the last one chosen
+            return (index - self.next_index) % count
+
+        with self.lock:
+            candidates = [index for index in range(count) if self.is_available(index, now)]
+            if not candidates:
+                candidates = list(range(count))
+            if self.strategy == 'least_outstanding':
+                index = min(candidates, key=lambda index: (self.outstanding[index], turn(index)))
+            else:
+                index = min(candidates, key=turn)
+            self.next_index = (index + 1) % count
+        return self.engines[index]
+
+    def check_health(self) -> list[bool]:
+        """
+        Run a trivial query on every endpoint, marking the ones that fail as failed and the others as working
+
+        :returns whether each endpoint is working
+        """
+        healthy = []
+        for index, engine in enumerate(self.engines):
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text('SELECT 1'))
+                self.failed_at[index] = None
+                healthy.append(True)
+            except DBAPIError as error:
+                logging.warning(f'Database endpoint {index} failed its health check: {error.orig}')
+                self.mark_failed(index)
+                healthy.append(False)
+        return healthy
+
+    def get_stats(self) -> list[dict]:
+        """
+        :returns the number of queries run, queries running and whether it is in use for each endpoint
+        """
+        now = time.monotonic()
+        return [{'queries': self.queries[index], 'outstanding': self.outstanding[index],
+                 'available': self.is_available(index, now)} for index in range(len(self.engines))]
+
+
+class RoutingSession(Session):
+    """
+    A session that gets its engine from an EndpointRouter
+
+    The endpoint is chosen for the first query of a transaction and kept until the transaction ends (commit, rollback
+    or close), so a transaction never spans several endpoints. After a rollback (e.g. by run_with_retry) the next
+    transaction gets a new endpoint, and a failed endpoint is not chosen again.
+    """
+
+    def __init__(self, router: EndpointRouter = None, **kwargs):
+        super().__init__(**kwargs)
+        self.router = router
+        self.routed_engine = None
+        event.listen(self, 'after_transaction_end', self.end_transaction)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.router is None:
+            return super().get_bind(mapper, clause, **kwargs)
+        if self.routed_engine is None:
+            self.routed_engine = self.router.choose_engine()
+        return self.routed_engine
+
+    def end_transaction(self, session, transaction) -> None:
+        if transaction.parent is None:  # not a savepoint or subtransaction
+            self.routed_engine = None
+
+
+def create_routing_session_factory(engines: list[Engine], strategy: str = DEFAULT_ROUTING,
+                                   failed_endpoint_delay: float = DEFAULT_FAILED_ENDPOINT_DELAY) -> scoped_session:
+    """
+    Create a session factory whose sessions route their queries across several equivalent database endpoints
+
+    :param engines: the engines of the endpoints, e.g. from create_db_engine
+    :param strategy: the routing strategy, one of ROUTING_STRATEGIES
+    :param failed_endpoint_delay: the number of seconds an endpoint is skipped after its connection fails
+    :returns a thread-local session registry; the router is the router attribute of its sessions
+    """
+    router = EndpointRouter(engines, strategy, failed_endpoint_delay)
+    healthy = router.check_health()
+    logging.info(f'Routing queries across {len(engines)} database endpoints ({strategy}), '
+                 f'{sum(healthy)} of them healthy')
+    return scoped_session(sessionmaker(class_=RoutingSession, router=router))
+
+
+def compile_query(connection, query, params: dict) -> tuple[str, Union[dict, tuple]]:
+    """
+    Compile a text query for the DB-API cursor of a connection, expanding the list parameters
+
+    :param connection: the SQLAlchemy connection
+    :param query: the text query
+    :param params: the bind parameter values
+    :returns the SQL string and its parameters in the form the driver expects
+    """
+    dialect = connection.dialect
+    compiled = query.bindparams(**params).compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    parameters = compiled.construct_params()
+    if dialect.positional:
+        parameters = tuple(parameters[name] for name in compiled.positiontup)
+    return compiled.string, parameters
+
+
+def execute_cursor(connection, cursor, statement: str, parameters) -> None:
+    """
+    Execute a statement on a DB-API cursor used directly (see targeted.fetch_raw_rows), firing the cursor events of
+    the connection around it like SQLAlchemy does for its own queries, so an EndpointRouter counts it
+
+    :param connection: the SQLAlchemy connection the cursor belongs to
+    :param cursor: the DB-API cursor
+    :param statement: the SQL string
+    :param parameters: its parameters, in the form the driver expects
+    """
+    for listener in connection.dispatch.before_cursor_execute:
+        statement, parameters = listener(connection, cursor, statement, parameters, None, False)
+    cursor.execute(statement, parameters)
+    connection.dispatch.after_cursor_execute(connection, cursor, statement, parameters, None, False)
+
+
+def raise_dbapi_error(connection, error: Exception, statement: str, parameters, cursor,
+                      router: EndpointRouter = None) -> None:
+    """
+    Raise an error of a DB-API cursor used directly (see targeted.fetch_raw_rows) the way SQLAlchemy raises the errors
+    of its own queries: wrapped in a DBAPIError, with the connection invalidated if it was lost. This way
+    run_with_retry retries it like any other query error.
+
+    :param connection: the SQLAlchemy connection the cursor belongs to
+    :param error: the DB-API exception
+    :param statement: the SQL string the cursor ran
+    :param parameters: its parameters
+    :param cursor: the DB-API cursor
+    :param router: the router of the session, if any, which is told about the failure
+    :raises DBAPIError: always
+    """
+    dialect = connection.dialect
+    is_disconnect = dialect.is_disconnect(error, connection.connection, cursor) or is_disconnect_error(error)
+    wrapped = DBAPIError.instance(statement, parameters, error, dialect.dbapi.Error,
+                                  connection_invalidated=is_disconnect, dialect=dialect)
+    if router is not None:
+        router.query_failed(connection.engine, id(cursor), is_disconnect)
+    if is_disconnect:
+        try:  # the cursor of a lost connection may not close cleanly
+            cursor.close()
+        except dialect.dbapi.Error:
+            pass
+        connection.invalidate(error)
+    raise wrapped from error
+
+
+def is_disconnect_error(error: Exception, is_disconnect: bool = False, connecting: bool = False) -> bool:
+    """
+    Determine whether a database error means the endpoint could not be reached
+
+    :param error: the DB-API exception
+    :param is_disconnect: whether SQLAlchemy found the connection to be lost
+    :param connecting: whether the error happened while connecting
+    :returns true if other endpoints should be used instead
+    """
+    if is_disconnect or connecting:
+        return True
+    args = getattr(error, 'args', ())
+    return len(args) > 0 and args[0] in DISCONNECT_MYSQL_ERRORS
+
+
+def is_transient_error(error: DBAPIError) -> bool:
+    """
+    Determine whether a database error is worth retrying (lost connection, deadlock, lock wait timeout)
+
+    :param error: the SQLAlchemy DBAPIError
+    :returns true if the operation can be retried
+    """
+    if error.connection_invalidated:
+        return True
+    args = getattr(error.orig, 'args', ())
+    return len(args) > 0 and args[0] in TRANSIENT_MYSQL_ERRORS
+
+
+def run_with_retry(session, operation, retries: int = DEFAULT_RETRIES, delay: float = DEFAULT_RETRY_DELAY):
+    """
+    Run a database operation, rolling back and retrying it if it fails with a transient error
+
+    :param session: the session used by the operation
+    :param operation: a function with no arguments that performs the whole operation (e.g. fetching one chunk)
+    :param retries: the maximum number of retries
+    :param delay: the number of seconds to wait before the first retry (doubled for each retry after that)
+    :returns the result of the operation
+    """
+    attempt = 0
+    while True:
+        try:
+            return operation()
+        except DBAPIError as error:
+            if attempt >= retries or not is_transient_error(error):
+                raise
+            wait = delay * (2 ** attempt)
+            attempt += 1
+            logging.warning(f'Transient database error, retrying ({attempt}/{retries}) in {wait}s: {error.orig}')
+            session.rollback()
+            time.sleep(wait)
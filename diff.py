@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+import tempfile
+from typing import Iterator
+
+import merge
+
+RUN_BYTES = 64 * 1024 * 1024  # the amount of edge text sorted in memory at a time
+RUN_COMPRESS_LEVEL = 1
+ID_COLUMN = 13
+# predicate, qualified predicate and the qualifiers; together with the id they identify an edge
+KEY_COLUMNS = (1,) + tuple(range(3, 13))
+SEPARATOR = '\x00'  # separates the key, hash and line in sorted run files; never appears in a KGX line
+
+
+def get_edge_key(line: str) -> str:
+    """
+    Get the identity of an edge line: its assertion id, predicate and qualifiers
+
+    :param line: the KGX edge line
+    :returns the key, which sorts in assertion id order
+    """
+    columns = line.split('\t', ID_COLUMN + 1)
+    return '\t'.join([columns[ID_COLUMN]] + [columns[column] for column in KEY_COLUMNS])
+
+
+def get_line_hash(line: str) -> str:
+    return hashlib.blake2b(line.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def write_run(records: list[tuple[str, str, str]], directory: str, run_number: int) -> str:
+    records.sort()
+    filename = os.path.join(directory, f'run_{run_number}.gz')
+    with gzip.open(filename, 'wt', compresslevel=RUN_COMPRESS_LEVEL, encoding='utf-8') as outfile:
+        for record in records:
+            outfile.write(SEPARATOR.join(record))
+    return filename
+
+
+def read_run(filename: str) -> Iterator[tuple[str, str, str]]:
+    with gzip.open(filename, 'rt', encoding='utf-8') as infile:
+        for line in infile:
+            key, line_hash, edge_line = line.split(SEPARATOR, 2)
+            yield key, line_hash, edge_line
+
+
+def sort_edges(edges_filename: str, directory: str, run_bytes: int = RUN_BYTES) -> Iterator[tuple[str, str, str]]:
+    """
+    Sort the lines of an edges file by edge key in bounded memory
+
+    Lines are read until run_bytes of text are held, sorted, and written to a compressed run file in directory; the
+    runs are then merged lazily.
+
+    :param edges_filename: the edges filename (plain or gzip)
+    :param directory: the directory for the run files
+    :param run_bytes: the amount of edge text to sort in memory at a time
+    :returns an iterator of (key, line hash, line) tuples in key order
+    """
+    run_filenames = []
+    records = []
+    held = 0
+    with merge.open_edge_file(edges_filename) as infile:
+        for line in infile:
+            if not line.strip():
+                continue
+            if not line.endswith('\n'):
+                line += '\n'
+            records.append((get_edge_key(line), get_line_hash(line), line))
+            held += len(line)
+            if held >= run_bytes:
+                run_filenames.append(write_run(records, directory, len(run_filenames)))
+                records = []
+                held = 0
+    if records or not run_filenames:
+        run_filenames.append(write_run(records, directory, len(run_filenames)))
+    logging.info(f'Sorted {edges_filename} into {len(run_filenames)} runs')
+    return heapq.merge(*[read_run(filename) for filename in run_filenames])
+
+
+def diff_edge_files(old_filename: str, new_filename: str, output_prefix: str,
+                    run_bytes: int = RUN_BYTES) -> dict[str, int]:
+    """
+    Compare two edge exports and write the edges that were added, removed and changed
+
+    Both files are externally sorted on (assertion id, predicate, qualifiers), so memory use is bounded by run_bytes
+    regardless of the file sizes. Edges are compared by a hash of their whole line.
+
+    :param old_filename: the previous edges file (plain or gzip)
+    :param new_filename: the new edges file (plain or gzip)
+    :param output_prefix: the prefix of the output files: {prefix}added.tsv.gz, {prefix}removed.tsv.gz,
+    {prefix}changed.tsv.gz (the new versions of changed edges) and {prefix}diff.json
+    :param run_bytes: the amount of edge text to sort in memory at a time
+    :returns the number of unchanged, added, removed and changed edges
+    """
+    counts = {'unchanged': 0, 'added': 0, 'removed': 0, 'changed': 0}
+    outputs = dict((kind, gzip.open(f'{output_prefix}{kind}.tsv.gz', 'wt', compresslevel=merge.COMPRESS_LEVEL,
+                                    encoding='utf-8')) for kind in ['added', 'removed', 'changed'])
+    with tempfile.TemporaryDirectory(dir='.') as directory:
+        old_directory = os.path.join(directory, 'old')
+        new_directory = os.path.join(directory, 'new')
+        os.mkdir(old_directory)
+        os.mkdir(new_directory)
+        old_edges = sort_edges(old_filename, old_directory, run_bytes)
+        new_edges = sort_edges(new_filename, new_directory, run_bytes)
+        old_edge = next(old_edges, None)
+        new_edge = next(new_edges, None)
+        while old_edge is not None or new_edge is not None:
+            if new_edge is None or (old_edge is not None and old_edge[0] < new_edge[0]):
+                outputs['removed'].write(old_edge[2])
+                counts['removed'] += 1
+                old_edge = next(old_edges, None)
+            elif old_edge is None or new_edge[0] < old_edge[0]:
+                outputs['added'].write(new_edge[2])
+                counts['added'] += 1
+                new_edge = next(new_edges, None)
+            else:
+                if old_edge[1] == new_edge[1]:
+                    counts['unchanged'] += 1
+                else:
+                    outputs['changed'].write(new_edge[2])
+                    counts['changed'] += 1
+                old_edge = next(old_edges, None)
+                new_edge = next(new_edges, None)
+    for output in outputs.values():
+        output.close()
+    with open(f'{output_prefix}diff.json', 'w') as outfile:
+        outfile.write(json.dumps(counts))
+    logging.info(f'Edge diff: {counts}')
+    return counts
@@ -0,0 +1,170 @@
+"""
+Random access to a published edges.tsv.gz by assertion id.
+
+The edges file is written as a series of independent gzip members (blocks) that each start at an assertion boundary,
+so it is still an ordinary gzip file. A sidecar index holds the first assertion id and byte offset of every block.
+Reading one assertion or a range of assertions only decompresses the blocks that can contain them.
+
+Usage: python edge_index.py edges.tsv.gz ASSERTION_ID [LAST_ASSERTION_ID] [-i INDEX]
+"""
+import argparse
+import bisect
+import sys
+import zlib
+from typing import Iterator
+
+BLOCK_SIZE = 1024 * 1024  # uncompressed bytes per block; larger blocks compress better but make lookups slower
+ID_COLUMN = 13
+READ_SIZE = 64 * 1024
+
+
+class BlockGzipWriter:
+    """
+    Writes edge lines as gzip members of about block_size uncompressed bytes, never splitting an assertion
+    """
+
+    def __init__(self, filename: str, block_size: int = BLOCK_SIZE, compresslevel: int = 6):
+        self.outfile = open(filename, 'wb')
+        self.block_size = block_size
+        self.compresslevel = compresslevel
+        self.compressor = None
+        self.block_bytes = 0
+        self.blocks = []
+
+    def write_assertion(self, assertion_id: str, lines: list[str]) -> None:
+        """
+        Write all of the edge lines of one assertion
+
+        :param assertion_id: the assertion id (assertions must be written in sorted order)
+        :param lines: the edge lines, each ending in a newline
+        """
+        if self.compressor is None or self.block_bytes >= self.block_size:
+            self.end_block()
+            self.blocks.append((assertion_id, self.outfile.tell()))
+            self.compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)  # 31: gzip header and trailer
+            self.block_bytes = 0
+        data = ''.join(lines).encode('utf-8')
+        self.outfile.write(self.compressor.compress(data))
+        self.block_bytes += len(data)
+
+    def end_block(self) -> None:
+        if self.compressor is not None:
+            self.outfile.write(self.compressor.flush())
+            self.compressor = None
+
+    def close(self) -> list[tuple[str, int]]:
+        """
+        Finish the last block and close the file
+
+        :returns the (first assertion id, byte offset) of every block
+        """
+        self.end_block()
+        self.outfile.close()
+        return self.blocks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_index(index_filename: str, blocks: list[tuple[str, int]]) -> None:
+    """
+    Write the block index of an edges file
+
+    :param index_filename: the index filename
+    :param blocks: the (first assertion id, byte offset) of every block, from BlockGzipWriter.close
+    """
+    with open(index_filename, 'w') as outfile:
+        for assertion_id, offset in blocks:
+            outfile.write(f'{assertion_id}\t{offset}\n')
+
+
+def read_index(index_filename: str) -> tuple[list[str], list[int]]:
+    """
+    Read the block index of an edges file
+
+    :param index_filename: the index filename
+    :returns the first assertion id of each block and the byte offset of each block, in file order
+    """
+    assertion_ids = []
+    offsets = []
+    with open(index_filename, 'r') as infile:
+        for line in infile:
+            assertion_id, offset = line.rstrip('\n').split('\t')
+            assertion_ids.append(assertion_id)
+            offsets.append(int(offset))
+    return assertion_ids, offsets
+
+
+def read_block(infile, offset: int) -> Iterator[str]:
+    """
+    Decompress the single gzip member that starts at an offset
+
+    :param infile: the edges file, opened in binary mode
+    :param offset: the byte offset of the block
+    :returns an iterator of the lines in the block
+    """
+    infile.seek(offset)
+    decompressor = zlib.decompressobj(31)
+    data = []
+    while not decompressor.eof:
+        compressed = infile.read(READ_SIZE)
+        if not compressed:
+            break
+        data.append(decompressor.decompress(compressed))
+    return iter(b''.join(data).decode('utf-8').splitlines(keepends=True))
+
+
+def get_assertion_id(line: str) -> str:
+    return line.split('\t', ID_COLUMN + 1)[ID_COLUMN]
+
+
+def lookup_range(edges_filename: str, first_id: str, last_id: str, index: tuple[list[str], list[int]] = None) \
+        -> Iterator[str]:
+    """
+    Read the edge lines of every assertion id between two ids (inclusive)
+
+    :param edges_filename: the block gzip edges filename
+    :param first_id: the first assertion id of the range
+    :param last_id: the last assertion id of the range
+    :param index: the index from read_index (read from edges_filename + '.index' if not given)
+    :returns an iterator of the matching edge lines in file order
+    """
+    assertion_ids, offsets = index if index else read_index(edges_filename + '.index')
+    # the last block starting at or before first_id is the only one before the range that can hold part of it
+    start = max(bisect.bisect_right(assertion_ids, first_id) - 1, 0)
+    end = bisect.bisect_right(assertion_ids, last_id)
+    with open(edges_filename, 'rb') as infile:
+        for block in range(start, end):
+            for line in read_block(infile, offsets[block]):
+                assertion_id = get_assertion_id(line)
+                if assertion_id > last_id:
+                    return
+                if assertion_id >= first_id:
+                    yield line
+
+
+def lookup(edges_filename: str, assertion_id: str, index: tuple[list[str], list[int]] = None) -> list[str]:
+    """
+    Read the edge lines of one assertion
+
+    :param edges_filename: the block gzip edges filename
+    :param assertion_id: the assertion id
+    :param index: the index from read_index (read from edges_filename + '.index' if not given)
+    :returns the edge lines of the assertion (empty if it is not in the file)
+    """
+    return list(lookup_range(edges_filename, assertion_id, assertion_id, index))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('edges', help='the block gzip edges file')
+    parser.add_argument('first_id', help='the assertion id to look up')
+    parser.add_argument('last_id', nargs='?', help='look up every assertion id from first_id to this one')
+    parser.add_argument('-i', '--index', help='the index file (default: the edges file name + .index)')
+    args = parser.parse_args()
+    index = read_index(args.index) if args.index else None
+    for edge_line in lookup_range(args.edges, args.first_id, args.last_id if args.last_id else args.first_id, index):
+        sys.stdout.write(edge_line)
@@ -1,71 +1,419 @@
+import contextlib
 import gzip
+import importlib
+import json
 import logging
 import os
+from typing import Union
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import argparse
-import targeted
 import services
 
-import pymysql.connections
-from google.cloud.sql.connector import Connector
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
+# The database targets are the only ones that need SQLAlchemy and the Cloud SQL connector. Everything else is imported
+# lazily so that the file-only targets start quickly; see benchmarks/startup.py.
 GCP_BLOB_PREFIX = 'data/kgx-export/'
+BUILD_BLOB_PREFIX = 'data/kgx-build/'
+FILE_TARGETS = ['metadata', 'operations', 'merge', 'validate', 'diff']
+DATABASE_TARGETS = ['nodes', 'edges', 'count', 'supersede', 'worker', 'snapshot']
+READ_ONLY_TARGETS = ['nodes', 'edges', 'count', 'worker', 'snapshot']  # can be routed to read replicas
+SNAPSHOT_BLOB = BUILD_BLOB_PREFIX + 'snapshot.db.gz'
+PREVIOUS_EDGES_BLOB = 'kgx/UniProt/edges.tsv.gz'  # where publish_files copies the last release
+FRAGMENT_CACHE_PREFIX = 'data/kgx-fragments/'  # kept between runs, unlike the build files
+DATABASE_MODULES = ('pymysql', 'google.cloud.sql.connector', 'db', 'targeted')
+SNAPSHOT_MODULES = ('db', 'targeted', 'snapshot')  # reading a local snapshot never connects to Cloud SQL
+SNAPSHOT_TARGETS = ['edges', 'worker']  # the targets that can read a snapshot instead of the database
 
 def export_metadata(bucket):
     """
     Generate a metadata file from previously created KGX export files
 
+    If the edge shards uploaded partial edge metadata files, those are merged instead of reading the full edges file.
+
     :param bucket: the GCP storage bucket containing the KGX files
     """
-    services.get_from_gcp(bucket, GCP_BLOB_PREFIX + 'edges.tsv.gz', 'edges.tsv.gz')
     services.get_from_gcp(bucket, GCP_BLOB_PREFIX + 'nodes.tsv.gz', 'nodes.tsv.gz')
-    services.generate_metadata('edges.tsv.gz', 'nodes.tsv.gz', 'KGE')
+    partial_blobs = services.list_gcp_blobs(bucket, BUILD_BLOB_PREFIX + 'edge_metadata_')
+    if partial_blobs:
+        filenames = []
+        for blob_name in partial_blobs:
+            filename = blob_name.split('/')[-1]
+            services.get_from_gcp(bucket, blob_name, filename)
+            filenames.append(filename)
+        services.generate_metadata_from_partials(filenames, 'nodes.tsv.gz', 'KGE')
+    else:
+        services.get_from_gcp(bucket, GCP_BLOB_PREFIX + 'edges.tsv.gz', 'edges.tsv.gz')
+        services.generate_metadata('edges.tsv.gz', 'nodes.tsv.gz', 'KGE')
     services.upload_to_gcp(bucket, 'KGE/content_metadata.json', GCP_BLOB_PREFIX + 'content_metadata.json')
 
 
-def get_valid_nodes(bucket) -> set[str]:
+def export_operations(bucket):
+    """
+    Combine the partial BTE operations files written by each edge shard into a single operations.json file
+
+    :param bucket: the GCP storage bucket containing the partial operations files
+    """
+    filenames = []
+    for blob_name in services.list_gcp_blobs(bucket, BUILD_BLOB_PREFIX + 'operations_'):
+        filename = blob_name.split('/')[-1]
+        services.get_from_gcp(bucket, blob_name, filename)
+        filenames.append(filename)
+    logging.info(f'Merging {len(filenames)} partial operations files')
+    services.merge_operations_files(filenames, 'operations.json')
+    services.upload_to_gcp(bucket, 'operations.json', GCP_BLOB_PREFIX + 'operations.json')
+
+
+def download_shard_files(bucket, blob_prefix: str) -> list[str]:
+    """
+    Download the shard files whose blob names start with a prefix to the working directory
+
+    :param bucket: the GCP storage bucket containing the shard files
+    :param blob_prefix: the blob name prefix, e.g. BUILD_BLOB_PREFIX + 'edges_'
+    :returns the local filenames
+    """
+    filenames = []
+    for blob_name in services.list_gcp_blobs(bucket, blob_prefix):
+        filename = blob_name.split('/')[-1]
+        services.get_from_gcp(bucket, blob_name, filename)
+        filenames.append(filename)
+    return filenames
+
+
+def export_merged_edges(bucket):
+    """
+    Merge the edge files written by each shard into the final compressed edges file and its assertion id index, and
+    the JSON Lines and Parquet edge files into edges.jsonl.gz and edges.parquet if the shards wrote them
+
+    :param bucket: the GCP storage bucket containing the shard edge files
+    """
+    import columnar
+    import jsonl
+    import merge
+
+    filenames = download_shard_files(bucket, BUILD_BLOB_PREFIX + 'edges_')
+    merge.merge_edge_files(filenames, 'edges.tsv.gz', index_filename='edges.tsv.gz.index')
+    services.upload_to_gcp(bucket, 'edges.tsv.gz', GCP_BLOB_PREFIX + 'edges.tsv.gz')
+    services.upload_to_gcp(bucket, 'edges.tsv.gz.index', GCP_BLOB_PREFIX + 'edges.tsv.gz.index')
+    jsonl_filenames = download_shard_files(bucket, BUILD_BLOB_PREFIX + jsonl.SHARD_PREFIX + 'edges_')
+    if jsonl_filenames:  # the shards were exported with --jsonl
+        merge.merge_edge_files(jsonl_filenames, 'edges.jsonl.gz', get_id=jsonl.get_line_id)
+        services.upload_to_gcp(bucket, 'edges.jsonl.gz', GCP_BLOB_PREFIX + 'edges.jsonl.gz')
+    parquet_filenames = download_shard_files(bucket, BUILD_BLOB_PREFIX + columnar.SHARD_PREFIX + 'edges_')
+    if parquet_filenames:  # the shards were exported with --columnar
+        columnar.merge_files(parquet_filenames, 'edges.parquet')
+        services.upload_to_gcp(bucket, 'edges.parquet', GCP_BLOB_PREFIX + 'edges.parquet')
+
+
+def validate_export(bucket, workers: int = 1):
+    """
+    Validate the nodes file and merged edges file, and upload the validation report
+
+    :param bucket: the GCP storage bucket containing the KGX files
+    :param workers: the number of processes validating edges
+    :raises RuntimeError: if the files are not valid
+    """
+    import validate
+
+    services.get_from_gcp(bucket, GCP_BLOB_PREFIX + 'nodes.tsv.gz', 'nodes.tsv.gz')
+    services.get_from_gcp(bucket, GCP_BLOB_PREFIX + 'edges.tsv.gz', 'edges.tsv.gz')
+    index_blob = GCP_BLOB_PREFIX + 'edges.tsv.gz.index'
+    if index_blob in services.list_gcp_blobs(bucket, index_blob):  # without it the main process reads the edges
+        services.get_from_gcp(bucket, index_blob, 'edges.tsv.gz.index')
+    report = validate.validate_files('nodes.tsv.gz', 'edges.tsv.gz', workers=workers)
+    with open('validation.json', 'w') as outfile:
+        outfile.write(json.dumps(report))
+    services.upload_to_gcp(bucket, 'validation.json', BUILD_BLOB_PREFIX + 'validation.json')
+    if not validate.is_valid(report):
+        raise RuntimeError(f'The export is not valid: {report["errors"]}')
+
+
+def export_edge_diff(bucket, previous_bucket, previous_blob):
+    """
+    Compare the merged edges file with the previous release and upload the added, removed and changed edges
+
+    If there is no previous release, every edge is reported as added.
+
+    :param bucket: the GCP storage bucket containing the merged edges file
+    :param previous_bucket: the GCP storage bucket containing the previous release
+    :param previous_blob: the blob name of the previous edges file
+    """
+    import diff
+
+    services.get_from_gcp(bucket, GCP_BLOB_PREFIX + 'edges.tsv.gz', 'edges.tsv.gz')
+    if previous_blob in services.list_gcp_blobs(previous_bucket, previous_blob):
+        services.get_from_gcp(previous_bucket, previous_blob, 'previous_edges.tsv.gz')
+    else:
+        logging.warning(f'No previous edges file at {previous_bucket}/{previous_blob}')
+        with gzip.open('previous_edges.tsv.gz', 'wt'):
+            pass
+    diff.diff_edge_files('previous_edges.tsv.gz', 'edges.tsv.gz', 'edges_')
+    for kind in ['added', 'removed', 'changed']:
+        services.upload_to_gcp(bucket, f'edges_{kind}.tsv.gz', GCP_BLOB_PREFIX + f'edges_{kind}.tsv.gz')
+    services.upload_to_gcp(bucket, 'edges_diff.json', GCP_BLOB_PREFIX + 'edges_diff.json')
+
+
+def export_snapshot(session_maker, bucket, filename, retries):  # pragma: no cover
     """
-    Retrieve the set of nodes used by a KGX nodes file
+    Dump the tables read by the edge export into a local snapshot and upload it
+
+    :param session_maker: the thread-local session registry returned by init_db
+    :param bucket: the GCP storage bucket for the snapshot
+    :param filename: the local snapshot filename
+    :param retries: the number of times a page is retried after a transient database error
+    """
+    import snapshot
+
+    snapshot.create_snapshot(session_maker(), filename, retries=retries)
+    services.upload_to_gcp(bucket, snapshot.compress_snapshot(filename), SNAPSHOT_BLOB)
+
+
+def get_snapshot(bucket, filename) -> str:  # pragma: no cover
+    """
+    Make sure a snapshot is available locally, downloading the latest one from the bucket unless a complete local copy
+    exists (a partly downloaded or decompressed file is downloaded again)
+
+    :param bucket: the GCP storage bucket containing the snapshot
+    :param filename: the local snapshot filename
+    :returns the local snapshot filename
+    """
+    import snapshot
+
+    if not snapshot.is_complete(filename):
+        services.get_from_gcp(bucket, SNAPSHOT_BLOB, f'{filename}.gz')
+        snapshot.decompress_snapshot(f'{filename}.gz', filename)
+        os.remove(f'{filename}.gz')
+    return filename
+
+
+def get_valid_nodes(bucket) -> dict[str, str]:
+    """
+    Retrieve the nodes used by a KGX nodes file
 
     :param bucket: the GCP storage bucket containing the KGX file
-    :returns a set of node curies
+    :returns a dictionary of node curies to their categories
     """
     services.get_from_gcp(bucket, GCP_BLOB_PREFIX + 'nodes.tsv.gz', 'nodes.tsv.gz')
-    node_set = set([])
+    node_dict = {}
     with gzip.open('nodes.tsv.gz', 'rb') as infile:
         for line in infile:
-            node_set.add(line.split(b'\t')[0].decode('utf-8'))
-    return node_set
+            columns = line.rstrip(b'\n').split(b'\t')
+            node_dict[columns[0].decode('utf-8')] = columns[2].decode('utf-8') if len(columns) > 2 else ''
+    return node_dict
+
+
+@contextlib.contextmanager
+def profiled(mode: str, name: str, bucket: str):
+    """
+    Run the body of a with block under the profiler and upload the profile files next to the edge shard files
+
+    :param mode: the profiling.PROFILE_MODES mode, or None to run without profiling
+    :param name: the profile name, used for the file names
+    :param bucket: the GCP storage bucket for the profile files
+    """
+    if not mode:
+        yield
+        return
+    import profiling
+
+    profiler = profiling.Profiler(mode, f'profile_{name}')
+    try:
+        with profiler:
+            yield
+    finally:
+        for filename in profiler.filenames:
+            services.upload_to_gcp(bucket, filename, BUILD_BLOB_PREFIX + filename, delete_source_file=True)
+
+
+@contextlib.contextmanager
+def query_logged(enabled: bool, name: str, bucket: str):
+    """
+    Record the queries run in the body of a with block and upload the query log next to the edge shard files
+
+    :param enabled: whether to record the queries
+    :param name: the log name, used for the file name
+    :param bucket: the GCP storage bucket for the query log
+    :returns the querylog.QueryRecorder to pass to the queries, or None if not enabled
+    """
+    if not enabled:
+        yield None
+        return
+    import querylog
+
+    filename = f'queries_{name}.jsonl'
+    try:
+        with querylog.QueryRecorder(filename) as recorder:
+            yield recorder
+    finally:
+        services.upload_to_gcp(bucket, filename, BUILD_BLOB_PREFIX + filename, delete_source_file=True)
+
+
+@contextlib.contextmanager
+def fragment_cached(enabled: bool, name: str, bucket: str):
+    """
+    Use the evidence JSON fragment cache of an edge shard in the body of a with block
+
+    The cache of the shard is downloaded from the previous run if there is one. It is uploaded again only if the body
+    completes, since the fragments of the evidence that was not reached would otherwise be pruned.
+
+    :param enabled: whether to use the cache
+    :param name: the shard name, used for the file name
+    :param bucket: the GCP storage bucket for the cache files
+    :returns the fragments.FragmentCache to pass to the export, or None if not enabled
+    """
+    if not enabled:
+        yield None
+        return
+    import fragments
+
+    filename = f'fragments_{name}.db'
+    blob_name = FRAGMENT_CACHE_PREFIX + filename
+    if blob_name in services.list_gcp_blobs(bucket, blob_name):
+        services.get_from_gcp(bucket, blob_name, filename)
+    with fragments.FragmentCache(filename) as cache:
+        yield cache
+    services.upload_to_gcp(bucket, filename, blob_name, delete_source_file=True)
+
+
+def read_manifest(filename: str) -> list[tuple[int, int]]:
+    """
+    Read the shard ranges for a worker from a manifest file
+
+    Each non-empty line holds an assertion offset and an assertion limit separated by whitespace. Lines starting
+    with '#' are ignored.
+
+    :param filename: the manifest filename
+    :returns a list of (assertion offset, assertion limit) tuples in file order
+    """
+    shards = []
+    with open(filename, 'r') as infile:
+        for line_number, line in enumerate(infile, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            columns = line.split()
+            if len(columns) != 2:
+                raise ValueError(f'{filename}:{line_number}: expected an assertion offset and limit, got "{line}"')
+            shards.append((int(columns[0]), int(columns[1])))
+    return shards
+
+
+def export_edge_shards(session_maker, nodes: dict, bucket: str, shards: list[tuple[int, int]], workers: int = 1,
+                       profile: str = None, query_log: bool = False, fragment_cache: bool = False,
+                       **kwargs) -> list[tuple[int, int]]:
+    """
+    Export several edge shards from one process, reusing the connection pool and the valid node dictionary
+
+    Each shard is exported by a thread with its own session from the scoped session registry. A failed shard is
+    logged and does not stop the remaining shards.
+
+    :param session_maker: the thread-local session registry returned by init_db
+    :param nodes: a dictionary of the curies that appear in the nodes KGX file to their categories
+    :param bucket: the output GCP bucket name
+    :param shards: a list of (assertion offset, assertion limit) tuples
+    :param workers: the number of shards to export concurrently
+    :param profile: the profiling mode for each shard, or None to run without profiling
+    :param query_log: whether to write a query log for each shard
+    :param fragment_cache: whether to use the evidence JSON fragment cache of each shard
+    :param kwargs: additional keyword arguments passed to targeted.export_edges (chunk_size, edge_limit, etc.)
+    :returns the shards that failed
+    """
+    import targeted
 
+    def export_shard(shard: tuple[int, int]) -> None:
+        assertion_start, assertion_limit = shard
+        logging.info(f'Exporting shard {assertion_start}-{assertion_start + assertion_limit}')
+        try:
+            name = f'edges_{assertion_start}_{assertion_start + assertion_limit}'
+            with profiled(profile, name, bucket), query_logged(query_log, name, bucket) as query_recorder, \
+                    fragment_cached(fragment_cache, name, bucket) as cache:
+                targeted.export_edges(session_maker(), nodes, bucket, BUILD_BLOB_PREFIX,
+                                      assertion_start=assertion_start, assertion_limit=assertion_limit,
+                                      query_recorder=query_recorder, fragment_cache=cache, **kwargs)
+        finally:
+            session_maker.remove()  # return the connection to the pool between shards
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {executor.submit(export_shard, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            shard = futures[future]
+            if future.exception() is not None:
+                logging.error(f'Shard {shard[0]}-{shard[0] + shard[1]} failed', exc_info=future.exception())
+                failed.append(shard)
+    logging.info(f'Exported {len(shards) - len(failed)} of {len(shards)} shards')
+    return sorted(failed)
+
+
+def load_target_modules(target: str, from_snapshot: bool = False) -> None:
+    """
+    Import the modules needed by an export target
+
+    :param target: the export target
+    :param from_snapshot: whether the target reads a local snapshot instead of the database
+    """
+    if target in DATABASE_TARGETS:
+        for module_name in SNAPSHOT_MODULES if from_snapshot else DATABASE_MODULES:
+            importlib.import_module(module_name)
+
+
+def init_db(instance: Union[str, list[str]], user: str, password: str, database: str, pool_size: int = None,
+            pool_recycle: int = None, pool_pre_ping: bool = True, routing: str = None):  # pragma: no cover
+    """
+    Create a pooled connection to the Cloud SQL database
+
+    :param instance: the Cloud SQL instance connection name, or a list of equivalent instances (e.g. the primary and
+    its read replicas) that the queries are routed across
+    :param user: the database username
+    :param password: the database password
+    :param database: the database name
+    :param pool_size: the number of connections kept open in the pool
+    :param pool_recycle: the age in seconds after which a pooled connection is replaced
+    :param pool_pre_ping: whether to test connections when they are checked out of the pool
+    :param routing: how queries are routed across several instances, one of db.ROUTING_STRATEGIES
+    :returns a thread-local session registry; each thread that calls it gets its own session on the shared pool
+    (a pool per instance)
+    """
+    import pymysql.connections
+    from google.cloud.sql.connector import Connector
+    import db
 
-def init_db(instance: str, user: str, password: str, database: str) -> sessionmaker:  # pragma: no cover
     connector = Connector()
 
-    def get_conn() -> pymysql.connections.Connection:
-        conn: pymysql.connections.Connection = connector.connect(
-            instance_connection_string=instance,
-            driver='pymysql',
-            user=user,
-            password=password,
-            database=database
-        )
-        return conn
+    def create_engine(instance_name: str):
+        def get_conn() -> pymysql.connections.Connection:
+            conn: pymysql.connections.Connection = connector.connect(
+                instance_connection_string=instance_name,
+                driver='pymysql',
+                user=user,
+                password=password,
+                database=database
+            )
+            return conn
 
-    engine = create_engine('mysql+pymysql://', creator=get_conn, echo=False)
-    maker = sessionmaker()
-    maker.configure(bind=engine)
-    return maker
+        return db.create_db_engine('mysql+pymysql://', creator=get_conn,
+                                   pool_size=pool_size if pool_size else db.DEFAULT_POOL_SIZE,
+                                   pool_recycle=pool_recycle if pool_recycle else db.DEFAULT_POOL_RECYCLE,
+                                   pool_pre_ping=pool_pre_ping)
 
+    engines = [create_engine(name) for name in ([instance] if isinstance(instance, str) else instance)]
+    if len(engines) == 1:
+        return db.create_session_factory(engines[0])
+    return db.create_routing_session_factory(engines, routing if routing else db.DEFAULT_ROUTING)
 
-if __name__ == "__main__":
-    logging.basicConfig(format='%(asctime)s %(module)s:%(funcName)s:%(levelname)s: %(message)s', level=logging.INFO)
-    logging.info('Starting Main')
+
+def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
-    parser.add_argument('-t', '--target', help='the export target: edges, nodes, or metadata', required=True)
+    parser.add_argument('-t', '--target',
+                        help='the export target: edges, nodes, metadata, operations, merge, validate, diff, '
+                             'supersede, worker, or snapshot',
+                        required=True, choices=FILE_TARGETS + DATABASE_TARGETS)
     parser.add_argument('-b', '--bucket', help='storage bucket for data', required=True)
     parser.add_argument('-i', '--instance', help='GCP DB instance name')
+    parser.add_argument('--replicas', help='comma separated read replica instance names that the queries of read-only '
+                                           'targets are routed across with the instance (default: '
+                                           'MYSQL_DATABASE_REPLICAS)')
+    parser.add_argument('--routing', help='how queries are routed across the instance and its replicas',
+                        choices=['round_robin', 'least_outstanding'])
     parser.add_argument('-d', '--database', help='database name')
     parser.add_argument('-u', '--user', help='database username')
     parser.add_argument('-p', '--password', help='database password')
@@ -73,33 +421,156 @@ if __name__ == "__main__":
     parser.add_argument('-l', '--limit', help='maximum number of publications to export per edge', default=5, type=int)
     parser.add_argument('-ao', '--assertion_offset', help='number of assertions to skip past', default=0, type=int)
     parser.add_argument('-al', '--assertion_limit', help='number of assertions to output', default=10000, type=int)
+    parser.add_argument('-bs', '--batch_size', help='number of evidence records to update at a time (supersede target)',
+                        type=int)
+    parser.add_argument('--start_after', help='only update PubMed evidence with a greater evidence_id, to resume an '
+                                              'interrupted run (supersede target)')
+    parser.add_argument('-rf', '--raw_fetch', help='fetch edge rows through the DB-API cursor', action='store_true')
+    parser.add_argument('-k', '--top_k', help='how the top evidence records of each assertion are selected',
+                        choices=['lateral', 'window', 'heap'])
+    parser.add_argument('--pool_size', help='number of pooled database connections', type=int)
+    parser.add_argument('--pool_recycle', help='seconds after which a pooled connection is replaced', type=int)
+    parser.add_argument('--retries', help='number of retries for a chunk after a transient database error', type=int)
+    parser.add_argument('--adaptive', help='adapt the chunk size to the memory budget and target query time (implied '
+                                           'by --memory_budget and --target_seconds)', action='store_true')
+    parser.add_argument('--memory_budget', help='memory budget in MiB for the adaptive chunk size',
+                        type=int)
+    parser.add_argument('--target_seconds', help='target query time per chunk for the adaptive chunk size', type=float)
+    parser.add_argument('-s', '--snapshot', help='local snapshot file to create (snapshot target) or to read edges from '
+                                                 'instead of the database (edges and worker targets)')
+    parser.add_argument('-m', '--manifest', help='file of assertion offset and limit pairs to export (worker target)')
+    parser.add_argument('-w', '--workers', help='number of shards to export concurrently (worker target) or of '
+                                                 'validating processes (validate target)', default=1, type=int)
+    parser.add_argument('--previous_bucket', help='storage bucket of the previous release (diff target, default: '
+                                                  'the bucket)')
+    parser.add_argument('--previous_blob', help=f'edges file of the previous release (diff target, default: '
+                                                f'{PREVIOUS_EDGES_BLOB})')
+    parser.add_argument('--columnar', help='also write the nodes or edges to Parquet files (needs pyarrow)',
+                        action='store_true')
+    parser.add_argument('--jsonl', help='also write the nodes or edges to gzipped KGX JSON Lines files',
+                        action='store_true')
+    parser.add_argument('--profile', help='profile the target (each shard for the worker target) and upload pstats and '
+                                          'collapsed stack files: cprofile records every call (short runs), sample '
+                                          'records the stack periodically (long runs)', choices=['cprofile', 'sample'])
+    parser.add_argument('--query_log', help='record the time, rows and bytes of the assertion id and edge queries of '
+                                            'each chunk (the page queries for supersede) and the EXPLAIN plan of each '
+                                            'query, and upload the log (edges, worker and supersede targets)',
+                        action='store_true')
+    parser.add_argument('--fragment_cache', help=f'reuse the evidence JSON of the previous run, kept per shard under '
+                                                 f'{FRAGMENT_CACHE_PREFIX} (edges and worker targets)',
+                        action='store_true')
     parser.add_argument('-v', '--verbose', action='store_true')
-    args = parser.parse_args()
+    return parser
+
+
+def main(argv: list[str] = None) -> None:
+    logging.basicConfig(format='%(asctime)s %(module)s:%(funcName)s:%(levelname)s: %(message)s', level=logging.INFO)
+    logging.info('Starting Main')
+    parser = get_parser()
+    args = parser.parse_args(argv)
 
     bucket = args.bucket if args.bucket else 'test_kgx_output_bucket'
     os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = 'prod-creds.json'
 
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
-    if args.target == 'metadata': # if we are just exporting metadata a database connection is not necessary
-        export_metadata(bucket)
-    else:
-        session_maker = init_db(
-            instance=args.instance if args.instance else os.getenv('MYSQL_DATABASE_INSTANCE', None),
-            user=args.user if args.user else os.getenv('MYSQL_DATABASE_USER', None),
-            password=args.password if args.password else os.getenv('MYSQL_DATABASE_PASSWORD', None),
-            database=args.database if args.database else 'text_mined_assertions'
-        )
-
-        logging.info("Exporting Targeted Assertion knowledge graph")
-        logging.info("Exporting UniProt")
-        if args.target == 'nodes':
-            targeted.export_nodes(session_maker(), bucket, GCP_BLOB_PREFIX)
-        elif args.target == 'edges':
-            nodes = get_valid_nodes(bucket)
-            targeted.export_edges(session_maker(), nodes, bucket, "data/kgx-build/",
-                                  assertion_start=args.assertion_offset, assertion_limit=args.assertion_limit,
-                                  chunk_size=args.chunk_size, edge_limit=args.limit)
-        elif args.target == 'count':
-            targeted.export_assertion_count(session_maker(), bucket, "data/kgx-build/")
+    load_target_modules(args.target, bool(args.snapshot) and args.target in SNAPSHOT_TARGETS)
+    profile_name = args.target
+    if args.target == 'edges':
+        profile_name = f'edges_{args.assertion_offset}_{args.assertion_offset + args.assertion_limit}'
+    # the worker target profiles, logs and caches each of its shards separately
+    with profiled(args.profile if args.target != 'worker' else None, profile_name, bucket), \
+            query_logged(args.query_log and args.target in ('edges', 'supersede'), profile_name, bucket) as query_recorder, \
+            fragment_cached(args.fragment_cache and args.target == 'edges', profile_name, bucket) as fragment_cache:
+        if args.target == 'metadata': # if we are just exporting metadata a database connection is not necessary
+            export_metadata(bucket)
+        elif args.target == 'operations':
+            export_operations(bucket)
+        elif args.target == 'merge':
+            export_merged_edges(bucket)
+        elif args.target == 'validate':
+            validate_export(bucket, workers=args.workers)
+        elif args.target == 'diff':
+            export_edge_diff(bucket, args.previous_bucket if args.previous_bucket else bucket,
+                             args.previous_blob if args.previous_blob else PREVIOUS_EDGES_BLOB)
+        else:
+            import db
+            import targeted
+
+            pool_size = args.pool_size
+            if args.target == 'worker':  # every concurrent shard holds a connection while it runs
+                pool_size = max(pool_size if pool_size else db.DEFAULT_POOL_SIZE, args.workers)
+            from_snapshot = bool(args.snapshot) and args.target in SNAPSHOT_TARGETS
+            if from_snapshot:
+                import snapshot
+
+                session_maker = snapshot.open_snapshot(get_snapshot(bucket, args.snapshot),
+                                                       pool_size=pool_size if pool_size else db.DEFAULT_POOL_SIZE)
+            else:
+                instance = args.instance if args.instance else os.getenv('MYSQL_DATABASE_INSTANCE', None)
+                replicas = args.replicas if args.replicas else os.getenv('MYSQL_DATABASE_REPLICAS', '')
+                if args.target in READ_ONLY_TARGETS and replicas:  # the other targets write to the primary
+                    instance = [instance] + [replica.strip() for replica in replicas.split(',') if replica.strip()]
+                session_maker = init_db(
+                    instance=instance,
+                    user=args.user if args.user else os.getenv('MYSQL_DATABASE_USER', None),
+                    password=args.password if args.password else os.getenv('MYSQL_DATABASE_PASSWORD', None),
+                    database=args.database if args.database else 'text_mined_assertions',
+                    pool_size=pool_size,
+                    pool_recycle=args.pool_recycle,
+                    routing=args.routing
+                )
+            retries = args.retries if args.retries is not None else db.DEFAULT_RETRIES
+            top_k = args.top_k if args.top_k else ('window' if from_snapshot else 'lateral')
+            if from_snapshot and top_k == 'lateral':
+                parser.error('the lateral top-k strategy is not supported on a snapshot; use window or heap')
+            adaptive = {}
+            if args.adaptive or args.memory_budget or args.target_seconds:
+                import chunking
+
+                adaptive = {
+                    'memory_budget': args.memory_budget * 1024 * 1024 if args.memory_budget else chunking.DEFAULT_MEMORY_BUDGET,
+                    'target_seconds': args.target_seconds if args.target_seconds else chunking.DEFAULT_TARGET_SECONDS,
+                    'concurrency': args.workers if args.target == 'worker' else 1  # concurrent shards share the memory
+                }
+
+            logging.info("Exporting Targeted Assertion knowledge graph")
+            logging.info("Exporting UniProt")
+            if args.target == 'nodes':
+                targeted.export_nodes(session_maker(), bucket, GCP_BLOB_PREFIX, columnar=args.columnar,
+                                      jsonl=args.jsonl)
+            elif args.target == 'edges':
+                nodes = get_valid_nodes(bucket)
+                targeted.export_edges(session_maker(), nodes, bucket, BUILD_BLOB_PREFIX,
+                                      assertion_start=args.assertion_offset, assertion_limit=args.assertion_limit,
+                                      chunk_size=args.chunk_size, edge_limit=args.limit, raw_fetch=args.raw_fetch,
+                                      retries=retries, top_k=top_k, from_snapshot=from_snapshot,
+                                      columnar=args.columnar, jsonl=args.jsonl, query_recorder=query_recorder,
+                                      fragment_cache=fragment_cache, **adaptive)
+            elif args.target == 'worker':
+                shards = read_manifest(args.manifest)
+                nodes = get_valid_nodes(bucket)
+                idf_weights = targeted.get_idf_weights(session_maker())
+                session_maker.remove()
+                failed = export_edge_shards(session_maker, nodes, bucket, shards, workers=args.workers,
+                                            chunk_size=args.chunk_size, edge_limit=args.limit, raw_fetch=args.raw_fetch,
+                                            retries=retries, idf_weights=idf_weights, top_k=top_k,
+                                            from_snapshot=from_snapshot, columnar=args.columnar, jsonl=args.jsonl,
+                                            profile=args.profile, query_log=args.query_log,
+                                            fragment_cache=args.fragment_cache, **adaptive)
+                if failed:
+                    raise RuntimeError(f'{len(failed)} shards failed: {failed}')
+            elif args.target == 'snapshot':
+                export_snapshot(session_maker, bucket, args.snapshot if args.snapshot else 'snapshot.db', retries)
+            elif args.target == 'count':
+                targeted.export_assertion_count(session_maker(), bucket, BUILD_BLOB_PREFIX)
+            elif args.target == 'supersede':
+                targeted.supersede_evidence(session_maker(),
+                                            batch_size=args.batch_size if args.batch_size else targeted.SUPERSEDE_BATCH_SIZE,
+                                            start_after=args.start_after if args.start_after else '',
+                                            query_recorder=query_recorder)
     logging.info("End Main")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+A persistent cache of the serialized evidence JSON fragments of the _attributes column.
+
+An evidence record's sentence, spans, zone, year and document never change once it is mined, so its fragment only
+needs to be formatted again when its score changes (e.g. new concept IDF weights) or the fragment format does. Each
+fragment is stored with a hash of everything it is formatted from, and a cached fragment is only used while that hash
+still matches. services.get_assertion_json splices the cached fragments into the attribute list as they are.
+
+The cache is a SQLite file. The fragments of a chunk are loaded with one query before the chunk is formatted, and the
+new fragments are written when it is done (see services.write_edges). Fragments not used during a run are removed
+when it finishes, so the file only holds the evidence that is still exported.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+
+import services
+
+FRAGMENT_VERSION = 1  # increase when get_evidence_json changes, so every cached fragment is formatted again
+LOAD_BATCH_SIZE = 900  # below the SQLite limit on the number of parameters of a query
+SEPARATOR = '\x1f'
+
+
+def get_input_hash(row) -> bytes:
+    """
+    Hash everything the evidence JSON fragment of a row is formatted from
+
+    :param row: the evidence row (an EdgeRecord, after score_edge_dict)
+    :returns a 16 byte digest
+    """
+    key = SEPARATOR.join(str(value) for value in (
+        FRAGMENT_VERSION, row.evidence_id, row.document_id, row.document_zone, row.document_year_published,
+        row.sentence, row.subject_span, row.object_span, repr(services.get_score(row))))
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+class FragmentCache:
+    """
+    Evidence JSON fragments keyed by evidence id, stored in a SQLite file
+    """
+
+    def __init__(self, filename: str):
+        """
+        :param filename: the cache file, created if it does not exist
+        """
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS fragments '
+                                '(evidence_id TEXT PRIMARY KEY, input_hash BLOB, fragment TEXT, run INTEGER)')
+        self.run = (self.connection.execute('SELECT MAX(run) FROM fragments').fetchone()[0] or 0) + 1
+        self.loaded = {}
+        self.new_fragments = []
+        self.used = []
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, evidence_ids) -> None:
+        """
+        Load the cached fragments of a chunk's evidence into memory, replacing those of the previous chunk
+
+        :param evidence_ids: the evidence ids of the chunk
+        """
+        self.loaded = {}
+        evidence_ids = list(evidence_ids)
+        for start in range(0, len(evidence_ids), LOAD_BATCH_SIZE):
+            batch = evidence_ids[start:start + LOAD_BATCH_SIZE]
+            query = (f'SELECT evidence_id, input_hash, fragment FROM fragments '
+                     f'WHERE evidence_id IN ({", ".join("?" * len(batch))})')
+            for evidence_id, input_hash, fragment in self.connection.execute(query, batch):
+                self.loaded[evidence_id] = (input_hash, fragment)
+
+    def get_fragment(self, row) -> str:
+        """
+        Get the serialized evidence JSON of a row, formatting it only if it is not cached or its inputs changed
+
+        :param row: the evidence row (an EdgeRecord, after score_edge_dict)
+        :returns the JSON string of get_evidence_json(row)
+        """
+        input_hash = get_input_hash(row)
+        cached = self.loaded.get(row.evidence_id)
+        if cached is not None and cached[0] == input_hash:
+            self.hits += 1
+            self.used.append((self.run, row.evidence_id))
+            return cached[1]
+        self.misses += 1
+        fragment = json.dumps(services.get_evidence_json(row))
+        self.new_fragments.append((row.evidence_id, input_hash, fragment, self.run))
+        self.loaded[row.evidence_id] = (input_hash, fragment)
+        return fragment
+
+    def flush(self) -> None:
+        """
+        Write the fragments formatted since the last flush, and mark the cached fragments used as still needed
+        """
+        self.connection.executemany('INSERT OR REPLACE INTO fragments VALUES (?, ?, ?, ?)', self.new_fragments)
+        self.connection.executemany('UPDATE fragments SET run = ? WHERE evidence_id = ?', self.used)
+        self.connection.commit()
+        self.new_fragments = []
+        self.used = []
+
+    def close(self, prune: bool = True) -> dict[str, int]:
+        """
+        Flush the cache and close the file
+
+        :param prune: whether to remove the fragments that were not used in this run (only if the run is complete)
+        :returns the number of fragments found in the cache, formatted, and pruned
+        """
+        self.flush()
+        pruned = 0
+        if prune:
+            pruned = self.connection.execute('DELETE FROM fragments WHERE run < ?', (self.run,)).rowcount
+            self.connection.commit()
+            if pruned:
+                self.connection.execute('VACUUM')
+        self.connection.close()
+        logging.info(f'Fragment cache: {self.hits} fragments reused, {self.misses} formatted, {pruned} pruned')
+        return {'hits': self.hits, 'misses': self.misses, 'pruned': pruned}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(prune=exc_type is None)
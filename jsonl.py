@@ -0,0 +1,95 @@
+"""
+KGX JSON Lines output of the nodes and edges, written alongside the TSV files.
+
+Each row is one JSON object with the same typed values as the columnar output (confidence_score is a number,
+supporting_study_results and supporting_publications are arrays) and empty values left out. The _attributes column is
+already JSON when the row is formatted, so it is spliced into the object as nested JSON rather than decoded and
+encoded again. The id is always the first key, so the shard files can be merged by assertion id like the TSV files
+(see get_line_id and merge.merge_edge_files).
+"""
+import gzip
+import json
+
+import columnar
+
+RAW_JSON_COLUMNS = ('_attributes',)  # columns that already hold serialized JSON
+ID_PREFIX = '{"id": '
+COMPRESS_LEVEL = 6
+SHARD_PREFIX = 'jsonl/'  # the edge shard files are uploaded under this build prefix, apart from the TSV shards
+DECODER = json.JSONDecoder()
+
+
+def format_row(row: list, columns: tuple[tuple[str, str], ...] = columnar.EDGE_COLUMNS) -> str:
+    """
+    Format a KGX row as a JSON object, with the id first
+
+    :param row: the KGX row (a list of column values in the order of the TSV file)
+    :param columns: the (name, kind) column pairs of the row, see columnar.py
+    :returns the JSON object, without a trailing newline
+    """
+    fields = {}
+    raw_fields = []
+    for (name, kind), value in sorted(zip(columns, row), key=lambda item: item[0][0] != 'id'):
+        if name in RAW_JSON_COLUMNS:
+            if value:
+                raw_fields.append(f'"{name}": {value}')
+            continue
+        value = columnar.convert_value(value, kind)
+        if value is not None and value != []:
+            fields[name] = value
+    line = json.dumps(fields)
+    if raw_fields:
+        line = line[:-1] + (', ' if fields else '') + ', '.join(raw_fields) + '}'
+    return line
+
+
+def get_line_id(line: str) -> str:
+    """
+    Get the id of a line written by format_row without decoding the rest of the object
+
+    :param line: the JSON line
+    :returns the id
+    :raises ValueError: if the line does not start with the id
+    """
+    if not line.startswith(ID_PREFIX):
+        raise ValueError('expected a JSON object starting with its id')
+    value, _ = DECODER.raw_decode(line, len(ID_PREFIX))
+    if not isinstance(value, str):
+        raise ValueError(f'expected a string id, found {value!r}')
+    return value
+
+
+class JsonLinesWriter:
+    """
+    Writes KGX rows to a gzipped JSON Lines file, one object per row
+    """
+
+    def __init__(self, filename: str, columns: tuple[tuple[str, str], ...] = columnar.EDGE_COLUMNS,
+                 compresslevel: int = COMPRESS_LEVEL):
+        self.columns = columns
+        self.outfile = gzip.open(filename, 'wt', compresslevel=compresslevel, encoding='utf-8')
+        self.row_count = 0
+
+    def write_rows(self, rows: list[list]) -> None:
+        """
+        Write a chunk of rows
+
+        :param rows: the KGX rows (lists of column values in the order of the TSV file)
+        """
+        self.outfile.writelines(format_row(row, self.columns) + '\n' for row in rows)
+        self.row_count += len(rows)
+
+    def close(self) -> int:
+        """
+        Finish the file
+
+        :returns the number of rows written
+        """
+        self.outfile.close()
+        return self.row_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
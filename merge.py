@@ -0,0 +1,127 @@
+import gzip
+import heapq
+import logging
+from typing import Callable, Iterator
+
+import edge_index
+
+ID_COLUMN = 13  # the KGX id column holds the assertion id, shared by every predicate edge of an assertion
+COMPRESS_LEVEL = 6  # the gzip command line default; level 9 is much slower for little gain on TSV
+
+
+def open_edge_file(filename: str, mode: str = 'rt'):
+    """
+    Open an edges file, decompressing it if the name ends in .gz
+
+    :param filename: the edges filename
+    :param mode: the text mode to open the file in
+    :returns the open file
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode, compresslevel=COMPRESS_LEVEL, encoding='utf-8')
+    return open(filename, mode, encoding='utf-8')
+
+
+def get_line_id(line: str) -> str:
+    """
+    Get the assertion id of a KGX TSV edge line
+
+    :param line: the edge line
+    :returns the id column
+    :raises ValueError: if the line has too few columns
+    """
+    columns = line.split('\t', ID_COLUMN + 1)
+    if len(columns) <= ID_COLUMN:
+        raise ValueError(f'expected at least {ID_COLUMN + 1} columns')
+    return columns[ID_COLUMN]
+
+
+def read_keyed_lines(filename: str, get_id: Callable[[str], str] = get_line_id) -> Iterator[tuple[str, str]]:
+    """
+    Read the edge lines of a shard file with their assertion ids
+
+    :param filename: the shard filename (plain or gzip)
+    :param get_id: the function that gets the assertion id of a line (get_line_id for TSV, jsonl.get_line_id for JSON
+    Lines)
+    :returns an iterator of (assertion id, line) tuples in file order
+    :raises ValueError: if the file is not sorted by assertion id, since the merge would then be wrong
+    """
+    previous_id = ''
+    with open_edge_file(filename) as infile:
+        for line_number, line in enumerate(infile, start=1):
+            if not line.strip():
+                continue
+            if not line.endswith('\n'):
+                line += '\n'
+            try:
+                assertion_id = get_id(line)
+            except ValueError as error:
+                raise ValueError(f'{filename}:{line_number}: {error}') from error
+            if assertion_id < previous_id:
+                raise ValueError(f'{filename}:{line_number}: assertion {assertion_id} is out of order')
+            previous_id = assertion_id
+            yield assertion_id, line
+
+
+def merge_edge_files(input_filenames: list[str], output_filename: str, index_filename: str = None,
+                     block_size: int = edge_index.BLOCK_SIZE,
+                     get_id: Callable[[str], str] = get_line_id) -> dict[str, int]:
+    """
+    Merge shard edge files into a single compressed edges file ordered by assertion id
+
+    The shards are streamed through a k-way merge, so only one line per shard is held in memory at a time. Exact
+    duplicate lines (e.g. from overlapping shard ranges or a shard that was retried) are written once, and the lines
+    of each assertion are written in sorted order so the output does not depend on the order of the inputs.
+
+    :param input_filenames: the shard filenames (plain or gzip), each sorted by assertion id
+    :param output_filename: the output filename, compressed if it ends in .gz
+    :param index_filename: if given (and the output is compressed), the output is written as independent gzip blocks
+    and their assertion id index is written to this file (see edge_index.py)
+    :param block_size: the uncompressed size of each indexed gzip block
+    :param get_id: the function that gets the assertion id of a line, see read_keyed_lines
+    :returns counts of the files and lines read, lines written, duplicate lines dropped, and assertions found in more
+    than one shard
+    """
+    stats = {'files': len(input_filenames), 'lines_read': 0, 'lines_written': 0, 'duplicates': 0,
+             'assertions': 0, 'overlapping_assertions': 0}
+
+    def keyed(index: int, filename: str) -> Iterator[tuple[str, int, str]]:
+        for assertion_id, line in read_keyed_lines(filename, get_id):
+            yield assertion_id, index, line
+
+    def write_group(outfile, assertion_id: str, group: list[tuple[int, str]]) -> None:
+        lines = set(line for _, line in group)
+        stats['lines_read'] += len(group)
+        stats['duplicates'] += len(group) - len(lines)
+        stats['assertions'] += 1
+        if len(set(index for index, _ in group)) > 1:
+            stats['overlapping_assertions'] += 1
+        if indexed:
+            outfile.write_assertion(assertion_id, sorted(lines))
+        else:
+            for line in sorted(lines):
+                outfile.write(line)
+        stats['lines_written'] += len(lines)
+
+    indexed = index_filename is not None and output_filename.endswith('.gz')
+    streams = [keyed(index, filename) for index, filename in enumerate(input_filenames)]
+    outfile = edge_index.BlockGzipWriter(output_filename, block_size) if indexed else open_edge_file(output_filename, 'wt')
+    with outfile:
+        current_id = None
+        group = []
+        for assertion_id, index, line in heapq.merge(*streams, key=lambda item: item[0]):
+            if assertion_id != current_id:
+                if group:
+                    write_group(outfile, current_id, group)
+                current_id = assertion_id
+                group = []
+            group.append((index, line))
+        if group:
+            write_group(outfile, current_id, group)
+    if indexed:
+        edge_index.write_index(index_filename, outfile.blocks)
+        stats['blocks'] = len(outfile.blocks)
+    logging.info(f'Merged {stats["files"]} files: {stats["lines_read"]} lines read, {stats["lines_written"]} written, '
+                 f'{stats["duplicates"]} duplicates dropped, {stats["overlapping_assertions"]} of '
+                 f'{stats["assertions"]} assertions found in more than one file')
+    return stats
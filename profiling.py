@@ -0,0 +1,104 @@
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_MODES = ['cprofile', 'sample']
+SAMPLE_INTERVAL = 0.01  # seconds between stack samples
+
+
+def get_frame_label(frame) -> str:
+    module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    # the count follows the last space of a collapsed stack line, so labels such as <frozen runpy> cannot have one
+    return f'{module}:{frame.f_code.co_name}'.replace(' ', '_')
+
+
+def collapse_stack(frame) -> str:
+    """
+    Format a stack as one line of the collapsed stack format read by flamegraph.pl and speedscope
+
+    :param frame: the innermost frame of the stack
+    :returns the frame labels from the outermost to the innermost, separated by semicolons
+    """
+    labels = []
+    while frame is not None:
+        labels.append(get_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Records the stack of one thread at a fixed interval from a background thread.
+
+    The profiled thread is not slowed down apart from the interpreter switching to the sampling thread, so the
+    sampler can be left on for a whole shard.
+    """
+
+    def __init__(self, thread_id: int = None, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def write_collapsed(self, filename: str) -> None:
+        with open(filename, 'w') as outfile:
+            for stack, count in sorted(self.stacks.items()):
+                outfile.write(f'{stack} {count}\n')
+
+
+class Profiler:
+    """
+    Profiles the code run by the current thread inside a with block and writes the results to files.
+
+    The cprofile mode records every call with cProfile and writes {name}.pstats; it is exact but slows down
+    Python-heavy code several times, so it suits short runs. Both modes write the sampled stacks to {name}.collapsed.
+    """
+
+    def __init__(self, mode: str, name: str, interval: float = SAMPLE_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'Unknown profile mode {mode}; expected one of {PROFILE_MODES}')
+        self.mode = mode
+        self.name = name
+        self.interval = interval
+        self.profile = None
+        self.sampler = None
+        self.start_time = None
+        self.filenames = []
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        self.sampler = StackSampler(interval=self.interval)
+        self.sampler.start()
+        if self.mode == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(f'{self.name}.pstats')
+            self.filenames.append(f'{self.name}.pstats')
+        self.sampler.stop()
+        self.sampler.write_collapsed(f'{self.name}.collapsed')
+        self.filenames.append(f'{self.name}.collapsed')
+        logging.info(f'Profiled {self.name} for {time.perf_counter() - self.start_time:.1f}s '
+                     f'({sum(self.sampler.stacks.values())} samples): {", ".join(self.filenames)}')
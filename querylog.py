@@ -0,0 +1,225 @@
+"""
+Opt-in capture of the export queries for run reports.
+
+Every execution of a captured query is written to a JSON Lines log with its time, rows and estimated bytes fetched,
+and the plan of each query shape (the query name and its SQL text, whatever the parameter values) is captured with
+EXPLAIN the first time it runs. When the recorder is closed, a summary line per shape is appended, so slow shards can
+be traced to the query that regressed.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Iterable, Iterator
+
+from sqlalchemy.exc import DBAPIError
+
+import db
+
+EXPLAIN_PREFIXES = {'sqlite': 'EXPLAIN QUERY PLAN ', 'mysql': 'EXPLAIN '}
+VALUE_BYTES = 8  # the estimated size of a value that is not a string (numbers, dates)
+
+
+def estimate_row_bytes(row) -> int:
+    """
+    Estimate the number of bytes fetched for a database row
+
+    :param row: the row (a tuple or SQLAlchemy Row)
+    :returns the total length of its string values plus VALUE_BYTES for each other value
+    """
+    return sum(len(value) if isinstance(value, (str, bytes)) else VALUE_BYTES for value in row)
+
+
+def get_query_shape(name: str, query) -> str:
+    """
+    Identify a query independently of its parameter values
+
+    :param name: the name of the query
+    :param query: the text query
+    :returns a short hex digest of the name and the query text with its whitespace collapsed
+    """
+    key = name + '\x1f' + ' '.join(str(query).split())
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class QueryRecorder:
+    """
+    Writes the query log; can be shared by the threads of a process
+    """
+
+    def __init__(self, filename: str, explain: bool = True):
+        """
+        :param filename: the JSON Lines filename
+        :param explain: whether to capture the plan of each query shape
+        """
+        self.filename = filename
+        self.explain_plans = explain
+        self.outfile = open(filename, 'w')
+        self.shapes = {}
+        self.explained = set()
+        self.lock = threading.Lock()
+
+    def write(self, entry: dict) -> None:
+        with self.lock:
+            self.outfile.write(json.dumps(entry, default=str) + '\n')
+            self.outfile.flush()
+
+    def record(self, name: str, shape: str, seconds: float, rows: int, row_bytes: int, error: str = None,
+               **fields) -> None:
+        """
+        Write an execution of a query to the log
+
+        :param name: the name of the query
+        :param shape: the query shape from get_query_shape
+        :param seconds: the time spent executing the query and fetching its rows
+        :param rows: the number of rows fetched
+        :param row_bytes: the estimated number of bytes fetched
+        :param error: the error the query failed with, if it failed
+        :param fields: other values to log (e.g. the chunk size)
+        """
+        entry = {'event': 'query', 'name': name, 'shape': shape, 'seconds': round(seconds, 6), 'rows': rows,
+                 'bytes': row_bytes, **fields}
+        if error is not None:
+            entry['error'] = error
+        self.write(entry)
+        with self.lock:
+            summary = self.shapes.setdefault(shape, {'name': name, 'queries': 0, 'errors': 0, 'seconds': 0.0,
+                                                     'max_seconds': 0.0, 'rows': 0, 'bytes': 0})
+            summary['queries'] += 1
+            summary['errors'] += error is not None
+            summary['seconds'] += seconds
+            summary['max_seconds'] = max(summary['max_seconds'], seconds)
+            summary['rows'] += rows
+            summary['bytes'] += row_bytes
+
+    def needs_plan(self, shape: str) -> bool:
+        """
+        Determine whether the plan of a query shape should be captured, which is true only once per shape
+
+        :param shape: the query shape from get_query_shape
+        :returns true if plans are captured and this shape's has not been
+        """
+        with self.lock:
+            if not self.explain_plans or shape in self.explained:
+                return False
+            self.explained.add(shape)
+            return True
+
+    def explain(self, session, name: str, shape: str, query, params: dict) -> None:
+        """
+        Write the plan of a query to the log
+
+        :param session: the database session the query ran on
+        :param name: the name of the query
+        :param shape: the query shape from get_query_shape
+        :param query: the text query
+        :param params: the bind parameter values the query ran with
+        """
+        entry = {'event': 'plan', 'name': name, 'shape': shape, 'query': ' '.join(str(query).split())}
+        try:
+            connection = session.connection()
+            entry['dialect'] = connection.dialect.name
+            statement, parameters = db.compile_query(connection, query, params)
+            result = connection.exec_driver_sql(EXPLAIN_PREFIXES.get(connection.dialect.name, 'EXPLAIN ') + statement,
+                                                parameters)
+            entry['plan'] = [dict(row) for row in result.mappings()]
+        except DBAPIError as error:
+            logging.warning(f'Could not explain the {name} query: {error.orig}')
+            entry['error'] = str(error.orig)
+        self.write(entry)
+
+    def close(self) -> None:
+        """
+        Write a summary of each query shape and close the log
+        """
+        for shape, summary in self.shapes.items():
+            logging.info(f'{summary["name"]} query {shape}: {summary["queries"]} executions, '
+                         f'{summary["seconds"]:.3f}s, {summary["rows"]} rows')
+            self.write({'event': 'summary', 'shape': shape, **summary})
+        self.outfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class QueryCapture:
+    """
+    Captures one execution of a query; see capture
+    """
+
+    def __init__(self, recorder: QueryRecorder, name: str, session, query, params: dict, **fields):
+        self.recorder = recorder
+        self.name = name
+        self.session = session
+        self.query = query
+        self.params = params
+        self.fields = fields
+        self.seconds = 0.0
+        self.rows = 0
+        self.row_bytes = 0
+        self.start = None
+        self.fetched = False
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def fetch(self, rows: Iterable) -> Iterable:
+        """
+        Count the rows of the query as they are fetched, and the time spent fetching them
+
+        :param rows: the result of the query
+        :returns an iterator of the same rows (or the result itself if nothing is recorded)
+        """
+        if self.recorder is None:
+            return rows
+        self.seconds += time.perf_counter() - self.start  # the time spent executing the query
+        self.fetched = True
+        return self.count_rows(rows)
+
+    def count_rows(self, rows: Iterable) -> Iterator:
+        iterator = iter(rows)
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                self.seconds += time.perf_counter() - start
+                return
+            self.seconds += time.perf_counter() - start
+            self.rows += 1
+            self.row_bytes += estimate_row_bytes(row)
+            yield row
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.recorder is None:
+            return
+        if not self.fetched:  # the query failed before its rows were fetched
+            self.seconds = time.perf_counter() - self.start
+        shape = get_query_shape(self.name, self.query)
+        self.recorder.record(self.name, shape, self.seconds, self.rows, self.row_bytes,
+                             None if exc_value is None else repr(exc_value), **self.fields)
+        if exc_value is None and self.recorder.needs_plan(shape):
+            self.recorder.explain(self.session, self.name, shape, self.query, self.params)
+
+
+def capture(recorder: QueryRecorder, name: str, session, query, params: dict, **fields) -> QueryCapture:
+    """
+    Capture an execution of a query, for use as a context manager around the query and the use of its rows:
+
+        with querylog.capture(recorder, 'assertion_ids', session, query, params) as captured:
+            ids = [row[0] for row in captured.fetch(session.execute(query, params))]
+
+    :param recorder: the query recorder, or None to capture nothing
+    :param name: the name of the query
+    :param session: the database session the query runs on
+    :param query: the text query
+    :param params: the bind parameter values
+    :param fields: other values to log with the execution
+    :returns the capture
+    """
+    return QueryCapture(recorder, name, session, query, params, **fields)
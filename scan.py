@@ -0,0 +1,89 @@
+"""
+Parallel scanning of large uncompressed TSV files.
+
+The file is memory-mapped and split into byte ranges that end at newlines. Each range is reduced by a worker process
+with a per-line reducer, and the partial results are merged in file order.
+"""
+import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator
+
+RANGE_BYTES = 64 * 1024 * 1024
+
+_reducer = None  # the per-line reducer, set in each worker process by init_scan
+
+
+def init_scan(reducer: Callable[[list[str], dict], dict]) -> None:
+    global _reducer
+    _reducer = reducer
+
+
+def get_line_ranges(filename: str, range_bytes: int = RANGE_BYTES) -> list[tuple[int, int]]:
+    """
+    Split a file into byte ranges of about range_bytes that each end after a newline
+
+    :param filename: the uncompressed filename
+    :param range_bytes: the approximate size of each range
+    :returns the (start, end) byte offsets of the ranges, covering the whole file
+    """
+    size = os.path.getsize(filename)
+    if size == 0:
+        return []
+    ranges = []
+    with open(filename, 'rb') as infile, mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        start = 0
+        while start < size:
+            newline = mapped.find(b'\n', min(start + range_bytes, size) - 1)
+            end = newline + 1 if newline >= 0 else size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def read_lines(filename: str, start: int, end: int) -> Iterator[str]:
+    """
+    Read the lines in a byte range of a file returned by get_line_ranges
+
+    :param filename: the uncompressed filename
+    :param start: the first byte of the range
+    :param end: the byte after the range
+    :returns an iterator of the lines, with their newlines
+    """
+    with open(filename, 'rb') as infile, mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        mapped.seek(start)
+        while mapped.tell() < end:
+            yield mapped.readline().decode('utf-8', errors='replace')
+
+
+def reduce_range(filename: str, start: int, end: int) -> dict:
+    partial = {}
+    for line in read_lines(filename, start, end):
+        partial = _reducer(line.split('\t'), partial)
+    return partial
+
+
+def scan_file(filename: str, reducer: Callable[[list[str], dict], dict], merger: Callable[[list[dict]], dict],
+              workers: int = None, range_bytes: int = RANGE_BYTES) -> dict:
+    """
+    Reduce every line of an uncompressed TSV file in parallel
+
+    :param filename: the uncompressed filename
+    :param reducer: a picklable function that takes the tab-separated columns of a line (the last one still ending in
+    a newline) and a partial result dictionary, and returns the updated dictionary, e.g. services.update_operations
+    :param merger: a function that combines a list of partial result dictionaries, e.g. services.merge_operations
+    :param workers: the number of processes (the number of CPUs if not given)
+    :param range_bytes: the approximate number of bytes reduced by each task
+    :returns the merged result
+    """
+    workers = workers if workers else os.cpu_count()
+    ranges = get_line_ranges(filename, range_bytes)
+    logging.info(f'Scanning {filename} in {len(ranges)} ranges with {workers} processes')
+    if workers > 1 and len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_scan, initargs=(reducer,)) as executor:
+            partials = list(executor.map(reduce_range, [filename] * len(ranges), *zip(*ranges)))
+    else:
+        init_scan(reducer)
+        partials = [reduce_range(filename, start, end) for start, end in ranges]
+    return merger(partials)
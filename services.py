@@ -1,4 +1,4 @@
-import http.client
+import functools
 import json
 import logging
 import os
@@ -7,8 +7,6 @@ import math
 import shutil
 from typing import Iterator
 
-from google.cloud import storage
-
 PRIMARY_KNOWLEDGE_SOURCE = "infores:text-mining-provider-targeted"
 
 
@@ -20,6 +18,7 @@ def get_normalized_nodes(curie_list: list[str]) -> dict:  # pragma: no cover
     """
     json_data = json.dumps({'curies': curie_list, 'conflate': False})
     headers = {"Content-type": "application/json", "Accept": "application/json"}
+    import http.client
     conn = http.client.HTTPSConnection(host='nodenormalization-sri.renci.org')
     try:
         conn.request('POST', '/get_normalized_nodes', body=json_data, headers=headers)
@@ -65,6 +64,7 @@ def upload_to_gcp(bucket_name: str, source_file_name: str, destination_blob_name
     :param destination_blob_name: the blob name to use as the destination
     :param delete_source_file: whether or not to delete the local file after upload
     """
+    from google.cloud import storage
     client = storage.Client()
     bucket = client.bucket(bucket_name)
     logging.info(f'Uploading {source_file_name} to bucket: {bucket_name} path: {destination_blob_name}')
@@ -75,6 +75,7 @@ def upload_to_gcp(bucket_name: str, source_file_name: str, destination_blob_name
 
 
 def get_from_gcp(bucket_name: str, blob_name: str, destination_file_name: str) -> None:  # pragma: no cover
+    from google.cloud import storage
     client = storage.Client()
     bucket = client.bucket(bucket_name)
     logging.info(f'Downloading {blob_name} to {destination_file_name}')
@@ -82,6 +83,19 @@ def get_from_gcp(bucket_name: str, blob_name: str, destination_file_name: str) -
     blob.download_to_filename(destination_file_name)
 
 
+def list_gcp_blobs(bucket_name: str, prefix: str) -> list[str]:  # pragma: no cover
+    """
+    List the names of the blobs in the specified GCP Bucket that start with the given prefix.
+
+    :param bucket_name: the GCP Bucket
+    :param prefix: the blob name prefix to match
+    :returns a sorted list of blob names
+    """
+    from google.cloud import storage
+    client = storage.Client()
+    return sorted(blob.name for blob in client.list_blobs(bucket_name, prefix=prefix))
+
+
 def update_node_metadata(node: list[str], node_metadata_dict: dict, source: str) -> dict:
     """
     Updates a node metadata dictionary with information from a single node
@@ -123,8 +137,39 @@ def update_edge_metadata(edge: list, edge_metadata_dict: dict, node_dict: dict,
     """
     object_category = get_category(edge[0], normalized_nodes=node_dict)
     subject_category = get_category(edge[2], normalized_nodes=node_dict)
-    triple = f"{object_category}|{edge[1]}|{subject_category}"
-    relation = edge[1]
+    return add_edge_metadata(edge[1], subject_category, object_category, edge_metadata_dict, source)
+
+
+def update_edge_metadata_from_categories(edge: list, edge_metadata_dict: dict, node_categories: dict[str, str],
+                                         source: str) -> dict:
+    """
+    Updates an edge metadata dictionary with information from a single edge, using the categories from a KGX nodes file
+
+    :param edge: the edge to add to the dictionary
+    :param edge_metadata_dict: the metadata dictionary
+    :param node_categories: a dictionary of node curies to categories
+    :param source: the primary knowledge source
+    :returns the updated edge metadata dictionary
+    """
+    object_category = get_node_category(edge[0], node_categories)
+    subject_category = get_node_category(edge[2], node_categories)
+    return add_edge_metadata(edge[1], subject_category, object_category, edge_metadata_dict, source)
+
+
+def add_edge_metadata(predicate: str, subject_category: str, object_category: str, edge_metadata_dict: dict,
+                      source: str) -> dict:
+    """
+    Updates an edge metadata dictionary with a single categorized triple
+
+    :param predicate: the edge predicate
+    :param subject_category: the category used for the "subject" field
+    :param object_category: the category used for the "object" field
+    :param edge_metadata_dict: the metadata dictionary
+    :param source: the primary knowledge source
+    :returns the updated edge metadata dictionary
+    """
+    triple = f"{object_category}|{predicate}|{subject_category}"
+    relation = predicate
     if triple in edge_metadata_dict:
         if relation not in edge_metadata_dict[triple]["relations"]:
             edge_metadata_dict[triple]["relations"].append(relation)
@@ -133,7 +178,7 @@ def update_edge_metadata(edge: list, edge_metadata_dict: dict, node_dict: dict,
     else:
         edge_metadata_dict[triple] = {
             "subject": subject_category,
-            "predicate": edge[1],
+            "predicate": predicate,
             "object": object_category,
             "relations": [relation],
             "count": 1,
@@ -146,6 +191,39 @@ def update_edge_metadata(edge: list, edge_metadata_dict: dict, node_dict: dict,
     return edge_metadata_dict
 
 
+def merge_edge_metadata(edge_metadata_dicts) -> dict:
+    """
+    Combines partial edge metadata dictionaries (e.g. one per edge shard) into a single dictionary
+
+    :param edge_metadata_dicts: an iterable of edge metadata dictionaries, keyed by triple
+    :returns the combined edge metadata dictionary, with triples in sorted order
+    """
+    merged = {}
+    for edge_metadata_dict in edge_metadata_dicts:
+        for triple, metadata in edge_metadata_dict.items():
+            if triple not in merged:
+                merged[triple] = {
+                    "subject": metadata["subject"],
+                    "predicate": metadata["predicate"],
+                    "object": metadata["object"],
+                    "relations": [],
+                    "count": 0,
+                    "count_by_source": {
+                        "primary_knowledge_source": {}
+                    }
+                }
+            for relation in metadata["relations"]:
+                if relation not in merged[triple]["relations"]:
+                    merged[triple]["relations"].append(relation)
+            merged[triple]["count"] += metadata["count"]
+            merged_sources = merged[triple]["count_by_source"]["primary_knowledge_source"]
+            for source, count in metadata["count_by_source"]["primary_knowledge_source"].items():
+                merged_sources[source] = merged_sources.get(source, 0) + count
+    for metadata in merged.values():
+        metadata["relations"].sort()
+    return {triple: merged[triple] for triple in sorted(merged.keys())}
+
+
 def update_edge_metadata_2(edge, edge_metadata_dict: dict, node_dict: dict, source: str) -> dict:
     """
     Updates an edge metadata dictionary with information from a single edge
@@ -183,6 +261,125 @@ def update_edge_metadata_2(edge, edge_metadata_dict: dict, node_dict: dict, sour
     return edge_metadata_dict
 
 
+# The qualifier columns of a KGX edge (columns 3-12), in output order
+QUALIFIER_COLUMNS = ('qualified_predicate', 'subject_aspect_qualifier', 'subject_direction_qualifier',
+                     'subject_part_qualifier', 'subject_form_or_variant_qualifier', 'object_aspect_qualifier',
+                     'object_direction_qualifier', 'object_part_qualifier', 'object_form_or_variant_qualifier',
+                     'anatomical_context_qualifier')
+
+
+def get_predicate_columns(predicate: str, **qualifiers) -> tuple[str, ...]:
+    """
+    Build the predicate and qualifier columns of a KGX edge
+
+    :param predicate: the KGX predicate
+    :param qualifiers: the non-empty qualifiers, named as in QUALIFIER_COLUMNS
+    :returns the predicate followed by the ten qualifier columns
+    """
+    unknown = set(qualifiers) - set(QUALIFIER_COLUMNS)
+    if unknown:
+        raise ValueError(f'Unknown qualifiers: {", ".join(sorted(unknown))}')
+    return (predicate,) + tuple(qualifiers.get(column, '') for column in QUALIFIER_COLUMNS)
+
+
+# The source predicates that are mapped to another KGX predicate and qualifier columns, each with its BTE operation
+# predicate. Any other predicate is exported as it is, with no qualifiers (see get_predicate_mapping).
+PREDICATE_MAPPINGS = {
+    'biolink:entity_positively_regulates_entity': (
+        get_predicate_columns('biolink:affects', qualified_predicate='biolink:causes',
+                              object_aspect_qualifier='activity_or_abundance', object_direction_qualifier='increased'),
+        'positively_regulates'),
+    'biolink:entity_negatively_regulates_entity': (
+        get_predicate_columns('biolink:affects', qualified_predicate='biolink:causes',
+                              object_aspect_qualifier='activity_or_abundance', object_direction_qualifier='decreased'),
+        'negatively_regulates'),
+    'biolink:treats': (get_predicate_columns('biolink:treats_or_applied_or_studied_to_treat'), 'treats'),
+}
+# The source predicates that are not exported; their evidence is dropped as soon as it is fetched
+DROPPED_PREDICATES = {'biolink:gain_of_function_contributes_to', 'biolink:loss_of_function_contributes_to'}
+# Columns written by earlier releases, so that operations can still be counted from their edge files
+LEGACY_OPERATION_PREDICATES = {
+    get_predicate_columns('biolink:treats'): 'treats',
+    get_predicate_columns('biolink:contributes_to'): 'contributes_to',
+    get_predicate_columns('biolink:affects', qualified_predicate='biolink:contributes_to',
+                          subject_form_or_variant_qualifier='gain_of_function_variant_form'):
+        'gain_of_function_contributes_to',
+    get_predicate_columns('biolink:affects', qualified_predicate='biolink:contributes_to',
+                          subject_form_or_variant_qualifier='loss_of_function_variant_form'):
+        'loss_of_function_contributes_to',
+}
+OPERATION_PREDICATES = dict(LEGACY_OPERATION_PREDICATES)
+OPERATION_PREDICATES.update((columns, operation) for columns, operation in PREDICATE_MAPPINGS.values())
+
+
+def map_predicate(predicate: str) -> tuple[str, ...]:
+    """
+    Get the KGX predicate and qualifier columns that a source predicate is exported as
+
+    :param predicate: the source predicate
+    :returns the mapped columns, or the predicate itself with empty qualifiers if it has no mapping
+    """
+    mapping = PREDICATE_MAPPINGS.get(predicate)
+    return mapping[0] if mapping is not None else get_predicate_columns(predicate)
+
+
+def get_operation_predicate(edge: list) -> str:
+    """
+    Determines the BTE operation predicate name from the predicate and qualifier columns of a KGX edge
+
+    :param edge: the KGX edge columns
+    :returns the operation predicate name, or 'no_predicate' if the combination is not recognized
+    """
+    return OPERATION_PREDICATES.get((edge[1], *edge[3:13]), 'no_predicate')
+
+
+def update_operations(edge: list, operations_dict: dict) -> dict:
+    """
+    Updates a BTE operations dictionary with a single edge
+
+    :param edge: the KGX edge columns
+    :param operations_dict: the operations dictionary, keyed by subject namespace, predicate and object namespace
+    :returns the updated operations dictionary
+    """
+    subject_namespace = edge[0].split(':')[0]
+    object_namespace = edge[2].split(':')[0]
+    key = subject_namespace + '_' + get_operation_predicate(edge) + '_' + object_namespace
+    operations_dict[key] = operations_dict.get(key, 0) + 1
+    return operations_dict
+
+
+def merge_operations(operations_dicts) -> dict:
+    """
+    Combines partial BTE operations dictionaries (e.g. one per edge shard) into a single dictionary
+
+    :param operations_dicts: an iterable of operations dictionaries
+    :returns the combined operations dictionary, with keys in sorted order
+    """
+    merged = {}
+    for operations_dict in operations_dicts:
+        for key, count in operations_dict.items():
+            merged[key] = merged.get(key, 0) + count
+    return {key: merged[key] for key in sorted(merged.keys())}
+
+
+def merge_operations_files(input_filenames: list[str], output_filename: str) -> dict:
+    """
+    Combines partial BTE operations files into a single operations.json file
+
+    :param input_filenames: the partial operations JSON files
+    :param output_filename: filepath for the combined file
+    :returns the combined operations dictionary
+    """
+    partials = []
+    for filename in input_filenames:
+        with open(filename, 'r') as infile:
+            partials.append(json.load(infile))
+    operations_dict = merge_operations(partials)
+    with open(output_filename, 'w') as outfile:
+        outfile.write(json.dumps(operations_dict))
+    return operations_dict
+
+
 def get_category(curie: str, normalized_nodes: dict[str, dict]) -> str:
     """
     Retrieves the category of the given curie, as determined by the normalized dictionary (with some default values)
@@ -197,6 +394,21 @@ def get_category(curie: str, normalized_nodes: dict[str, dict]) -> str:
     return category
 
 
+def get_node_category(curie: str, node_categories: dict[str, str]) -> str:
+    """
+    Retrieves the category of the given curie from a dictionary of curies to categories (with the same default values
+    as get_category)
+
+    :param curie: the curie
+    :param node_categories: a dictionary of node curies to categories, as read from a KGX nodes file
+    :returns the category of the curie
+    """
+    category = node_categories.get(curie)
+    if not category:
+        category = 'biolink:SmallMolecule' if curie.startswith('DRUGBANK') else 'biolink:NamedThing'
+    return category
+
+
 def is_normal(curie: str, normalized_nodes: dict[str, dict]) -> bool:
     """
     Determines if the given curie exists in the given normalized dictionary and has the necessary fields populated
@@ -237,7 +449,135 @@ def get_kgx_nodes(curies: list[str], normalized_nodes: dict[str, dict]) -> Itera
             yield []
 
 
+# The columns of the edge query, in order
+EDGE_QUERY_FIELDS = ('assertion_id', 'evidence_id', 'association_curie', 'predicate_curie', 'subject_curie',
+                     'object_curie', 'document_id', 'document_zone', 'document_year_published', 'score', 'sentence',
+                     'subject_span', 'object_span', 'evidence_count')
+# The query columns followed by the log10(idf) weights of the subject and object, looked up from the cached IDF table
+EDGE_FIELDS = EDGE_QUERY_FIELDS + ('subject_weight', 'object_weight')
+# Scores filled in for a whole chunk by score_edge_dict, before the chunk is formatted
+SCORE_FIELDS = ('weighted_score', 'aggregate_score')
+# Fields whose values repeat heavily across the evidence rows of a chunk, and are interned when building records
+INTERNED_EDGE_FIELDS = ('assertion_id', 'association_curie', 'predicate_curie', 'subject_curie', 'object_curie',
+                        'document_id', 'document_zone')
+
+
+class EdgeRecord:
+    """
+    A single evidence row of the edge query, with the columns in EDGE_FIELDS order.
+
+    Supports the same attribute access as a SQLAlchemy Row, without the per-access overhead.
+    """
+    __slots__ = EDGE_FIELDS + SCORE_FIELDS
+
+    def __init__(self, assertion_id, evidence_id, association_curie, predicate_curie, subject_curie, object_curie,
+                 document_id, document_zone, document_year_published, score, sentence, subject_span, object_span,
+                 evidence_count, subject_weight=None, object_weight=None):
+        self.assertion_id = assertion_id
+        self.evidence_id = evidence_id
+        self.association_curie = association_curie
+        self.predicate_curie = predicate_curie
+        self.subject_curie = subject_curie
+        self.object_curie = object_curie
+        self.document_id = document_id
+        self.document_zone = document_zone
+        self.document_year_published = document_year_published
+        self.score = score
+        self.sentence = sentence
+        self.subject_span = subject_span
+        self.object_span = object_span
+        self.evidence_count = evidence_count
+        self.subject_weight = subject_weight
+        self.object_weight = object_weight
+        self.weighted_score = None
+        self.aggregate_score = None
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f'EdgeRecord({", ".join(repr(getattr(self, field)) for field in EDGE_FIELDS)})'
+
+
+_INTERNED_POSITIONS = tuple(EDGE_FIELDS.index(field) for field in INTERNED_EDGE_FIELDS)
+_SUBJECT_POSITION = EDGE_FIELDS.index('subject_curie')
+_OBJECT_POSITION = EDGE_FIELDS.index('object_curie')
+
+
+def get_idf_weight(idf) -> float:
+    """
+    Convert a concept IDF value to the weight used in evidence scores
+
+    :param idf: the IDF value from the concept_idf table
+    :returns log10 of the IDF, or None if the IDF is missing or zero (the score is then left unweighted)
+    """
+    if not idf:
+        return None
+    return math.log10(idf)
+
+
+def make_edge_record(values, strings: dict, idf_weights: dict = None) -> EdgeRecord:
+    """
+    Build a compact EdgeRecord from a row of the edge query, sharing one copy of each repeated categorical value
+
+    :param values: the row values, in EDGE_QUERY_FIELDS order (a SQLAlchemy Row or a DB-API tuple)
+    :param strings: the intern table for the current chunk, updated with any new values
+    :param idf_weights: a dictionary of concept curies to their IDF weights (see get_idf_weight)
+    :returns the EdgeRecord
+    """
+    values = list(values)
+    for position in _INTERNED_POSITIONS:
+        value = values[position]
+        if value is not None:
+            values[position] = strings.setdefault(value, value)
+    if idf_weights is not None:
+        values.append(idf_weights.get(values[_SUBJECT_POSITION]))
+        values.append(idf_weights.get(values[_OBJECT_POSITION]))
+    return EdgeRecord(*values)
+
+
+def score_edge_dict(edge_dict) -> None:
+    """
+    Compute the evidence scores and the per-(assertion, predicate) aggregate scores for a whole chunk at once
+
+    The per-row scores are computed with NumPy and are bit-identical to get_score. The aggregates use math.fsum over
+    the same values, so they match get_aggregate_score exactly. The results are stored on the records, where
+    get_score and get_aggregate_score pick them up instead of recomputing them for every edge and evidence JSON blob.
+
+    :param edge_dict: the EdgeRecords of a chunk grouped by assertion id (after uniquify_edge_dict)
+    """
+    import numpy as np
+
+    records = [record for rows in edge_dict.values() for record in rows]
+    if not records:
+        return
+    count = len(records)
+    base = np.fromiter((float(record.score) for record in records), dtype=np.float64, count=count)
+    subject = np.fromiter((np.nan if record.subject_weight is None else record.subject_weight for record in records),
+                          dtype=np.float64, count=count)
+    object_ = np.fromiter((np.nan if record.object_weight is None else record.object_weight for record in records),
+                          dtype=np.float64, count=count)
+    unweighted = np.isnan(subject) | np.isnan(object_)
+    scores = np.where(unweighted, base, np.abs(subject * object_ * base)).tolist()
+    groups = {}
+    for record, score in zip(records, scores):
+        record.weighted_score = score
+        groups.setdefault((record.assertion_id, record.predicate_curie), []).append(score)
+    aggregates = {key: math.fsum(values) / float(len(values)) for key, values in groups.items()}
+    for record in records:
+        record.aggregate_score = aggregates[(record.assertion_id, record.predicate_curie)]
+
+
 def get_aggregate_score(rows):
+    """
+    Get the mean score of the rows of one assertion and predicate
+
+    :param rows: all the rows of an assertion with one predicate (the group score_edge_dict aggregated, if it was run)
+    :returns the mean score
+    """
+    aggregate_score = getattr(rows[0], 'aggregate_score', None)
+    if aggregate_score is not None:
+        return aggregate_score
     scores = []
     for row in rows:
         scores.append(get_score(row))
@@ -245,19 +585,30 @@ def get_aggregate_score(rows):
 
 
 def get_score(row):
-    base_score = float(row['score'])
-    if not row['subject_idf'] or not row['object_idf']:
+    weighted_score = getattr(row, 'weighted_score', None)
+    if weighted_score is not None:
+        return weighted_score
+    base_score = float(row.score)
+    if row.subject_weight is None or row.object_weight is None:
         return base_score
     else:
-        return abs(math.log10(row['subject_idf']) * math.log10(row['object_idf']) * base_score)
+        return abs(row.subject_weight * row.object_weight * base_score)
+
 
+def get_assertion_json(rows, fragment_cache=None):
+    """
+    Get the _attributes JSON of an edge
 
-def get_assertion_json(rows):
+    :param rows: the evidence rows of the edge
+    :param fragment_cache: if given, a fragments.FragmentCache that the serialized evidence JSON is taken from; the
+    cached fragments are spliced into the list as json.dumps would write them, so the result is the same
+    :returns the JSON string
+    """
     # semmed_count = sum([row['semmed_flag'] for row in rows])
     row1 = rows[0]
     supporting_publications = []
     for row in rows:
-        document_id = row['document_id']
+        document_id = row.document_id
         if document_id.startswith('PMC') and ':' not in document_id:
             supporting_publications.append(document_id.replace('PMC', 'PMC:'))
         else:
@@ -285,7 +636,7 @@ def get_assertion_json(rows):
         },
         {
             "attribute_type_id": "biolink:evidence_count",
-            "value": row1['evidence_count'],
+            "value": row1.evidence_count,
             "value_type_id": "biolink:EvidenceCount",
             "attribute_source": "infores:text-mining-provider-targeted"
         },
@@ -309,19 +660,21 @@ def get_assertion_json(rows):
     #         "value_type_id": "SIO:000794",
     #         "attribute_source": "infores:text-mining-provider-targeted"
     #     })
+    if fragment_cache is not None:
+        return json.dumps(attributes_list)[:-1] + ''.join(', ' + fragment_cache.get_fragment(row) for row in rows) + ']'
     for row in rows:
         attributes_list.append(get_evidence_json(row))
     return json.dumps(attributes_list)
 
 
 def get_evidence_json(row):
-    document_id = row['document_id']
+    document_id = row.document_id
     if document_id.startswith('PMC') and ':' not in document_id:
         document_id = document_id.replace('PMC', 'PMC:')
     nested_attributes = [
         {
             "attribute_type_id": "biolink:supporting_text",
-            "value": row['sentence'],
+            "value": row.sentence,
             "value_type_id": "EDAM:data_3671",
             "attribute_source": "infores:text-mining-provider-targeted"
         },
@@ -329,12 +682,12 @@ def get_evidence_json(row):
             "attribute_type_id": "biolink:publications",
             "value": document_id,
             "value_type_id": "biolink:Uriorcurie",
-            "value_url": f"https://pubmed.ncbi.nlm.nih.gov/{str(row['document_id']).split(':')[-1]}/",
+            "value_url": f"https://pubmed.ncbi.nlm.nih.gov/{str(row.document_id).split(':')[-1]}/",
             "attribute_source": "infores:pubmed"
         },
         {
             "attribute_type_id": "biolink:supporting_text_located_in",
-            "value": row['document_zone'],
+            "value": row.document_zone,
             "value_type_id": "IAO_0000314",
             "attribute_source": "infores:pubmed"
         },
@@ -346,22 +699,22 @@ def get_evidence_json(row):
         },
         {
             "attribute_type_id": "biolink:subject_location_in_text",
-            "value": row['subject_span'] if row['subject_span'] else '',
+            "value": row.subject_span if row.subject_span else '',
             "value_type_id": "SIO:001056",
             "attribute_source": "infores:text-mining-provider-targeted"
         },
         {
             "attribute_type_id": "biolink:object_location_in_text",
-            "value": row['object_span'] if row['object_span'] else '',
+            "value": row.object_span if row.object_span else '',
             "value_type_id": "SIO:001056",
             "attribute_source": "infores:text-mining-provider-targeted "
         }
     ]
-    if row['document_year_published']:
+    if row.document_year_published:
         nested_attributes.append(
             {
                 "attribute_type_id": "biolink:supporting_document_year",
-                "value": row['document_year_published'],
+                "value": row.document_year_published,
                 "value_type_id": "UO:0000036",
                 "attribute_source": "infores:pubmed"
             }
@@ -377,103 +730,98 @@ def get_evidence_json(row):
     #     )
     return {
         "attribute_type_id": "biolink:has_supporting_study_result",
-        "value": f"tmkp:{row['evidence_id']}",
+        "value": f"tmkp:{row.evidence_id}",
         "value_type_id": "biolink:TextMiningResult",
-        "value_url": f"https://tmui.text-mining-kp.org/evidence/{row['evidence_id']}",
+        "value_url": f"https://tmui.text-mining-kp.org/evidence/{row.evidence_id}",
         "attribute_source": "infores:text-mining-provider-targeted",
         "attributes": nested_attributes
     }
 
 
-def get_edge(rows, predicate):
-    relevant_rows = [row for row in rows if row['predicate_curie'] == predicate]
+def get_edge(rows, predicate, fragment_cache=None):
+    if predicate in DROPPED_PREDICATES:
+        logging.debug(f'Predicate {predicate} is not exported')
+        return None
+    predicate_columns = map_predicate(predicate)
+    relevant_rows = [row for row in rows if row.predicate_curie == predicate]
     if len(relevant_rows) == 0:
         logging.debug(f'No relevant rows for predicate {predicate}')
         return None
     row1 = relevant_rows[0]
-    if row1['object_curie'].startswith('PR:') or row1['subject_curie'].startswith('PR:'):
-        logging.debug(f"Could not get uniprot for pr curie ({row1['object_curie']}|{row1['subject_curie']})")
+    if row1.object_curie.startswith('PR:') or row1.subject_curie.startswith('PR:'):
+        logging.debug(f"Could not get uniprot for pr curie ({row1.object_curie}|{row1.subject_curie})")
         return None
-    sub = row1['subject_curie']
-    obj = row1['object_curie']
+    sub = row1.subject_curie
+    obj = row1.object_curie
     # if (row1['object_curie'].startswith('PR:') and not row1['object_uniprot']) or \
     #         (row1['subject_curie'].startswith('PR:') and not row1['subject_uniprot']):
     #     logging.debug(f"Could not get uniprot for pr curie ({row1['object_curie']}|{row1['subject_curie']})")
     #     return None
     # sub = row1['subject_uniprot'] if row1['subject_uniprot'] else row1['subject_curie']
     # obj = row1['object_uniprot'] if row1['object_uniprot'] else row1['object_curie']
-    supporting_study_results = '|'.join([f"tmkp:{row['evidence_id']}" for row in relevant_rows])
+    supporting_study_results = '|'.join([f"tmkp:{row.evidence_id}" for row in relevant_rows])
     supporting_publications = []
     for row in relevant_rows:
-        document_id = row['document_id']
+        document_id = row.document_id
         if document_id.startswith('PMC') and ':' not in document_id:
             supporting_publications.append(document_id.replace('PMC', 'PMC:'))
         else:
             supporting_publications.append(document_id)
     supporting_publications_string = '|'.join(supporting_publications)
-    qualified_predicate = ''
-    subject_aspect_qualifier = ''
-    subject_direction_qualifier = ''
-    subject_part_qualifier = ''
-    subject_form_or_variant_qualifier = ''
-    object_aspect_qualifier = ''
-    object_direction_qualifier = ''
-    object_part_qualifier = ''
-    object_form_or_variant_qualifier = ''
-    anatomical_context_qualifier = ''
-    if predicate == 'biolink:entity_positively_regulates_entity':
-        predicate = 'biolink:affects'
-        qualified_predicate = 'biolink:causes'
-        object_aspect_qualifier = 'activity_or_abundance'
-        object_direction_qualifier = 'increased'
-    elif predicate == 'biolink:entity_negatively_regulates_entity':
-        predicate = 'biolink:affects'
-        qualified_predicate = 'biolink:causes'
-        object_aspect_qualifier = 'activity_or_abundance'
-        object_direction_qualifier = 'decreased'
-    elif predicate == 'biolink:treats':
-        predicate = 'biolink:treats_or_applied_or_studied_to_treat'
-    elif predicate == 'biolink:gain_of_function_contributes_to':
-        # predicate = 'biolink:affects'
-        # qualified_predicate = 'biolink:contributes_to'
-        # subject_form_or_variant_qualifier = 'gain_of_function_variant_form'
-        return None
-    elif predicate == 'biolink:loss_of_function_contributes_to':
-        # predicate = 'biolink:affects'
-        # qualified_predicate = 'biolink:contributes_to'
-        # subject_form_or_variant_qualifier = 'loss_of_function_variant_form'
-        return None
-    return [sub, predicate, obj, qualified_predicate,
-            subject_aspect_qualifier, subject_direction_qualifier,
-            subject_part_qualifier, subject_form_or_variant_qualifier,
-            object_aspect_qualifier, object_direction_qualifier,
-            object_part_qualifier, object_form_or_variant_qualifier,
-            anatomical_context_qualifier,
-            row1['assertion_id'], row1['association_curie'], get_aggregate_score(relevant_rows),
-            supporting_study_results, supporting_publications_string, get_assertion_json(relevant_rows)]
+    return [sub, predicate_columns[0], obj, *predicate_columns[1:],
+            row1.assertion_id, row1.association_curie, get_aggregate_score(relevant_rows),
+            supporting_study_results, supporting_publications_string,
+            get_assertion_json(relevant_rows, fragment_cache)]
 
 
-def write_edges(edge_dict, nodes, output_filename):
+def write_edges(edge_dict, nodes, output_filename, operations_dict: dict = None, edge_metadata_dict: dict = None,
+                row_writers: list = None, fragment_cache=None):
+    """
+    Append the KGX edges for a chunk of assertions to a TSV file
+
+    :param edge_dict: the evidence rows grouped by assertion id
+    :param nodes: the curies that appear in the nodes KGX file (a dictionary of curies to categories if edge_metadata_dict is given)
+    :param output_filename: filepath for the output file
+    :param operations_dict: if given, a BTE operations dictionary that is updated with every edge written
+    :param edge_metadata_dict: if given, an edge metadata dictionary that is updated with every edge written
+    :param row_writers: writers that the chunk's edges are also written to with one write_rows call, e.g. a
+    columnar.ColumnarWriter (one row group per chunk) or a jsonl.JsonLinesWriter
+    :param fragment_cache: if given, a fragments.FragmentCache of the evidence JSON; the chunk's fragments are loaded
+    before it is formatted and the new ones are written after
+    """
     logging.info("Starting edge output")
     skipped_assertions = set([])
+    edges = []
+    if fragment_cache is not None:
+        fragment_cache.load(row.evidence_id for rows in edge_dict.values() for row in rows)
     with open(output_filename, 'a') as outfile:
         for assertion, rows in edge_dict.items():
             row1 = rows[0]
             # sub = row1['subject_uniprot'] if row1['subject_uniprot'] else row1['subject_curie']
             # obj = row1['object_uniprot'] if row1['object_uniprot'] else row1['object_curie']
-            sub = row1['subject_curie']
-            obj = row1['object_curie']
+            sub = row1.subject_curie
+            obj = row1.object_curie
             if sub not in nodes or obj not in nodes:
                 continue
-            predicates = set([row['predicate_curie'] for row in rows])
-            for predicate in predicates:
-                edge = get_edge(rows, predicate)
+            predicates = set([row.predicate_curie for row in rows])
+            for predicate in sorted(predicates):
+                edge = get_edge(rows, predicate, fragment_cache)
                 if not edge:
                     skipped_assertions.add(assertion)
                     continue
                 line = '\t'.join(str(val) for val in edge) + '\n'
                 throwaway_value = outfile.write(line)
+                if operations_dict is not None:
+                    update_operations(edge, operations_dict)
+                if edge_metadata_dict is not None:
+                    update_edge_metadata_from_categories(edge, edge_metadata_dict, nodes, PRIMARY_KNOWLEDGE_SOURCE)
+                if row_writers:
+                    edges.append(edge)
         outfile.flush()
+    for row_writer in row_writers or []:
+        row_writer.write_rows(edges)
+    if fragment_cache is not None:
+        fragment_cache.flush()
     logging.info(f'{len(skipped_assertions)} distinct assertions were skipped')
     logging.info("Edge output complete")
 
@@ -531,7 +879,17 @@ def decompress(infile, outfile):
             shutil.copyfileobj(gzfile, textfile)
 
 
-def generate_metadata(edgefile, nodefile, outdir):
+def generate_metadata(edgefile, nodefile, outdir, workers: int = None):
+    """
+    Generate the content metadata file from a KGX nodes file and edges file
+
+    An uncompressed edges file is scanned in parallel byte ranges (see scan.py); a gzipped one is read line by line.
+
+    :param edgefile: the edges filename (plain or gzip)
+    :param nodefile: the gzipped nodes filename
+    :param outdir: the directory for the content_metadata.json file
+    :param workers: the number of processes scanning an uncompressed edges file (the number of CPUs if not given)
+    """
     node_headers = ['id', 'name', 'category']
     edge_headers = ['subject', 'predicate', 'object', 'qualified_predicate',
                'subject_aspect_qualifier', 'subject_direction_qualifier',
@@ -555,10 +913,16 @@ def generate_metadata(edgefile, nodefile, outdir):
     normalized_nodes = get_normalized_nodes(curies)
 
     edge_metadata_dict = {}
-    with gzip.open(edgefile, 'rb') as infile:
-        for line in infile:
-            cols = line.decode().split('\t')
-            edge_metadata_dict = update_edge_metadata(cols, edge_metadata_dict, normalized_nodes, PRIMARY_KNOWLEDGE_SOURCE)
+    if not edgefile.endswith('.gz'):
+        import scan
+
+        reducer = functools.partial(update_edge_metadata, node_dict=normalized_nodes, source=PRIMARY_KNOWLEDGE_SOURCE)
+        edge_metadata_dict = scan.scan_file(edgefile, reducer, merge_edge_metadata, workers=workers)
+    else:
+        with gzip.open(edgefile, 'rb') as infile:
+            for line in infile:
+                cols = line.decode().split('\t')
+                edge_metadata_dict = update_edge_metadata(cols, edge_metadata_dict, normalized_nodes, PRIMARY_KNOWLEDGE_SOURCE)
     metadata_dict = {
         "nodes": node_metadata_dict,
         "edges": list(edge_metadata_dict.values())
@@ -566,5 +930,36 @@ def generate_metadata(edgefile, nodefile, outdir):
     logging.info("Writing metadata file")
     with open(metadata_file, 'w') as outfile:
         outfile.write(json.dumps(metadata_dict))
+
+
+def generate_metadata_from_partials(edge_metadata_files: list[str], nodefile: str, outdir: str) -> None:
+    """
+    Generate the content metadata file by merging the partial edge metadata files written by each edge shard,
+    without reading the edges file
+
+    :param edge_metadata_files: the partial edge metadata JSON files
+    :param nodefile: the gzipped KGX nodes file
+    :param outdir: the output directory for content_metadata.json
+    """
+    if not os.path.isdir(outdir):
+        os.mkdir(outdir)
+    metadata_file = os.path.join(outdir, "content_metadata.json")
+    node_metadata_dict = {}
+    with gzip.open(nodefile, 'rb') as infile:
+        for line in infile:
+            node_metadata_dict = update_node_metadata(line.decode().strip().split('\t'), node_metadata_dict,
+                                                      PRIMARY_KNOWLEDGE_SOURCE)
+    partials = []
+    for filename in edge_metadata_files:
+        with open(filename, 'r') as infile:
+            partials.append(json.load(infile))
+    edge_metadata_dict = merge_edge_metadata(partials)
+    metadata_dict = {
+        "nodes": node_metadata_dict,
+        "edges": list(edge_metadata_dict.values())
+    }
+    logging.info(f"Writing metadata file from {len(partials)} partial edge metadata files")
+    with open(metadata_file, 'w') as outfile:
+        outfile.write(json.dumps(metadata_dict))
     # logging.info("Creating tarball")
     # shutil.make_archive('targeted_assertions', 'gztar', root_dir=outdir)
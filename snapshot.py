@@ -0,0 +1,202 @@
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.orm import Session
+
+import db
+import targeted
+
+SNAPSHOT_PAGE_SIZE = 50000
+COMPLETE_SUFFIX = '.complete'  # the marker written next to a snapshot file once it is complete
+SNAPSHOT_SCHEMA = 'targeted'  # the snapshot is attached under this name, so the edge queries run on it unchanged
+# The columns of the source tables that the edge export reads
+SNAPSHOT_TABLES = {
+    'assertion': ('assertion_id', 'association_curie', 'subject_curie', 'object_curie'),
+    'evidence': ('evidence_id', 'assertion_id', 'predicate_curie', 'document_id', 'document_zone',
+                 'document_year_published', 'score', 'sentence', 'subject_span', 'object_span'),
+    'concept_idf': ('concept_curie', 'idf'),
+}
+SNAPSHOT_INDEXES = [
+    'CREATE UNIQUE INDEX assertion_id_index ON assertion (assertion_id)',
+    'CREATE INDEX evidence_assertion_index ON evidence (assertion_id, predicate_curie, score)',
+    'CREATE UNIQUE INDEX concept_idf_index ON concept_idf (concept_curie)',
+]
+
+
+def create_snapshot_tables(connection: sqlite3.Connection) -> None:
+    """
+    Create the empty snapshot tables, set up for a fast bulk load
+
+    :param connection: the connection to the new snapshot file
+    """
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    for table, columns in SNAPSHOT_TABLES.items():
+        connection.execute(f'CREATE TABLE {table} ({", ".join(columns)})')
+
+
+def copy_assertions(session: Session, connection: sqlite3.Connection, id_list: list[str]) -> tuple[int, int]:
+    """
+    Copy a page of exportable assertions and all of their evidence into the snapshot
+
+    All evidence is copied, including REF evidence, so that evidence counts match the database.
+
+    :param session: the database session
+    :param connection: the connection to the snapshot file
+    :param id_list: the assertion ids to copy
+    :returns the number of assertion and evidence rows copied
+    """
+    table_rows = {}
+    for table in ['assertion', 'evidence']:
+        query = text(f'SELECT {", ".join(SNAPSHOT_TABLES[table])} FROM targeted.{table} WHERE assertion_id IN :ids')
+        table_rows[table] = [tuple(row) for row in
+                             session.execute(query.bindparams(bindparam('ids', expanding=True)), {'ids': id_list})]
+    # both tables are read before either is written, so a page that is retried is not copied twice
+    for table, rows in table_rows.items():
+        connection.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" * len(SNAPSHOT_TABLES[table]))})', rows)
+    return len(table_rows['assertion']), len(table_rows['evidence'])
+
+
+def copy_concept_idf(session: Session, connection: sqlite3.Connection) -> int:
+    """
+    Copy the concept IDF table into the snapshot
+
+    :param session: the database session
+    :param connection: the connection to the snapshot file
+    :returns the number of rows copied
+    """
+    rows = [tuple(row) for row in session.execute(text('SELECT concept_curie, idf FROM concept_idf'))]
+    connection.executemany('INSERT INTO concept_idf VALUES (?, ?)', rows)
+    return len(rows)
+
+
+def finish_snapshot(connection: sqlite3.Connection) -> None:
+    """
+    Index the loaded snapshot tables and close the file
+
+    :param connection: the connection to the snapshot file
+    """
+    for index in SNAPSHOT_INDEXES:
+        connection.execute(index)
+    connection.execute('ANALYZE')
+    connection.commit()
+    connection.close()
+
+
+def create_snapshot(session: Session, filename: str, page_size: int = SNAPSHOT_PAGE_SIZE,
+                    retries: int = db.DEFAULT_RETRIES) -> dict[str, int]:  # pragma: no cover
+    """
+    Dump everything the edge export reads from the database into a local SQLite file
+
+    Only the assertions returned by targeted.get_assertion_ids are copied, so the feedback and curie exclusions are
+    already applied in the snapshot. They are read in pages that start after the last assertion id of the previous
+    page, so each page query only reads its own rows.
+
+    :param session: the database session
+    :param filename: the snapshot filename (replaced if it exists)
+    :param page_size: the number of assertions to copy at a time
+    :param retries: the number of times a page is retried after a transient database error
+    :returns the number of rows copied for each table
+    """
+    for path in [filename, filename + COMPLETE_SUFFIX]:
+        if os.path.exists(path):
+            os.remove(path)
+    connection = sqlite3.connect(filename)
+    create_snapshot_tables(connection)
+    counts = {'assertion': 0, 'evidence': 0, 'concept_idf': 0}
+    last_assertion_id = ''
+    while True:
+        id_list = db.run_with_retry(session, lambda: targeted.get_assertion_ids(session, limit=page_size,
+                                                                                 after=last_assertion_id),
+                                    retries=retries)
+        if not id_list:
+            break
+        assertion_count, evidence_count = db.run_with_retry(
+            session, lambda: copy_assertions(session, connection, id_list), retries=retries)
+        counts['assertion'] += assertion_count
+        counts['evidence'] += evidence_count
+        last_assertion_id = id_list[-1]
+        logging.info(f'Copied {counts["assertion"]} assertions and {counts["evidence"]} evidence records')
+    counts['concept_idf'] = db.run_with_retry(session, lambda: copy_concept_idf(session, connection), retries=retries)
+    finish_snapshot(connection)
+    mark_complete(filename)
+    logging.info(f'Snapshot {filename} created: {counts}')
+    return counts
+
+
+def mark_complete(filename: str) -> None:
+    """
+    Record that a snapshot file is complete, with its size
+
+    :param filename: the snapshot filename
+    """
+    with open(filename + COMPLETE_SUFFIX, 'w') as outfile:
+        outfile.write(str(os.path.getsize(filename)))
+
+
+def is_complete(filename: str) -> bool:
+    """
+    Determine whether a local snapshot file can be used, i.e. it was completely written and has not changed size since
+
+    :param filename: the snapshot filename
+    :returns true if the file and its marker exist and the size matches
+    """
+    try:
+        with open(filename + COMPLETE_SUFFIX, 'r') as infile:
+            return int(infile.read()) == os.path.getsize(filename)
+    except (OSError, ValueError):
+        return False
+
+
+def compress_snapshot(filename: str) -> str:
+    """
+    Compress a snapshot file for upload
+
+    :param filename: the snapshot filename
+    :returns the compressed filename
+    """
+    with open(filename, 'rb') as infile, gzip.open(f'{filename}.gz', 'wb', compresslevel=6) as outfile:
+        shutil.copyfileobj(infile, outfile)
+    return f'{filename}.gz'
+
+
+def decompress_snapshot(compressed_filename: str, filename: str) -> None:
+    """
+    Decompress a downloaded snapshot file
+
+    :param compressed_filename: the gzipped snapshot filename
+    :param filename: the snapshot filename to write, marked complete once it is fully written
+    """
+    if os.path.exists(filename + COMPLETE_SUFFIX):
+        os.remove(filename + COMPLETE_SUFFIX)
+    with gzip.open(compressed_filename, 'rb') as infile, open(filename, 'wb') as outfile:
+        shutil.copyfileobj(infile, outfile)
+    mark_complete(filename)
+
+
+def open_snapshot(filename: str, pool_size: int = db.DEFAULT_POOL_SIZE):
+    """
+    Open a snapshot file with the same session interface as the database
+
+    The snapshot is attached as the targeted schema, so the window and heap top-k strategies and the IDF lookup run
+    against it unchanged. SQLite does not support the lateral strategy.
+
+    :param filename: the snapshot filename
+    :param pool_size: the number of pooled connections (one per concurrent shard)
+    :returns a thread-local session registry, like exporter.init_db
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f'Snapshot {filename} does not exist')
+    engine = db.create_db_engine('sqlite://', pool_size=pool_size, pool_pre_ping=False,
+                                 connect_args={'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def attach_snapshot(dbapi_connection, connection_record):
+        dbapi_connection.execute(f'ATTACH DATABASE ? AS {SNAPSHOT_SCHEMA}', (filename,))
+
+    return db.create_session_factory(engine)
+
@@ -1,16 +1,29 @@
 import gzip
+import hashlib
+import heapq
+import itertools
+import json
 import logging
 import math
+import time
 
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from sqlalchemy.orm import Session
 from sqlalchemy import Column, String, Integer
 from sqlalchemy.orm import declarative_base
 
+import chunking
+import db
+import querylog
 import services
 Model = declarative_base(name='Model')
 
 ROW_BATCH_SIZE = 10000
+SUPERSEDE_BATCH_SIZE = 10000
+RAW_FETCH_SIZE = 5000
+# How the top edge_limit evidence records of each assertion are selected: a LATERAL join, a ROW_NUMBER() window, or
+# a heap over all of the assertion's evidence on the client
+TOP_K_STRATEGIES = ('lateral', 'window', 'heap')
 HUMAN_TAXON = 'NCBITaxon:9606'
 ORIGINAL_KNOWLEDGE_SOURCE = "infores:text-mining-provider-targeted"
 EXCLUDED_FIG_CURIES = ['DRUGBANK:DB10633', 'PR:000006421', 'PR:000008147', 'PR:000009005', 'PR:000031137',
@@ -80,17 +93,20 @@ def get_node_data(session: Session, use_uniprot: bool = False) -> (list[str], di
     return curies, normalized_nodes
 
 
-def write_nodes(curies: list[str], normalize_dict: dict[str, dict], output_filename: str) -> dict:
+def write_nodes(curies: list[str], normalize_dict: dict[str, dict], output_filename: str,
+                row_writers: list = None) -> dict:
     """
     Output the node data to a gzipped TSV file according to KGX node format.
 
     :param curies: the list of node curies.
     :param normalize_dict: the dictionary containing normalization information for the node curies.
     :param output_filename: filepath for the output file.
+    :param row_writers: writers that the nodes are also written to (see open_row_writers).
     :returns a metadata dictionary for the nodes that were written to file.
     """
     logging.info("Starting node output")
     metadata_dict = {}
+    nodes = []
     with gzip.open(output_filename, 'wb') as outfile:
         for node in services.get_kgx_nodes(curies, normalize_dict):
             if len(node) == 0:
@@ -98,17 +114,25 @@ def write_nodes(curies: list[str], normalize_dict: dict[str, dict], output_filen
             line = '\t'.join(node) + '\n'
             outfile.write(line.encode('utf-8'))
             metadata_dict = services.update_node_metadata(node, metadata_dict, ORIGINAL_KNOWLEDGE_SOURCE)
+            if row_writers:
+                nodes.append(node)
+    for row_writer in row_writers or []:
+        row_writer.write_rows(nodes)
     logging.info('Node output complete')
     return metadata_dict
 
 
-def get_assertion_ids(session, limit=600000, offset=0):
+def get_assertion_ids(session, limit=600000, offset=0, query_recorder: querylog.QueryRecorder = None,
+                      after: str = None):
     """
     Get the assertion ids to be exported in this run
 
     :param session: the database session
     :param limit: limit for assertion query
     :param offset: offset for assertion query
+    :param query_recorder: if given, the query is written to this query log
+    :param after: if given, only assertion ids greater than this one are returned (keyset paging, used with offset 0
+    so that reading every page does not rescan the skipped rows)
     :returns a list of assertion ids
     """
     id_query = text('SELECT assertion_id FROM targeted.assertion WHERE assertion_id NOT IN '
@@ -120,18 +144,40 @@ def get_assertion_ids(session, limit=600000, offset=0):
                     'WHERE ef.prompt_text = \'Assertion Correct\' AND ef.response = 0 AND ev.version = 2) '
                     'AND subject_curie NOT IN :ex1 AND object_curie NOT IN :ex2 '
                     'AND subject_curie NOT IN :ex3 AND object_curie NOT IN :ex4 '
+                    + ('AND assertion_id > :after ' if after is not None else '') +
                     'ORDER BY assertion_id '
                     'LIMIT :limit OFFSET :offset'
                     )
-    return [row[0] for row in session.execute(id_query, {
+    params = {
         'ex1': EXCLUDED_FIG_CURIES,
         'ex2': EXCLUDED_FIG_CURIES,
         'ex3': EXCLUDE_LIST,
         'ex4': EXCLUDE_LIST,
         'limit': limit,
         'offset': offset
-    })]
+    }
+    if after is not None:
+        params['after'] = after
+    with querylog.capture(query_recorder, 'assertion_ids', session, id_query, params) as query:
+        return [row[0] for row in query.fetch(session.execute(id_query, params))]
+
+
+def get_snapshot_assertion_ids(session, limit=600000, offset=0, query_recorder: querylog.QueryRecorder = None):
+    """
+    Get the assertion ids to be exported in this run from a local snapshot (see snapshot.py)
 
+    The snapshot only holds exportable assertions, so no exclusions are needed.
+
+    :param session: a snapshot session
+    :param limit: limit for assertion query
+    :param offset: offset for assertion query
+    :param query_recorder: if given, the query is written to this query log
+    :returns a list of assertion ids, in the same order as get_assertion_ids
+    """
+    id_query = text('SELECT assertion_id FROM targeted.assertion ORDER BY assertion_id LIMIT :limit OFFSET :offset')
+    params = {'limit': limit, 'offset': offset}
+    with querylog.capture(query_recorder, 'snapshot_assertion_ids', session, id_query, params) as query:
+        return [row[0] for row in query.fetch(session.execute(id_query, params))]
 
 
 def get_assertion_count(session):
@@ -161,102 +207,302 @@ def get_assertion_count(session):
     })]
 
 
-def get_edge_data(session: Session, id_list, chunk_size=1000, edge_limit=5) -> list[str]:
+def get_idf_weights(session: Session) -> dict[str, float]:
+    """
+    Load the concept IDF table once, as weights ready to be used in evidence scores
+
+    :param session: the database session
+    :returns a dictionary of concept curies to log10(idf); concepts with a missing or zero IDF are left out
+    """
+    weights = {}
+    for curie, idf in session.execute(text('SELECT concept_curie, idf FROM concept_idf')):
+        weight = services.get_idf_weight(idf)
+        if weight is not None:
+            weights[curie] = weight
+    logging.info(f'Loaded IDF weights for {len(weights)} concepts')
+    return weights
+
+
+def get_edge_query(top_k: str = 'lateral', edge_limit: int = 5):
+    """
+    Build the edge query for a top-k evidence selection strategy
+
+    :param top_k: one of TOP_K_STRATEGIES
+    :param edge_limit: the maximum number of evidence records per assertion (0 is no limit)
+    :returns the text query, with an expanding :ids parameter and, when the database applies the limit, :edge_limit
+    """
+    columns = ('SELECT a.assertion_id, e.evidence_id, a.association_curie, e.predicate_curie, '
+               'a.subject_curie, a.object_curie, '
+               'e.document_id, e.document_zone, e.document_year_published, e.score, '
+               'e.sentence, e.subject_span, e.object_span, '
+               '(SELECT COUNT(1) FROM targeted.evidence t2 '
+               'WHERE t2.assertion_id = a.assertion_id AND t2.predicate_curie = e.predicate_curie) AS evidence_count ')
+    if top_k == 'lateral':
+        limit = ' LIMIT :edge_limit' if edge_limit > 0 else ''
+        query = columns + (
+            'FROM targeted.assertion a INNER JOIN LATERAL '
+            '(SELECT * FROM targeted.evidence te WHERE te.assertion_id = a.assertion_id AND te.document_zone <> \'REF\' '
+            f'ORDER BY te.score DESC{limit}) AS e ON a.assertion_id = e.assertion_id '
+            'WHERE a.assertion_id IN :ids '
+            'ORDER BY a.assertion_id')
+    elif top_k == 'window':
+        rank = ' AND e.evidence_rank <= :edge_limit' if edge_limit > 0 else ''
+        query = columns + (
+            'FROM targeted.assertion a INNER JOIN '
+            '(SELECT te.*, ROW_NUMBER() OVER (PARTITION BY te.assertion_id ORDER BY te.score DESC) AS evidence_rank '
+            'FROM targeted.evidence te WHERE te.assertion_id IN :ids AND te.document_zone <> \'REF\') AS e '
+            'ON a.assertion_id = e.assertion_id '
+            f'WHERE a.assertion_id IN :ids{rank} '
+            'ORDER BY a.assertion_id, e.evidence_rank')
+    elif top_k == 'heap':
+        query = columns + (
+            'FROM targeted.assertion a INNER JOIN targeted.evidence e ON a.assertion_id = e.assertion_id '
+            'WHERE a.assertion_id IN :ids AND e.document_zone <> \'REF\' '
+            'ORDER BY a.assertion_id')
+    else:
+        raise ValueError(f'Unknown top-k strategy "{top_k}", expected one of {", ".join(TOP_K_STRATEGIES)}')
+    return text(query).bindparams(bindparam('ids', expanding=True))
+
+
+_ASSERTION_POSITION = services.EDGE_QUERY_FIELDS.index('assertion_id')
+_SCORE_POSITION = services.EDGE_QUERY_FIELDS.index('score')
+_PREDICATE_POSITION = services.EDGE_QUERY_FIELDS.index('predicate_curie')
+
+
+def select_top_evidence(rows, edge_limit: int = 5):
+    """
+    Keep the highest scoring evidence rows of each assertion from a stream of rows ordered by assertion id
+
+    Only edge_limit rows per assertion are held at a time, so the stream can be much larger than the output.
+
+    :param rows: the edge query rows, in EDGE_QUERY_FIELDS order and grouped by assertion id
+    :param edge_limit: the maximum number of evidence records per assertion (0 is no limit)
+    :returns an iterator of the selected rows, highest score first within each assertion
+    """
+    score = lambda row: float(row[_SCORE_POSITION])
+    for _, assertion_rows in itertools.groupby(rows, key=lambda row: row[_ASSERTION_POSITION]):
+        if edge_limit > 0:
+            yield from heapq.nlargest(edge_limit, assertion_rows, key=score)
+        else:
+            yield from sorted(assertion_rows, key=score, reverse=True)
+
+
+def get_edge_data(session: Session, id_list, chunk_size=1000, edge_limit=5, raw_fetch: bool = False,
+                  retries: int = db.DEFAULT_RETRIES, idf_weights: dict = None,
+                  top_k: str = 'lateral', chunk_sizer: chunking.AdaptiveChunkSizer = None,
+                  query_recorder: querylog.QueryRecorder = None) -> list[services.EdgeRecord]:
     """
     Generate edge data for the given list of ids
     :param session: the database session
     :param id_list: the list of assertion ids
     :param chunk_size: the number of edge rows to yield at a time
-    :param edge_limit: the maximum number of evidence records to return for each edge
-    :returns edge data for up to chunk_size assertion ids from id_list with up to edge_limit supporting evidence records
+    :param edge_limit: the maximum number of evidence records to return for each edge (0 is no limit)
+    :param raw_fetch: whether to fetch the rows through the DB-API cursor instead of as SQLAlchemy Rows
+    :param retries: the number of times a chunk is retried after a transient database error
+    :param idf_weights: the concept IDF weights from get_idf_weights (loaded here if not given)
+    :param top_k: the strategy used to select the top evidence records, one of TOP_K_STRATEGIES
+    :param chunk_sizer: if given, chooses the size of each chunk from the cost of the previous ones (chunk_size is
+    then only the size of the first chunk)
+    :param query_recorder: if given, the query of each chunk is written to this query log
+    :returns lists of EdgeRecords for up to chunk_size assertion ids from id_list with up to edge_limit supporting evidence records
     """
-    logging.info(f'\nStarting edge data gathering\nChunk Size: {chunk_size}\nEdge Limit: {edge_limit}\n')
+    logging.info(f'\nStarting edge data gathering\nChunk Size: {chunk_size}\nEdge Limit: {edge_limit}\n'
+                 f'Top-k Strategy: {top_k}\n')
     logging.info(f'Total Assertions: {len(id_list)}.')
     logging.info(f'Partition count: {math.ceil(len(id_list) / chunk_size)}')
-    main_query = text(
-        'SELECT a.assertion_id, e.evidence_id, a.association_curie, e.predicate_curie, '
-        'a.subject_curie, a.object_curie, '
-        'si.idf AS subject_idf, oi.idf AS object_idf, '
-        'e.document_id, e.document_zone, e.document_year_published, e.score, '
-        'e.sentence, e.subject_span, e.subject_covered_text, e.object_span, e.object_covered_text, '
-        '(SELECT COUNT(1) FROM targeted.evidence t2 '
-        'WHERE t2.assertion_id = a.assertion_id AND t2.predicate_curie = e.predicate_curie) AS evidence_count '
-        'FROM targeted.assertion a INNER JOIN LATERAL '
-        '(SELECT * FROM targeted.evidence te WHERE te.assertion_id = a.assertion_id AND te.document_zone <> \'REF\' '
-        f'ORDER BY te.score DESC LIMIT {edge_limit}) AS e ON a.assertion_id = e.assertion_id '
-        'LEFT JOIN concept_idf si ON a.subject_curie = si.concept_curie '
-        'LEFT JOIN concept_idf oi ON a.object_curie = oi.concept_curie '
-        'WHERE a.assertion_id IN :ids '
-        'ORDER BY a.assertion_id'
-    )
-    for i in range(0, len(id_list), chunk_size):
-        slice_end = i + chunk_size if i + chunk_size < len(id_list) else len(id_list)
+    main_query = get_edge_query(top_k, edge_limit)
+    if idf_weights is None:
+        idf_weights = get_idf_weights(session)
+    i = 0
+    while i < len(id_list):
+        size = chunk_sizer.next_size() if chunk_sizer else chunk_size
+        slice_end = i + size if i + size < len(id_list) else len(id_list)
         logging.info(f'Working on slice [{i}:{slice_end}]')
-        yield [row for row in session.execute(main_query, {'ids': id_list[i:slice_end]})]
+        params = {'ids': id_list[i:slice_end]}
+        if top_k != 'heap' and edge_limit > 0:
+            params['edge_limit'] = edge_limit
+
+        def fetch_chunk():
+            start = time.perf_counter()
+            with querylog.capture(query_recorder, 'edge_data', session, main_query, params, top_k=top_k,
+                                  raw_fetch=raw_fetch, assertions=slice_end - i) as query:
+                if raw_fetch:
+                    rows = query.fetch(fetch_raw_rows(session, main_query, params))
+                else:
+                    rows = query.fetch(session.execute(main_query, params))
+                if top_k == 'heap':
+                    rows = select_top_evidence(rows, edge_limit)
+                strings = {}
+                # evidence for predicates that are not exported still counts towards the top k of its assertion, so
+                # it is dropped after the selection but before any grouping or scoring
+                records = [services.make_edge_record(row, strings, idf_weights) for row in rows
+                           if row[_PREDICATE_POSITION] not in services.DROPPED_PREDICATES]
+            return records, time.perf_counter() - start
+
+        # only the attempt that succeeded is timed, so failed attempts and retry delays do not shrink the chunks
+        rows, seconds = db.run_with_retry(session, fetch_chunk, retries=retries)
+        if chunk_sizer:
+            chunk_sizer.observe(slice_end - i, len(rows), sum(chunking.estimate_record_bytes(row) for row in rows),
+                                seconds)
+        yield rows
+        i = slice_end
+
+
+def fetch_raw_rows(session: Session, query, params: dict, fetch_size: int = RAW_FETCH_SIZE):
+    """
+    Execute a query directly on the DB-API cursor of the session's connection, bypassing SQLAlchemy result processing
+    :param session: the database session
+    :param query: the text query
+    :param params: the bind parameter values
+    :param fetch_size: the number of rows to fetch from the cursor at a time
+    :returns an iterator of plain row tuples
+    """
+    connection = session.connection()
+    statement, parameters = db.compile_query(connection, query, params)
+    cursor = connection.connection.cursor()
+    try:
+        db.execute_cursor(connection, cursor, statement, parameters)
+        rows = cursor.fetchmany(fetch_size)
+        while rows:
+            yield from rows
+            rows = cursor.fetchmany(fetch_size)
+    except connection.dialect.dbapi.Error as error:
+        db.raise_dbapi_error(connection, error, statement, parameters, cursor, getattr(session, 'router', None))
+    finally:
+        if not connection.invalidated:  # raise_dbapi_error closed the cursor before invalidating the connection
+            cursor.close()
+
+
+def get_pmc_index(session: Session) -> dict[str, tuple]:
+    """
+    Load the PubMed to PMC document mapping into memory
+    :param session: the database session
+    :returns a dictionary of PubMed document IDs to the PMC document IDs that supersede them
+    """
+    pmc_index = {}
+    for row in session.execute(text('SELECT pmid, pmcid FROM pubmed_to_pmc')):
+        pmc_index[row[0]] = pmc_index.get(row[0], ()) + (row[1],)
+    logging.info(f'Loaded {len(pmc_index)} PubMed to PMC mappings')
+    return pmc_index
 
 
-def get_superseded_chunk(session: Session) -> list[tuple[str, str]]:
+def get_supersession_key(document_id: str, subject_curie: str, object_curie: str, sentence: str,
+                         document_zone: str, predicate_curie: str) -> bytes:
     """
-    Gets up to 10000 evidence records where the PubMed document is superseded by a PMC document
+    Get a compact key identifying a piece of evidence within a document, for matching PubMed and PMC evidence
+    :returns a 16 byte digest of the fields
+    """
+    key = '\x1f'.join([document_id, subject_curie, object_curie, sentence, document_zone, str(predicate_curie)])
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+def get_supersession_page(session: Session, query, last_evidence_id: str, page_size: int, name: str = 'supersession',
+                          query_recorder: querylog.QueryRecorder = None) -> list:
+    """
+    Get the next page of evidence rows for supersede_evidence
+    :param session: the database session
+    :param query: the page query, with :last and :limit parameters
+    :param last_evidence_id: the last evidence_id of the previous page
+    :param page_size: the number of evidence records per page
+    :param name: the name of the query in the query log
+    :param query_recorder: if given, the query is written to this query log
+    :returns the rows of the page
+    """
+    params = {'last': last_evidence_id, 'limit': page_size}
+    with querylog.capture(query_recorder, name, session, query, params, page_size=page_size) as captured:
+        return [row for row in captured.fetch(session.execute(query, params))]
+
+
+def supersede_evidence(session: Session, batch_size: int = SUPERSEDE_BATCH_SIZE, start_after: str = '',
+                       query_recorder: querylog.QueryRecorder = None) -> int:
+    """
+    Set superseded_by for every PubMed evidence record that also appears (same subject, object, sentence, zone and
+    predicate) in the PMC version of the document, in one pass over the evidence table.
+
+    The PMC evidence is indexed in memory first, then the unresolved PubMed evidence is read in evidence_id order and
+    updated in batches. Each batch is committed, so an interrupted run can simply be restarted.
     :param session: the database session
-    :returns a list of tuples with the evidence record id and the PMC document ID that supersedes it.
-    """
-    logging.info("get_superseded_chunk")
-    query_text = text("""
-    SELECT e1.evidence_id, e2.document_id
-    FROM assertion a1 
-        INNER JOIN evidence e1 ON (e1.assertion_id = a1.assertion_id) 
-        INNER JOIN top_evidence_scores es1 ON (es1.evidence_id = e1.evidence_id)
-        INNER JOIN pubmed_to_pmc t ON t.pmid = e1.document_id
-        INNER JOIN evidence e2 ON (e2.document_id = t.pmcid)
-        INNER JOIN top_evidence_scores es2 ON (es2.evidence_id = e2.evidence_id)
-        INNER JOIN assertion a2 ON (a2.assertion_id = e2.assertion_id)
-    WHERE 
-        e1.document_id LIKE 'PMID%' 
-        AND e1.superseded_by IS NULL
-        AND e1.document_id IN (SELECT pmid FROM pubmed_to_pmc)
-        AND e1.sentence = e2.sentence
-        AND e1.document_zone = e2.document_zone
-        AND a1.subject_curie = a2.subject_curie
-        AND a1.object_curie = a2.object_curie
-        AND es1.predicate_curie = es2.predicate_curie
-    LIMIT 10000
-    """)
-    eids = set([])
-    ids_list = []
-    for row in session.execute(query_text):
-        eid = row['evidence_id']
-        did = row['document_id']
-        if eid not in eids:
-            ids_list.append((eid, did))
-            eids.add(eid)
-    logging.info(len(ids_list))
-    return ids_list
-
-
-def update_superseded_by(session: Session, ids_list: list[tuple[str, str]]) -> None:
-    logging.info("starting update function")
+    :param batch_size: the number of evidence records to read per query and to update per statement
+    :param start_after: only consider PubMed evidence with a greater evidence_id
+    :param query_recorder: if given, the page queries are written to this query log
+    :returns the number of evidence records updated
+    """
+    pmc_index = get_pmc_index(session)
+    pmc_documents = set(pmcid for pmcids in pmc_index.values() for pmcid in pmcids)
+    page_template = (
+        'SELECT e.evidence_id, e.document_id, e.sentence, e.document_zone, '
+        'a.subject_curie, a.object_curie, es.predicate_curie '
+        'FROM (SELECT evidence_id, assertion_id, document_id, sentence, document_zone FROM evidence '
+        'WHERE evidence_id > :last AND {condition} ORDER BY evidence_id LIMIT :limit) e '
+        'LEFT JOIN assertion a ON a.assertion_id = e.assertion_id '
+        'LEFT JOIN top_evidence_scores es ON es.evidence_id = e.evidence_id '
+        'ORDER BY e.evidence_id'
+    )
+    pmc_query = text(page_template.format(condition='document_id IN (SELECT pmcid FROM pubmed_to_pmc)'))
+    pubmed_query = text(page_template.format(
+        condition='document_id LIKE \'PMID%\' AND superseded_by IS NULL '
+                  'AND document_id IN (SELECT pmid FROM pubmed_to_pmc)'))
+    update_query = text('UPDATE evidence SET superseded_by = :superseded_by WHERE evidence_id = :evidence_id')
+
+    logging.info('Indexing PMC evidence')
+    pmc_keys = set([])
+    last_evidence_id = ''
+    rows = get_supersession_page(session, pmc_query, last_evidence_id, batch_size, 'supersession_pmc', query_recorder)
+    while rows:
+        for row in rows:
+            # evidence without a score row has no predicate to match on (it is left joined so the paging goes on)
+            if row.document_id in pmc_documents and row.subject_curie is not None \
+                    and row.predicate_curie is not None:
+                pmc_keys.add(get_supersession_key(row.document_id, row.subject_curie, row.object_curie,
+                                                  row.sentence, row.document_zone, row.predicate_curie))
+        last_evidence_id = rows[-1].evidence_id
+        rows = get_supersession_page(session, pmc_query, last_evidence_id, batch_size, 'supersession_pmc', query_recorder)
+    logging.info(f'Indexed {len(pmc_keys)} PMC evidence keys')
+
+    scanned = 0
+    updated = 0
     mappings = []
-    for ids in ids_list:
-        mappings.append({
-            'evidence_id': ids[0],
-            'superseded_by': ids[1]
-        })
-    # print(mappings)
-    logging.info('about to update: ' + str(len(mappings)))
-    session.bulk_update_mappings(Evidence, mappings)
-    logging.info('bulk update created')
-    session.commit()
-    logging.info('update committed')
+    last_evidence_id = start_after
+    rows = get_supersession_page(session, pubmed_query, last_evidence_id, batch_size, 'supersession_pubmed', query_recorder)
+    while rows:
+        for row in rows:
+            if row.evidence_id != last_evidence_id:
+                scanned += 1
+                last_evidence_id = row.evidence_id
+                matched = False
+            if matched or row.subject_curie is None or row.predicate_curie is None:
+                continue
+            for pmcid in pmc_index.get(row.document_id, ()):
+                if get_supersession_key(pmcid, row.subject_curie, row.object_curie, row.sentence,
+                                        row.document_zone, row.predicate_curie) in pmc_keys:
+                    mappings.append({'evidence_id': row.evidence_id, 'superseded_by': pmcid})
+                    matched = True
+                    break
+        if len(mappings) >= batch_size:
+            session.execute(update_query, mappings)
+            session.commit()
+            updated += len(mappings)
+            mappings = []
+        logging.info(f'Scanned {scanned} PubMed evidence records, updated {updated} (last evidence_id: {last_evidence_id})')
+        rows = get_supersession_page(session, pubmed_query, last_evidence_id, batch_size, 'supersession_pubmed', query_recorder)
+    if mappings:
+        session.execute(update_query, mappings)
+        session.commit()
+        updated += len(mappings)
+    logging.info(f'Supersession complete: scanned {scanned} PubMed evidence records, updated {updated}')
+    return updated
 
 
 # This is a simple transformation to group all evidence that belongs to the same assertion and make lookups possible.
-def create_edge_dict(edge_data):
+def create_edge_dict(edge_data, idf_weights: dict = None):
+    strings = {}
     edge_dict = {}
     for datum in edge_data:
-        if datum['assertion_id'] not in edge_dict:
-            edge_dict[datum['assertion_id']] = []
-        edge_dict[datum['assertion_id']].append(datum)  # This is repetitive, but simpler. May need to change later.
+        if not isinstance(datum, services.EdgeRecord):
+            datum = services.make_edge_record(datum, strings, idf_weights)
+        if datum.assertion_id not in edge_dict:
+            edge_dict[datum.assertion_id] = []
+        edge_dict[datum.assertion_id].append(datum)  # This is repetitive, but simpler. May need to change later.
     logging.debug(f'{len(edge_dict.keys())} distinct assertions')
     return edge_dict
 
@@ -269,8 +515,8 @@ def uniquify_edge_dict(edge_dict):
         index_dict = {}
         score_dict = {}
         for ev in evidence_list:
-            composite_key = f"{ev['assertion_id']}_{ev['evidence_id']}_{ev['document_id']}_{ev['sentence']}"
-            score = float(ev['score'])
+            composite_key = f"{ev.assertion_id}_{ev.evidence_id}_{ev.document_id}_{ev.sentence}"
+            score = float(ev.score)
             if composite_key in index_dict.keys() and composite_key in score_dict.keys():
                 if score > score_dict[composite_key]:
                     index_dict[composite_key] = evidence_list.index(ev)
@@ -284,36 +530,140 @@ def uniquify_edge_dict(edge_dict):
         edge_dict[assertion_id] = new_evidence_list
 
 
-def export_nodes(session: Session, bucket: str, blob_prefix: str):
+def open_row_writers(basename: str, nodes: bool = False, columnar: bool = False, jsonl: bool = False) -> list[tuple]:
+    """
+    Open the optional files that the KGX rows are written to alongside the TSV file
+
+    :param basename: the filename without its extension (e.g. edges_0_1000)
+    :param nodes: whether the rows are nodes instead of edges
+    :param columnar: whether to write a Parquet file (needs pyarrow)
+    :param jsonl: whether to write a gzipped KGX JSON Lines file
+    :returns a list of (writer, filename, blob name under the blob prefix) tuples; edge shard files are uploaded under
+    columnar.SHARD_PREFIX or jsonl.SHARD_PREFIX so the merge target can list them apart from the TSV shards
+    """
+    writers = []
+    if not columnar and not jsonl:
+        return writers
+    import columnar as columnar_output
+
+    columns = columnar_output.NODE_COLUMNS if nodes else columnar_output.EDGE_COLUMNS
+    if columnar:
+        filename = f'{basename}.parquet'
+        writers.append((columnar_output.ColumnarWriter(filename, columns), filename,
+                        filename if nodes else f'{columnar_output.SHARD_PREFIX}{filename}'))
+    if jsonl:
+        import jsonl as jsonl_output
+
+        filename = f'{basename}.jsonl.gz'
+        writers.append((jsonl_output.JsonLinesWriter(filename, columns), filename,
+                        filename if nodes else f'{jsonl_output.SHARD_PREFIX}{filename}'))
+    return writers
+
+
+def close_writers(writers: list[tuple]) -> None:
+    """
+    Close the files opened by open_row_writers without uploading them (e.g. when the export failed); closing them again
+    does nothing
+
+    :param writers: the (writer, filename, blob name) tuples
+    """
+    for writer, _, _ in writers:
+        writer.close()
+
+
+def close_row_writers(writers: list[tuple], bucket: str, blob_prefix: str) -> None:
+    """
+    Close the files opened by open_row_writers and upload them
+
+    :param writers: the (writer, filename, blob name) tuples
+    :param bucket: the output GCP bucket name
+    :param blob_prefix: the directory prefix for the uploaded files
+    """
+    for writer, filename, blob_name in writers:
+        writer.close()
+        services.upload_to_gcp(bucket, filename, f'{blob_prefix}{blob_name}')
+
+
+def export_nodes(session: Session, bucket: str, blob_prefix: str, columnar: bool = False, jsonl: bool = False):
     logging.info("Exporting Nodes")
     (node_curies, normal_dict) = get_node_data(session, use_uniprot=True)
-    node_metadata = write_nodes(node_curies, normal_dict, 'nodes.tsv.gz')
+    writers = open_row_writers('nodes', nodes=True, columnar=columnar, jsonl=jsonl)
+    try:
+        node_metadata = write_nodes(node_curies, normal_dict, 'nodes.tsv.gz', [writer for writer, _, _ in writers])
+    finally:
+        close_writers(writers)
     services.upload_to_gcp(bucket, 'nodes.tsv.gz', f'{blob_prefix}nodes.tsv.gz')
+    close_row_writers(writers, bucket, blob_prefix)
 
 
-def export_edges(session: Session, nodes: set, bucket: str, blob_prefix: str,
+def export_edges(session: Session, nodes: dict, bucket: str, blob_prefix: str,
                  assertion_start: int = 0, assertion_limit: int = 600000,
-                 chunk_size=100, edge_limit: int = 5) -> None:  # pragma: no cover
+                 chunk_size=100, edge_limit: int = 5, raw_fetch: bool = False,
+                 retries: int = db.DEFAULT_RETRIES, idf_weights: dict = None,
+                 top_k: str = 'lateral', from_snapshot: bool = False, memory_budget: int = None,
+                 target_seconds: float = chunking.DEFAULT_TARGET_SECONDS,
+                 concurrency: int = 1, columnar: bool = False, jsonl: bool = False,
+                 query_recorder: querylog.QueryRecorder = None, fragment_cache=None) -> None:  # pragma: no cover
     """
     Create and upload the node and edge KGX files for targeted assertions.
 
     :param session: the database session
-    :param nodes: a set of curies that appear in the nodes KGX file
+    :param nodes: a dictionary of the curies that appear in the nodes KGX file to their categories
     :param bucket: the output GCP bucket name
     :param blob_prefix: the directory prefix for the uploaded files
     :param assertion_start: offset for assertion query
     :param assertion_limit: limit for assertion query
     :param chunk_size: the number of assertions to process at a time
     :param edge_limit: the maximum number of supporting study results per edge to include in the JSON blob (0 is no limit)
+    :param raw_fetch: whether to fetch edge rows through the DB-API cursor instead of SQLAlchemy result rows
+    :param retries: the number of times a chunk is retried after a transient database error
+    :param idf_weights: the concept IDF weights from get_idf_weights (loaded once for the shard if not given)
+    :param top_k: the strategy used to select the top evidence records, one of TOP_K_STRATEGIES
+    :param from_snapshot: whether the session reads from a local snapshot instead of the database
+    :param memory_budget: if given, the chunk size adapts to keep the process under this many bytes of RSS
+    :param target_seconds: the query time per chunk that the adaptive chunk size aims for
+    :param concurrency: the number of shards exporting at the same time in this process (they share memory_budget)
+    :param columnar: whether to also write the edges to a Parquet file, one row group per chunk
+    :param jsonl: whether to also write the edges to a gzipped KGX JSON Lines file
+    :param query_recorder: if given, the assertion id and edge queries are written to this query log
+    :param fragment_cache: if given, a fragments.FragmentCache that the evidence JSON is taken from and added to
     """
     output_filename = f'edges_{assertion_start}_{assertion_start + assertion_limit}.tsv'
-    id_list = get_assertion_ids(session, limit=assertion_limit, offset=assertion_start)
-    for rows in get_edge_data(session, id_list, chunk_size, edge_limit):
-        logging.info(f'Processing the next {len(rows)} rows')
-        edge_dict = create_edge_dict(rows)
-        uniquify_edge_dict(edge_dict)
-        services.write_edges(edge_dict, nodes, output_filename)
+    operations_filename = f'operations_{assertion_start}_{assertion_start + assertion_limit}.json'
+    edge_metadata_filename = f'edge_metadata_{assertion_start}_{assertion_start + assertion_limit}.json'
+    operations_dict = {}
+    edge_metadata_dict = {}
+    if from_snapshot:
+        id_list = get_snapshot_assertion_ids(session, limit=assertion_limit, offset=assertion_start,
+                                             query_recorder=query_recorder)
+    else:
+        id_list = get_assertion_ids(session, limit=assertion_limit, offset=assertion_start,
+                                    query_recorder=query_recorder)
+    writers = open_row_writers(f'edges_{assertion_start}_{assertion_start + assertion_limit}', columnar=columnar,
+                               jsonl=jsonl)
+    row_writers = [writer for writer, _, _ in writers]
+    chunk_sizer = None
+    if memory_budget:
+        chunk_sizer = chunking.AdaptiveChunkSizer(chunk_size, memory_budget, target_seconds, concurrency=concurrency)
+    try:
+        for rows in get_edge_data(session, id_list, chunk_size, edge_limit, raw_fetch, retries, idf_weights, top_k,
+                                  chunk_sizer, query_recorder):
+            logging.info(f'Processing the next {len(rows)} rows')
+            edge_dict = create_edge_dict(rows)
+            uniquify_edge_dict(edge_dict)
+            services.score_edge_dict(edge_dict)
+            services.write_edges(edge_dict, nodes, output_filename, operations_dict, edge_metadata_dict, row_writers,
+                                 fragment_cache)
+    finally:
+        close_writers(writers)
+    with open(operations_filename, 'w') as outfile:
+        outfile.write(json.dumps(operations_dict))
+    with open(edge_metadata_filename, 'w') as outfile:
+        outfile.write(json.dumps(edge_metadata_dict))
     services.upload_to_gcp(bucket, output_filename, f'{blob_prefix}{output_filename}')
+    services.upload_to_gcp(bucket, operations_filename, f'{blob_prefix}{operations_filename}')
+    services.upload_to_gcp(bucket, edge_metadata_filename, f'{blob_prefix}{edge_metadata_filename}')
+    close_row_writers(writers, bucket, blob_prefix)
 
 def export_assertion_count(session: Session, bucket: str, blob_prefix: str) -> None:
     """
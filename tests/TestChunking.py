@@ -0,0 +1,41 @@
+import os
+import unittest
+import chunking
+
+MIB = 1024 * 1024
+
+
+class ChunkingTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def test_get_rss_bytes(self):
+        self.assertGreater(chunking.get_rss_bytes(), MIB)
+
+    def test_grows_when_cheap(self):
+        sizer = chunking.AdaptiveChunkSizer(100, memory_budget=512 * MIB, target_seconds=10)
+        self.assertEqual(sizer.observe(100, 500, 500 * 1000, 0.5, rss=100 * MIB), 200)
+        self.assertEqual(sizer.observe(200, 1000, 1000 * 1000, 1.0, rss=100 * MIB), 400)
+
+    def test_latency_bound(self):
+        sizer = chunking.AdaptiveChunkSizer(1000, memory_budget=512 * MIB, target_seconds=10)
+        self.assertEqual(sizer.observe(1000, 5000, 5000 * 1000, 40.0, rss=100 * MIB), 250)
+
+    def test_memory_bound(self):
+        sizer = chunking.AdaptiveChunkSizer(1000, memory_budget=512 * MIB, target_seconds=10)
+        # 1000 assertions of 10 rows of 10 KB: about 400 KB per assertion once formatted, with 64 MiB + the held rows left
+        size = sizer.observe(1000, 10000, 10000 * 10000, 1.0, rss=448 * MIB)
+        self.assertEqual(size, int((64 * MIB + 10000 * 10000) / (10 * 10000 * chunking.FORMAT_MEMORY_FACTOR)))
+        concurrent = chunking.AdaptiveChunkSizer(1000, memory_budget=512 * MIB, target_seconds=10, concurrency=4)
+        self.assertEqual(concurrent.observe(1000, 10000, 10000 * 10000, 1.0, rss=448 * MIB), size // 4)
+
+    def test_clamped_to_minimum(self):
+        sizer = chunking.AdaptiveChunkSizer(1000, memory_budget=512 * MIB, target_seconds=10, min_size=10)
+        self.assertEqual(sizer.observe(1000, 10000, 10000 * 10000, 1.0, rss=700 * MIB), 10)
+        self.assertEqual(sizer.next_size(), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
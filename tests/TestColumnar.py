@@ -0,0 +1,109 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+import services
+import targeted
+
+if importlib.util.find_spec('pyarrow'):
+    import pyarrow.parquet
+    import columnar
+
+
+def make_edge_dict(first: int, count: int) -> dict:
+    edge_dict = {}
+    for i in range(first, first + count):
+        assertion_id = f'assertion{i:03d}'
+        edge_dict[assertion_id] = [
+            services.EdgeRecord(assertion_id, f'evidence{i}_{j}', 'biolink:ChemicalToGeneAssociation',
+                                'biolink:treats' if j % 2 else 'biolink:entity_positively_regulates_entity',
+                                'CHEBI:24433', 'UniProtKB:P19883', f'PMC{j}', 'abstract', 2000, str(0.1 * j),
+                                f'sentence {j}', '0|5', '10|15', 4)
+            for j in range(4)]
+    return edge_dict
+
+
+@unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+class ColumnarTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_convert_value(self):
+        self.assertEqual(columnar.convert_value('PMID:1|PMC:2', columnar.LIST), ['PMID:1', 'PMC:2'])
+        self.assertEqual(columnar.convert_value('', columnar.LIST), [])
+        self.assertEqual(columnar.convert_value('0.25', columnar.FLOAT), 0.25)
+        self.assertIsNone(columnar.convert_value('', columnar.STRING))
+
+    def test_write_edges(self):
+        tsv_filename = os.path.join(self.directory.name, 'edges.tsv')
+        parquet_filename = os.path.join(self.directory.name, 'edges.parquet')
+        nodes = {'CHEBI:24433': 'biolink:ChemicalEntity', 'UniProtKB:P19883': 'biolink:Protein'}
+        with columnar.ColumnarWriter(parquet_filename) as writer:
+            for first, count in [(0, 5), (5, 3)]:  # two chunks
+                edge_dict = make_edge_dict(first, count)
+                services.score_edge_dict(edge_dict)
+                services.write_edges(edge_dict, nodes, tsv_filename, row_writers=[writer])
+        parquet_file = pyarrow.parquet.ParquetFile(parquet_filename)
+        self.assertEqual(parquet_file.num_row_groups, 2)
+        self.assertEqual(parquet_file.metadata.num_rows, 16)
+        self.assertEqual(writer.row_count, 16)
+        with open(tsv_filename, 'r') as infile:
+            lines = [line.rstrip('\n').split('\t') for line in infile]
+        table = parquet_file.read(columns=['id', 'predicate', 'object_direction_qualifier', 'confidence_score',
+                                           'supporting_publications'])
+        self.assertEqual(table.column('id').to_pylist(), [line[13] for line in lines])
+        self.assertEqual(table.column('predicate').to_pylist(), [line[1] for line in lines])
+        self.assertEqual(table.column('object_direction_qualifier').to_pylist(),
+                         [line[9] if line[9] else None for line in lines])
+        self.assertEqual(table.column('confidence_score').to_pylist(), [float(line[15]) for line in lines])
+        self.assertEqual(table.column('supporting_publications').to_pylist()[0], ['PMC:0', 'PMC:2'])
+        self.assertEqual(str(table.schema.field('confidence_score').type), 'double')
+
+    def write_shard(self, name: str, first: int, count: int) -> str:
+        parquet_filename = os.path.join(self.directory.name, f'{name}.parquet')
+        nodes = {'CHEBI:24433': 'biolink:ChemicalEntity', 'UniProtKB:P19883': 'biolink:Protein'}
+        with columnar.ColumnarWriter(parquet_filename) as writer:
+            for chunk_first in range(first, first + count, 3):
+                edge_dict = make_edge_dict(chunk_first, min(3, first + count - chunk_first))
+                services.score_edge_dict(edge_dict)
+                services.write_edges(edge_dict, nodes, os.path.join(self.directory.name, f'{name}.tsv'),
+                                     row_writers=[writer])
+        return parquet_filename
+
+    def test_merge_files(self):
+        first_shard = self.write_shard('edges_4_10', 4, 6)
+        second_shard = self.write_shard('edges_0_6', 0, 6)  # overlaps the first shard on assertions 4 and 5
+        output_filename = os.path.join(self.directory.name, 'edges.parquet')
+        stats = columnar.merge_files([first_shard, second_shard], output_filename, batch_size=7)
+        self.assertEqual((stats['rows_read'], stats['rows_written'], stats['duplicates']), (24, 20, 4))
+        parquet_file = pyarrow.parquet.ParquetFile(output_filename)
+        self.assertEqual(parquet_file.num_row_groups, 3)
+        table = parquet_file.read()
+        self.assertEqual(table.schema, pyarrow.parquet.read_schema(first_shard))
+        self.assertEqual(table.column('id').to_pylist(), [f'assertion{i:03d}' for i in range(10) for _ in range(2)])
+        reversed_filename = os.path.join(self.directory.name, 'reversed.parquet')
+        columnar.merge_files([second_shard, first_shard], reversed_filename)
+        self.assertEqual(pyarrow.parquet.read_table(reversed_filename).to_pylist(), table.to_pylist())
+
+    def test_write_nodes(self):
+        parquet_filename = os.path.join(self.directory.name, 'nodes.parquet')
+        normalized_nodes = {'CHEBI:24433': {'id': {'label': 'aspirin'}, 'type': ['biolink:SmallMolecule']},
+                            'CHEBI:1': None}
+        with columnar.ColumnarWriter(parquet_filename, columnar.NODE_COLUMNS) as writer:
+            targeted.write_nodes(['CHEBI:24433', 'CHEBI:1'], normalized_nodes,
+                                 os.path.join(self.directory.name, 'nodes.tsv.gz'), [writer])
+        table = pyarrow.parquet.read_table(parquet_filename)
+        self.assertEqual(table.to_pylist(), [{'id': 'CHEBI:24433', 'name': 'aspirin',
+                                              'category': 'biolink:SmallMolecule'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
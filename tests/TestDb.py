@@ -0,0 +1,185 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import db
+import targeted
+
+
+class DbTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = db.create_db_engine(f'sqlite:///{self.directory.name}/test.db', pool_size=2, max_overflow=1,
+                                          connect_args={'check_same_thread': False})
+        self.session_factory = db.create_session_factory(self.engine)
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE numbers (n INTEGER)')
+            connection.exec_driver_sql('INSERT INTO numbers VALUES (1), (2), (3)')
+
+    def tearDown(self) -> None:
+        self.session_factory.remove()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_create_db_engine_pool_settings(self):
+        self.assertEqual(self.engine.pool.size(), 2)
+        self.assertTrue(self.engine.pool._pre_ping)
+
+    def test_session_per_thread(self):
+        sessions = {}
+        totals = {}
+
+        def work(name):
+            session = self.session_factory()
+            sessions[name] = session
+            totals[name] = session.execute(text('SELECT SUM(n) FROM numbers')).scalar()
+            self.session_factory.remove()
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(totals, {0: 6, 1: 6, 2: 6, 3: 6})
+        self.assertEqual(len(set(id(session) for session in sessions.values())), 4)
+        self.assertIs(self.session_factory(), self.session_factory())
+
+    def test_run_with_retry_transient(self):
+        session = self.session_factory()
+        attempts = []
+
+        def operation():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError('SELECT 1', {}, Exception(2013, 'Lost connection to MySQL server during query'))
+            return session.execute(text('SELECT COUNT(1) FROM numbers')).scalar()
+
+        self.assertEqual(db.run_with_retry(session, operation, retries=3, delay=0), 3)
+        self.assertEqual(len(attempts), 3)
+
+    def test_run_with_retry_gives_up(self):
+        session = self.session_factory()
+
+        def operation():
+            raise OperationalError('SELECT 1', {}, Exception(2006, 'MySQL server has gone away'))
+
+        with self.assertRaises(OperationalError):
+            db.run_with_retry(session, operation, retries=2, delay=0)
+
+    def test_run_with_retry_not_transient(self):
+        session = self.session_factory()
+        attempts = []
+
+        def operation():
+            attempts.append(1)
+            return session.execute(text('SELECT * FROM missing_table')).all()
+
+        with self.assertRaises(OperationalError):
+            db.run_with_retry(session, operation, retries=3, delay=0)
+        self.assertEqual(len(attempts), 1)
+
+
+class RoutingTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.engines = [self.create_endpoint(name) for name in ['a', 'b']]
+
+    def tearDown(self) -> None:
+        for engine in self.engines:
+            engine.dispose()
+        self.directory.cleanup()
+
+    def create_endpoint(self, name: str):
+        engine = db.create_db_engine(f'sqlite:///{self.directory.name}/{name}.db', pool_size=2, max_overflow=1,
+                                     connect_args={'check_same_thread': False})
+        with engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE endpoint (name TEXT)')
+            connection.exec_driver_sql(f"INSERT INTO endpoint VALUES ('{name}')")
+        return engine
+
+    def create_unreachable_endpoint(self):
+        def connect():
+            raise sqlite3.OperationalError(2003, "Can't connect to MySQL server")
+
+        engine = db.create_db_engine('sqlite://', creator=connect)
+        self.engines.append(engine)
+        return engine
+
+    def test_round_robin(self):
+        session_factory = db.create_routing_session_factory(self.engines, 'round_robin')
+        session = session_factory()
+        names = []
+        for _ in range(4):  # a new endpoint for each transaction
+            names.append(session.execute(text('SELECT name FROM endpoint')).scalar())
+            session.commit()
+        self.assertEqual(names, ['a', 'b', 'a', 'b'])
+        self.assertEqual([stats['queries'] for stats in session.router.get_stats()], [3, 3])  # health check + 2
+        self.assertEqual([stats['outstanding'] for stats in session.router.get_stats()], [0, 0])
+        session_factory.remove()
+
+    def test_endpoint_kept_for_transaction(self):
+        router = db.EndpointRouter(self.engines, 'round_robin')
+        session = db.RoutingSession(router=router)
+        names = [session.execute(text('SELECT name FROM endpoint')).scalar() for _ in range(3)]
+        self.assertEqual(names, ['a', 'a', 'a'])
+        session.execute(text("INSERT INTO endpoint VALUES ('new')"))
+        self.assertEqual(session.execute(text('SELECT COUNT(1) FROM endpoint')).scalar(), 2)
+        session.rollback()
+        self.assertEqual(session.execute(text('SELECT name FROM endpoint')).scalar(), 'b')
+        session.close()
+        self.assertEqual(session.execute(text('SELECT name FROM endpoint')).scalar(), 'a')
+        session.close()
+
+    def test_raw_fetch_counted(self):
+        router = db.EndpointRouter(self.engines, 'round_robin')
+        session = db.RoutingSession(router=router)
+        rows = list(targeted.fetch_raw_rows(session, text('SELECT name FROM endpoint'), {}))
+        self.assertEqual(rows, [('a',)])
+        self.assertEqual([(stats['queries'], stats['outstanding']) for stats in router.get_stats()], [(1, 0), (0, 0)])
+        session.close()
+
+    def test_least_outstanding(self):
+        self.engines.append(self.create_endpoint('c'))
+        router = db.EndpointRouter(self.engines, 'least_outstanding')
+        router.outstanding[0] = 2
+        router.outstanding[1] = 1
+        self.assertIs(router.choose_engine(), self.engines[2])
+        self.assertIs(router.choose_engine(), self.engines[2])
+        router.outstanding[0] = 0
+        self.assertIs(router.choose_engine(), self.engines[0])
+        with self.assertRaises(ValueError):
+            db.EndpointRouter(self.engines, 'random')
+
+    def test_health_check(self):
+        unreachable = self.create_unreachable_endpoint()
+        session_factory = db.create_routing_session_factory([unreachable] + self.engines[:1], 'round_robin')
+        session = session_factory()
+        self.assertEqual([stats['available'] for stats in session.router.get_stats()], [False, True])
+        names = [session.execute(text('SELECT name FROM endpoint')).scalar() for _ in range(3)]
+        self.assertEqual(names, ['a', 'a', 'a'])
+        session_factory.remove()
+
+    def test_failover(self):
+        unreachable = self.create_unreachable_endpoint()
+        router = db.EndpointRouter([unreachable, self.engines[1]], 'round_robin')
+        session = db.RoutingSession(router=router)
+        name = db.run_with_retry(session, lambda: session.execute(text('SELECT name FROM endpoint')).scalar(),
+                                 retries=1, delay=0)
+        self.assertEqual(name, 'b')
+        self.assertEqual([stats['available'] for stats in router.get_stats()], [False, True])
+        router.failed_endpoint_delay = 0  # the failed endpoint is tried again once the delay has passed
+        self.assertIs(router.choose_engine(), unreachable)
+        session.close()
@@ -0,0 +1,79 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+import diff
+
+
+def make_line(assertion_id: str, predicate: str, score: str = '0.5', direction: str = '') -> str:
+    columns = ['CHEBI:1', predicate, 'UniProtKB:P1', '', '', '', direction] + [''] * 6 + \
+              [assertion_id, 'RO:0000001', score, '', '', '[]']
+    return '\t'.join(columns) + '\n'
+
+
+class DiffTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_edges(self, name: str, lines: list[str]) -> str:
+        filename = os.path.join(self.directory.name, name)
+        with gzip.open(filename, 'wt') as outfile:
+            outfile.writelines(lines)
+        return filename
+
+    def read_output(self, name: str) -> list[str]:
+        with gzip.open(os.path.join(self.directory.name, name), 'rt') as infile:
+            return infile.readlines()
+
+    def test_get_edge_key(self):
+        affects = 'biolink:affects'
+        increased = diff.get_edge_key(make_line('a', affects, direction='increased'))
+        decreased = diff.get_edge_key(make_line('a', affects, direction='decreased'))
+        self.assertTrue(increased.startswith('a\tbiolink:affects'))
+        self.assertNotEqual(increased, decreased)
+        self.assertEqual(increased, diff.get_edge_key(make_line('a', affects, score='0.9', direction='increased')))
+
+    def test_sort_edges(self):
+        lines = [make_line(f'{i:03d}', 'biolink:treats') for i in reversed(range(50))]
+        filename = self.write_edges('edges.tsv.gz', lines)
+        run_directory = os.path.join(self.directory.name, 'runs')
+        os.mkdir(run_directory)
+        # a small run size forces several runs to be merged
+        edges = list(diff.sort_edges(filename, run_directory, run_bytes=500))
+        self.assertGreater(len(os.listdir(run_directory)), 1)
+        self.assertEqual([edge[2] for edge in edges], sorted(lines))
+        self.assertEqual(edges[0][1], diff.get_line_hash(edges[0][2]))
+
+    def test_diff_edge_files(self):
+        treats, regulates = 'biolink:treats', 'biolink:entity_positively_regulates_entity'
+        old_filename = self.write_edges('old.tsv.gz', [make_line('c', treats), make_line('a', treats),
+                                                       make_line('b', treats), make_line('a', regulates)])
+        new_filename = self.write_edges('new.tsv.gz', [make_line('a', regulates), make_line('a', treats, score='0.9'),
+                                                       make_line('c', treats), make_line('d', treats)])
+        prefix = os.path.join(self.directory.name, 'edges_')
+        counts = diff.diff_edge_files(old_filename, new_filename, prefix, run_bytes=100)
+        self.assertEqual(counts, {'unchanged': 2, 'added': 1, 'removed': 1, 'changed': 1})
+        self.assertEqual(self.read_output('edges_added.tsv.gz'), [make_line('d', treats)])
+        self.assertEqual(self.read_output('edges_removed.tsv.gz'), [make_line('b', treats)])
+        self.assertEqual(self.read_output('edges_changed.tsv.gz'), [make_line('a', treats, score='0.9')])
+        with open(f'{prefix}diff.json', 'r') as infile:
+            self.assertEqual(json.load(infile), counts)
+
+    def test_diff_empty_previous(self):
+        old_filename = self.write_edges('old.tsv.gz', [])
+        new_filename = self.write_edges('new.tsv.gz', [make_line('a', 'biolink:treats')])
+        counts = diff.diff_edge_files(old_filename, new_filename, os.path.join(self.directory.name, 'edges_'))
+        self.assertEqual(counts, {'unchanged': 0, 'added': 1, 'removed': 0, 'changed': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
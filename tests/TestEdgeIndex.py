@@ -0,0 +1,73 @@
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import edge_index
+import merge
+
+
+def make_line(assertion_id: str, predicate: str) -> str:
+    columns = ['CHEBI:1', predicate, 'UniProtKB:P1'] + [''] * 10 + [assertion_id, 'RO:0000001', '0.5', '', '', '[]']
+    return '\t'.join(columns) + '\n'
+
+
+class EdgeIndexTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.edges_filename = os.path.join(self.directory.name, 'edges.tsv.gz')
+        self.ids = [f'{i:064x}' for i in range(0, 400, 2)]
+        shards = []
+        for shard in range(4):
+            filename = os.path.join(self.directory.name, f'edges_{shard}.tsv')
+            with open(filename, 'w') as outfile:
+                for assertion_id in self.ids[shard::4]:
+                    outfile.write(make_line(assertion_id, 'biolink:treats'))
+                    outfile.write(make_line(assertion_id, 'biolink:entity_positively_regulates_entity'))
+            shards.append(filename)
+        self.stats = merge.merge_edge_files(sorted(shards), self.edges_filename,
+                                            index_filename=self.edges_filename + '.index', block_size=2000)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_blocks_are_plain_gzip(self):
+        self.assertGreater(self.stats['blocks'], 10)
+        with gzip.open(self.edges_filename, 'rt') as infile:
+            lines = infile.readlines()
+        self.assertEqual(len(lines), 2 * len(self.ids))
+        self.assertEqual([edge_index.get_assertion_id(line) for line in lines[::2]], self.ids)
+        assertion_ids, offsets = edge_index.read_index(self.edges_filename + '.index')
+        self.assertEqual(len(assertion_ids), self.stats['blocks'])
+        self.assertEqual(offsets[0], 0)
+        self.assertEqual(assertion_ids, sorted(assertion_ids))
+
+    def test_lookup(self):
+        index = edge_index.read_index(self.edges_filename + '.index')
+        for assertion_id in self.ids[:3] + index[0][1:4] + self.ids[-2:]:
+            self.assertEqual(edge_index.lookup(self.edges_filename, assertion_id, index),
+                             [make_line(assertion_id, 'biolink:entity_positively_regulates_entity'),
+                              make_line(assertion_id, 'biolink:treats')])
+        self.assertEqual(edge_index.lookup(self.edges_filename, f'{1:064x}', index), [])
+        self.assertEqual(edge_index.lookup(self.edges_filename, f'{1000:064x}'), [])
+
+    def test_lookup_range(self):
+        lines = list(edge_index.lookup_range(self.edges_filename, f'{51:064x}', f'{250:064x}'))
+        self.assertEqual(sorted(set(edge_index.get_assertion_id(line) for line in lines)),
+                         [assertion_id for assertion_id in self.ids if f'{51:064x}' <= assertion_id <= f'{250:064x}'])
+
+    def test_lookup_cli(self):
+        module = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'edge_index.py')
+        result = subprocess.run([sys.executable, module, self.edges_filename, self.ids[7]], capture_output=True,
+                                text=True, check=True)
+        self.assertEqual(result.stdout.count(self.ids[7]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import chunking
+import db
+import exporter
+
+
+class ExporterTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = db.create_db_engine(f'sqlite:///{self.directory.name}/test.db', pool_size=2, max_overflow=1,
+                                          connect_args={'check_same_thread': False})
+        self.session_factory = db.create_session_factory(self.engine)
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_read_manifest(self):
+        filename = f'{self.directory.name}/shards.txt'
+        with open(filename, 'w') as outfile:
+            outfile.write('# offset limit\n0 100000\n\n100000\t100000\n200000 50000\n')
+        self.assertEqual(exporter.read_manifest(filename), [(0, 100000), (100000, 100000), (200000, 50000)])
+        with open(filename, 'w') as outfile:
+            outfile.write('0 100000 5\n')
+        with self.assertRaises(ValueError):
+            exporter.read_manifest(filename)
+
+    def test_export_edge_shards(self):
+        shards = [(0, 10), (10, 10), (20, 10), (30, 10)]
+        calls = []
+        lock = threading.Lock()
+
+        def fake_export_edges(session, nodes, bucket, blob_prefix, assertion_start, assertion_limit, **kwargs):
+            with lock:
+                calls.append((assertion_start, assertion_limit, id(nodes), kwargs['edge_limit'], session))
+            if assertion_start == 20:
+                raise RuntimeError('shard failed')
+
+        nodes = {'CHEBI:1': 'biolink:ChemicalEntity'}
+        with mock.patch('targeted.export_edges', side_effect=fake_export_edges):
+            failed = exporter.export_edge_shards(self.session_factory, nodes, 'bucket', shards, workers=2,
+                                                 chunk_size=5, edge_limit=3)
+        self.assertEqual(failed, [(20, 10)])
+        self.assertEqual(sorted(call[:2] for call in calls), shards)
+        self.assertTrue(all(call[2] == id(nodes) and call[3] == 3 for call in calls))
+        self.assertEqual(len(set(id(call[4]) for call in calls)), len(shards))  # each shard starts a fresh session
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+
+    def test_profiled(self):
+        cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        try:
+            with mock.patch('services.upload_to_gcp') as upload:
+                with self.assertRaises(RuntimeError):
+                    with exporter.profiled('sample', 'edges_0_10', 'bucket'):
+                        raise RuntimeError('shard failed')  # the profile of a failed shard is still uploaded
+                with exporter.profiled(None, 'edges_0_10', 'bucket'):
+                    pass
+        finally:
+            os.chdir(cwd)
+        upload.assert_called_once_with('bucket', 'profile_edges_0_10.collapsed',
+                                       exporter.BUILD_BLOB_PREFIX + 'profile_edges_0_10.collapsed',
+                                       delete_source_file=True)
+
+
+    def test_main_adaptive_implied(self):
+        expected = [([], None), (['--adaptive'], chunking.DEFAULT_MEMORY_BUDGET),
+                    (['--memory_budget', '512'], 512 * 1024 * 1024),
+                    (['--target_seconds', '30'], chunking.DEFAULT_MEMORY_BUDGET)]  # either setting implies --adaptive
+        for options, memory_budget in expected:
+            with mock.patch('exporter.load_target_modules'), mock.patch('exporter.init_db'), \
+                    mock.patch('exporter.get_valid_nodes', return_value={}), \
+                    mock.patch('targeted.export_edges') as export_edges:
+                exporter.main(['-t', 'edges', '-b', 'bucket'] + options)
+            self.assertEqual(export_edges.call_args.kwargs.get('memory_budget'), memory_budget)
+        self.assertEqual(export_edges.call_args.kwargs['target_seconds'], 30)
+
+    def test_main_supersede_start_after(self):
+        for options, start_after in [([], ''), (['--start_after', 'e5'], 'e5')]:
+            with mock.patch('exporter.load_target_modules'), mock.patch('exporter.init_db'), \
+                    mock.patch('targeted.supersede_evidence') as supersede_evidence:
+                exporter.main(['-t', 'supersede', '-b', 'bucket'] + options)
+            self.assertEqual(supersede_evidence.call_args.kwargs['start_after'], start_after)
+
+    def test_file_targets_do_not_load_database_modules(self):
+        # in a fresh interpreter, since this one has already imported sqlalchemy; without input files each target
+        # fails as soon as it reads one, after the imports on its way in
+        code = ('import sys; from unittest import mock; import exporter\n'
+                'with mock.patch("services.list_gcp_blobs", return_value=[]), mock.patch("services.get_from_gcp"), '
+                'mock.patch("services.upload_to_gcp"):\n'
+                '    for target in exporter.FILE_TARGETS:\n'
+                '        try:\n'
+                '            exporter.main(["-t", target, "-b", "bucket"])\n'
+                '        except Exception:\n'
+                '            pass\n'
+                'print("sqlalchemy" in sys.modules)')
+        result = subprocess.run([sys.executable, '-c', code], cwd=self.directory.name, capture_output=True, text=True,
+                                env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(exporter.__file__))))
+        self.assertEqual(result.stdout.strip(), 'False', result.stderr)
+
+    def test_load_target_modules_snapshot(self):
+        with mock.patch('importlib.import_module') as import_module:
+            exporter.load_target_modules('edges', from_snapshot=True)
+            self.assertEqual([call.args[0] for call in import_module.call_args_list], list(exporter.SNAPSHOT_MODULES))
+            import_module.reset_mock()
+            exporter.load_target_modules('edges')
+            self.assertIn('google.cloud.sql.connector', [call.args[0] for call in import_module.call_args_list])
+            import_module.reset_mock()
+            exporter.load_target_modules('merge')
+            import_module.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+import fragments
+import services
+
+
+def make_edge_dict(first: int, count: int, score: float = 0.1) -> dict:
+    edge_dict = {}
+    for i in range(first, first + count):
+        assertion_id = f'assertion{i:03d}'
+        edge_dict[assertion_id] = [
+            services.EdgeRecord(assertion_id, f'evidence{i}_{j}', 'biolink:ChemicalToGeneAssociation',
+                                'biolink:treats' if j % 2 else 'biolink:entity_positively_regulates_entity',
+                                'CHEBI:24433', 'UniProtKB:P19883', f'PMC{j}', 'abstract', 2000 if j else None,
+                                str(score * (j + 1)), f'sentence "{j}" α', '0|5', '10|15', 4)
+            for j in range(4)]
+    services.score_edge_dict(edge_dict)
+    return edge_dict
+
+
+class FragmentsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'fragments.db')
+        self.nodes = {'CHEBI:24433': 'biolink:ChemicalEntity', 'UniProtKB:P19883': 'biolink:Protein'}
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_edges(self, edge_dict: dict, name: str, cache=None) -> str:
+        output_filename = os.path.join(self.directory.name, name)
+        services.write_edges(edge_dict, self.nodes, output_filename, fragment_cache=cache)
+        with open(output_filename, 'r') as infile:
+            return infile.read()
+
+    def count_fragments(self) -> int:
+        connection = sqlite3.connect(self.filename)
+        count = connection.execute('SELECT COUNT(1) FROM fragments').fetchone()[0]
+        connection.close()
+        return count
+
+    def test_get_assertion_json_matches(self):
+        rows = make_edge_dict(0, 1)['assertion000']
+        with fragments.FragmentCache(self.filename) as cache:
+            cache.load(row.evidence_id for row in rows)
+            self.assertEqual(services.get_assertion_json(rows, cache), services.get_assertion_json(rows))
+            self.assertEqual(services.get_assertion_json(rows, cache), services.get_assertion_json(rows))
+        self.assertEqual((cache.misses, cache.hits), (4, 4))
+
+    def test_write_edges_reuses_fragments(self):
+        expected = self.write_edges(make_edge_dict(0, 5), 'expected.tsv')
+        with fragments.FragmentCache(self.filename) as cache:
+            self.assertEqual(self.write_edges(make_edge_dict(0, 5), 'first.tsv', cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 20))
+        with fragments.FragmentCache(self.filename) as cache:
+            self.assertEqual(self.write_edges(make_edge_dict(0, 5), 'second.tsv', cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (20, 0))
+
+    def test_changed_score_is_formatted(self):
+        with fragments.FragmentCache(self.filename) as cache:
+            self.write_edges(make_edge_dict(0, 2), 'first.tsv', cache)
+        expected = self.write_edges(make_edge_dict(0, 2, score=0.2), 'expected.tsv')
+        with fragments.FragmentCache(self.filename) as cache:
+            self.assertEqual(self.write_edges(make_edge_dict(0, 2, score=0.2), 'second.tsv', cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 8))
+
+    def test_unused_fragments_are_pruned(self):
+        with fragments.FragmentCache(self.filename) as cache:
+            self.write_edges(make_edge_dict(0, 4), 'first.tsv', cache)
+        self.assertEqual(self.count_fragments(), 16)
+        with self.assertRaises(RuntimeError):
+            with fragments.FragmentCache(self.filename) as cache:
+                self.write_edges(make_edge_dict(2, 4), 'failed.tsv', cache)
+                raise RuntimeError('shard failed')  # an incomplete run keeps every fragment
+        self.assertEqual(self.count_fragments(), 24)
+        cache = fragments.FragmentCache(self.filename)
+        self.write_edges(make_edge_dict(3, 2), 'second.tsv', cache)
+        self.assertEqual(cache.close(), {'hits': 8, 'misses': 0, 'pruned': 16})
+        self.assertEqual(self.count_fragments(), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+import columnar
+import jsonl
+import merge
+import services
+import targeted
+
+
+def make_edge_dict(first: int, count: int) -> dict:
+    edge_dict = {}
+    for i in range(first, first + count):
+        assertion_id = f'assertion{i:03d}'
+        edge_dict[assertion_id] = [
+            services.EdgeRecord(assertion_id, f'evidence{i}_{j}', 'biolink:ChemicalToGeneAssociation',
+                                'biolink:treats' if j % 2 else 'biolink:entity_positively_regulates_entity',
+                                'CHEBI:24433', 'UniProtKB:P19883', f'PMC{j}', 'abstract', 2000, str(0.1 * j),
+                                f'sentence {j}', '0|5', '10|15', 4)
+            for j in range(4)]
+    return edge_dict
+
+
+class JsonlTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.nodes = {'CHEBI:24433': 'biolink:ChemicalEntity', 'UniProtKB:P19883': 'biolink:Protein'}
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_shard(self, name: str, first: int, count: int) -> tuple[str, str]:
+        tsv_filename = os.path.join(self.directory.name, f'{name}.tsv')
+        jsonl_filename = os.path.join(self.directory.name, f'{name}.jsonl.gz')
+        with jsonl.JsonLinesWriter(jsonl_filename) as writer:
+            for chunk_first in range(first, first + count, 3):
+                edge_dict = make_edge_dict(chunk_first, min(3, first + count - chunk_first))
+                services.score_edge_dict(edge_dict)
+                services.write_edges(edge_dict, self.nodes, tsv_filename, row_writers=[writer])
+        return tsv_filename, jsonl_filename
+
+    def test_format_row(self):
+        row = ['CHEBI:1', 'biolink:treats', 'UniProtKB:P1'] + [''] * 10 + \
+              ['abc', 'RO:0000001', 0.25, 'tmkp:1|tmkp:2', 'PMID:1', '[{"attribute_type_id": "biolink:agent_type"}]']
+        line = jsonl.format_row(row)
+        self.assertTrue(line.startswith('{"id": "abc", '))
+        self.assertEqual(json.loads(line), {
+            'id': 'abc', 'subject': 'CHEBI:1', 'predicate': 'biolink:treats', 'object': 'UniProtKB:P1',
+            'relation': 'RO:0000001', 'confidence_score': 0.25, 'supporting_study_results': ['tmkp:1', 'tmkp:2'],
+            'supporting_publications': ['PMID:1'], '_attributes': [{'attribute_type_id': 'biolink:agent_type'}]})
+        self.assertEqual(jsonl.get_line_id(line), 'abc')
+        with self.assertRaises(ValueError):
+            jsonl.get_line_id('{"subject": "CHEBI:1", "id": "abc"}')
+
+    def test_write_edges(self):
+        tsv_filename, jsonl_filename = self.write_shard('edges_0_8', 0, 8)
+        with open(tsv_filename, 'r') as infile:
+            lines = [line.rstrip('\n').split('\t') for line in infile]
+        with gzip.open(jsonl_filename, 'rt') as infile:
+            edges = [json.loads(line) for line in infile]
+        self.assertEqual(len(edges), 16)
+        self.assertEqual([edge['id'] for edge in edges], [line[13] for line in lines])
+        self.assertEqual([edge['predicate'] for edge in edges], [line[1] for line in lines])
+        self.assertEqual([edge.get('object_direction_qualifier', '') for edge in edges], [line[9] for line in lines])
+        self.assertEqual([edge['confidence_score'] for edge in edges], [float(line[15]) for line in lines])
+        self.assertEqual([edge['_attributes'] for edge in edges], [json.loads(line[18]) for line in lines])
+        self.assertEqual(edges[0]['supporting_publications'], ['PMC:0', 'PMC:2'])
+
+    def test_merge_shards(self):
+        _, first_shard = self.write_shard('edges_4_10', 4, 6)
+        _, second_shard = self.write_shard('edges_0_6', 0, 6)  # overlaps the first shard on assertions 4 and 5
+        output_filename = os.path.join(self.directory.name, 'edges.jsonl.gz')
+        stats = merge.merge_edge_files([first_shard, second_shard], output_filename, get_id=jsonl.get_line_id)
+        self.assertEqual(stats['duplicates'], 4)
+        with gzip.open(output_filename, 'rt') as infile:
+            ids = [json.loads(line)['id'] for line in infile]
+        self.assertEqual(ids, [f'assertion{i:03d}' for i in range(10) for _ in range(2)])
+
+    def test_write_nodes(self):
+        jsonl_filename = os.path.join(self.directory.name, 'nodes.jsonl.gz')
+        normalized_nodes = {'CHEBI:24433': {'id': {'label': 'aspirin'}, 'type': ['biolink:SmallMolecule']},
+                            'CHEBI:1': None}
+        with jsonl.JsonLinesWriter(jsonl_filename, columnar.NODE_COLUMNS) as writer:
+            targeted.write_nodes(['CHEBI:24433', 'CHEBI:1'], normalized_nodes,
+                                 os.path.join(self.directory.name, 'nodes.tsv.gz'), [writer])
+        self.assertEqual(writer.row_count, 1)
+        with gzip.open(jsonl_filename, 'rt') as infile:
+            self.assertEqual(infile.read(),
+                             '{"id": "CHEBI:24433", "name": "aspirin", "category": "biolink:SmallMolecule"}\n')
+
+
+    def test_row_writer_blob_names(self):
+        cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        try:
+            node_writers = targeted.open_row_writers('nodes', nodes=True, jsonl=True)
+            edge_writers = targeted.open_row_writers('edges_0_10', jsonl=True)
+            targeted.close_writers(node_writers + edge_writers)
+        finally:
+            os.chdir(cwd)
+        # the nodes file is published next to the merged edges.jsonl.gz, the edge shards wait for the merge target
+        self.assertEqual([blob_name for _, _, blob_name in node_writers], ['nodes.jsonl.gz'])
+        self.assertEqual([blob_name for _, _, blob_name in edge_writers],
+                         [jsonl.SHARD_PREFIX + 'edges_0_10.jsonl.gz'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import gzip
+import os
+import tempfile
+import unittest
+import merge
+
+
+def make_line(assertion_id: str, predicate: str) -> str:
+    columns = ['CHEBI:1', predicate, 'UniProtKB:P1'] + [''] * 10 + [assertion_id, 'RO:0000001', '0.5', '', '', '[]']
+    return '\t'.join(columns) + '\n'
+
+
+class MergeTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_shard(self, name: str, lines: list[str]) -> str:
+        filename = os.path.join(self.directory.name, name)
+        with (gzip.open(filename, 'wt') if name.endswith('.gz') else open(filename, 'w')) as outfile:
+            outfile.writelines(lines)
+        return filename
+
+    def test_merge_edge_files(self):
+        treats, regulates = 'biolink:treats', 'biolink:entity_positively_regulates_entity'
+        # lexicographic filename order puts the 1000 shard before the 200 shard, and the 200-300 and 250-350 shards
+        # overlap on assertion 'c'
+        shards = [
+            self.write_shard('edges_1000_1100.tsv', [make_line('e', treats)]),
+            self.write_shard('edges_200_300.tsv', [make_line('a', treats), make_line('a', regulates),
+                                                   make_line('c', treats)]),
+            self.write_shard('edges_250_350.tsv.gz', [make_line('c', treats), make_line('c', regulates),
+                                                      make_line('d', treats)]),
+            self.write_shard('edges_0_100.tsv', [make_line('0', treats), make_line('b', regulates)]),
+        ]
+        output_filename = os.path.join(self.directory.name, 'edges.tsv.gz')
+        stats = merge.merge_edge_files(shards, output_filename)
+        with gzip.open(output_filename, 'rt') as infile:
+            lines = infile.readlines()
+        self.assertEqual([line.split('\t')[13] for line in lines], ['0', 'a', 'a', 'b', 'c', 'c', 'd', 'e'])
+        self.assertEqual(len(set(lines)), len(lines))
+        self.assertEqual(stats['lines_read'], 9)
+        self.assertEqual(stats['lines_written'], 8)
+        self.assertEqual(stats['duplicates'], 1)
+        self.assertEqual(stats['assertions'], 6)
+        self.assertEqual(stats['overlapping_assertions'], 1)
+
+        # the output does not depend on the order of the inputs
+        reversed_filename = os.path.join(self.directory.name, 'reversed.tsv.gz')
+        merge.merge_edge_files(list(reversed(shards)), reversed_filename)
+        with gzip.open(reversed_filename, 'rt') as infile:
+            self.assertEqual(infile.readlines(), lines)
+
+    def test_merge_edge_files_unsorted(self):
+        shard = self.write_shard('edges_0_100.tsv', [make_line('b', 'biolink:treats'), make_line('a', 'biolink:treats')])
+        with self.assertRaises(ValueError):
+            merge.merge_edge_files([shard], os.path.join(self.directory.name, 'edges.tsv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
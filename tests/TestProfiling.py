@@ -0,0 +1,64 @@
+import os
+import pstats
+import sys
+import tempfile
+import time
+import unittest
+import profiling
+
+
+def busy_loop(seconds: float) -> int:
+    total = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+class ProfilingTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_collapse_stack(self):
+        stack = profiling.collapse_stack(sys._getframe())
+        self.assertTrue(stack.endswith(';TestProfiling:test_collapse_stack'))
+        self.assertNotIn(' ', stack)
+
+    def test_stack_sampler(self):
+        sampler = profiling.StackSampler(interval=0.001)
+        sampler.start()
+        busy_loop(0.2)
+        sampler.stop()
+        self.assertGreater(sum(sampler.stacks.values()), 0)
+        self.assertTrue(any(stack.endswith('TestProfiling:busy_loop') for stack in sampler.stacks))
+        filename = os.path.join(self.directory.name, 'sample.collapsed')
+        sampler.write_collapsed(filename)
+        with open(filename, 'r') as infile:
+            for line in infile:
+                stack, count = line.rsplit(' ', 1)
+                self.assertEqual(sampler.stacks[stack], int(count))
+
+    def test_profiler(self):
+        name = os.path.join(self.directory.name, 'profile_edges_0_10')
+        with profiling.Profiler('cprofile', name, interval=0.001) as profiler:
+            busy_loop(0.1)
+        self.assertEqual(profiler.filenames, [f'{name}.pstats', f'{name}.collapsed'])
+        stats = pstats.Stats(f'{name}.pstats')
+        self.assertTrue(any(function[2] == 'busy_loop' for function in stats.stats))
+        with profiling.Profiler('sample', name, interval=0.001) as profiler:
+            busy_loop(0.05)
+        self.assertEqual(profiler.filenames, [f'{name}.collapsed'])
+        with self.assertRaises(ValueError):
+            profiling.Profiler('perf', name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import db
+import querylog
+
+
+class QueryLogTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'queries.jsonl')
+        self.engine = db.create_db_engine(f'sqlite:///{self.directory.name}/test.db', pool_size=1)
+        self.session_factory = db.create_session_factory(self.engine)
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE words (word TEXT, n INTEGER)')
+            connection.exec_driver_sql("INSERT INTO words VALUES ('one', 1), ('two', 2), ('three', 3)")
+
+    def tearDown(self) -> None:
+        self.session_factory.remove()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def read_log(self) -> list[dict]:
+        with open(self.filename, 'r') as infile:
+            return [json.loads(line) for line in infile]
+
+    def test_estimate_row_bytes(self):
+        self.assertEqual(querylog.estimate_row_bytes(('three', 3, None, b'ab')), 5 + 8 + 8 + 2)
+
+    def test_get_query_shape(self):
+        query = text('SELECT word FROM words WHERE n > :n')
+        self.assertEqual(querylog.get_query_shape('words', query),
+                         querylog.get_query_shape('words', text('SELECT word\n  FROM words WHERE n > :n')))
+        self.assertNotEqual(querylog.get_query_shape('words', query), querylog.get_query_shape('other', query))
+
+    def test_capture(self):
+        session = self.session_factory()
+        query = text('SELECT word, n FROM words WHERE n > :n')
+        with querylog.QueryRecorder(self.filename) as recorder:
+            for n in [0, 1]:
+                with querylog.capture(recorder, 'words', session, query, {'n': n}, chunk=n) as captured:
+                    words = [row[0] for row in captured.fetch(session.execute(query, {'n': n}))]
+            self.assertEqual(words, ['two', 'three'])
+        entries = self.read_log()
+        self.assertEqual([entry['event'] for entry in entries], ['query', 'plan', 'query', 'summary'])
+        self.assertEqual([(entries[i]['rows'], entries[i]['bytes'], entries[i]['chunk']) for i in [0, 2]],
+                         [(3, 11 + 24, 0), (2, 8 + 16, 1)])
+        self.assertIn('words', json.dumps(entries[1]['plan']))
+        self.assertEqual((entries[3]['name'], entries[3]['queries'], entries[3]['rows']), ('words', 2, 5))
+
+    def test_capture_error(self):
+        session = self.session_factory()
+        query = text('SELECT word FROM missing_table')
+        with querylog.QueryRecorder(self.filename) as recorder:
+            with self.assertRaises(OperationalError):
+                with querylog.capture(recorder, 'missing', session, query, {}) as captured:
+                    list(captured.fetch(session.execute(query)))
+        entries = self.read_log()
+        self.assertEqual([entry['event'] for entry in entries], ['query', 'summary'])  # no plan for a failed query
+        self.assertIn('missing_table', entries[0]['error'])
+        self.assertEqual(entries[1]['errors'], 1)
+
+    def test_capture_without_recorder(self):
+        rows = [('one', 1)]
+        with querylog.capture(None, 'words', None, text('SELECT 1'), {}) as captured:
+            self.assertIs(captured.fetch(rows), rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
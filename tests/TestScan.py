@@ -0,0 +1,81 @@
+import functools
+import os
+import tempfile
+import unittest
+import scan
+import services
+
+
+def make_line(i: int) -> str:
+    predicate, qualifiers = get_mapping_columns(i)
+    columns = [f'CHEBI:{i % 7}', predicate, f'UniProtKB:P{i % 11}', *qualifiers,
+               f'{i:064x}', 'RO:0000001', '0.5', '', '', '[]']
+    return '\t'.join(columns) + '\n'
+
+
+def get_mapping_columns(i: int):
+    mappings = list(services.PREDICATE_MAPPINGS.values())
+    columns = mappings[i % len(mappings)][0]
+    return columns[0], columns[1:]
+
+
+class ScanTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'edges.tsv')
+        self.lines = [make_line(i) for i in range(300)]
+        with open(self.filename, 'w') as outfile:
+            outfile.writelines(self.lines)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_get_line_ranges(self):
+        ranges = scan.get_line_ranges(self.filename, range_bytes=1000)
+        self.assertGreater(len(ranges), 10)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.filename))
+        lines = []
+        for (start, end), (next_start, _) in zip(ranges, ranges[1:] + [(ranges[-1][1], None)]):
+            self.assertEqual(end, next_start)
+            lines.extend(scan.read_lines(self.filename, start, end))
+        self.assertEqual(lines, self.lines)
+
+    def test_get_line_ranges_no_final_newline(self):
+        with open(self.filename, 'w') as outfile:
+            outfile.write('a\tb\nc\td')
+        ranges = scan.get_line_ranges(self.filename, range_bytes=2)
+        self.assertEqual(ranges, [(0, 4), (4, 7)])
+        self.assertEqual(list(scan.read_lines(self.filename, 4, 7)), ['c\td'])
+        open(self.filename, 'w').close()
+        self.assertEqual(scan.get_line_ranges(self.filename), [])
+
+    def test_scan_file_operations(self):
+        expected = {}
+        for line in self.lines:
+            services.update_operations(line.split('\t'), expected)
+        for workers in [1, 3]:
+            result = scan.scan_file(self.filename, services.update_operations, services.merge_operations,
+                                    workers=workers, range_bytes=2000)
+            self.assertEqual(result, expected)
+
+    def test_scan_file_edge_metadata(self):
+        normalized_nodes = dict((f'CHEBI:{i}', {'type': ['biolink:SmallMolecule']}) for i in range(7))
+        normalized_nodes.update((f'UniProtKB:P{i}', {'type': ['biolink:Protein']}) for i in range(11))
+        expected = {}
+        for line in self.lines:
+            services.update_edge_metadata(line.split('\t'), expected, normalized_nodes,
+                                          services.PRIMARY_KNOWLEDGE_SOURCE)
+        reducer = functools.partial(services.update_edge_metadata, node_dict=normalized_nodes,
+                                    source=services.PRIMARY_KNOWLEDGE_SOURCE)
+        result = scan.scan_file(self.filename, reducer, services.merge_edge_metadata, workers=2, range_bytes=3000)
+        self.assertEqual(result, services.merge_edge_metadata([expected]))
+
+
+if __name__ == '__main__':
+    unittest.main()
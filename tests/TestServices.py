@@ -1,5 +1,7 @@
 import unittest
 import os
+import gzip
+import random
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from typing import Iterator
@@ -246,3 +248,128 @@ class ServicesTestCase(unittest.TestCase):
         result_iterator = services.get_kgx_nodes(['CHEBI:5292'], self.normalized_nodes)
         result = next(result_iterator)
         self.assertEqual(result, ['CHEBI:5292', 'Geldanamycin', 'biolink:SmallMolecule'])
+
+    def test_update_operations(self):
+        edge = ['CHEBI:24433', 'biolink:affects', 'UniProtKB:Q13464', 'biolink:causes', '', '', '', '',
+                'activity_or_abundance', 'decreased', '', '', '']
+        initial = {'CHEBI_negatively_regulates_UniProtKB': 1}
+        result = services.update_operations(edge, initial)
+        self.assertEqual(result, {'CHEBI_negatively_regulates_UniProtKB': 2})
+        self.assertEqual(result, initial)
+
+    def test_update_operations_no_predicate(self):
+        edge = ['CHEBI:24433', 'biolink:affects', 'MONDO:0005070', '', '', '', '', '', '', '', '', '', '']
+        result = services.update_operations(edge, {})
+        self.assertEqual(result, {'CHEBI_no_predicate_MONDO': 1})
+
+    def test_update_operations_treats(self):
+        edge = ['CHEBI:24433', 'biolink:treats_or_applied_or_studied_to_treat', 'MONDO:0005070'] + [''] * 10
+        self.assertEqual(services.update_operations(edge, {}), {'CHEBI_treats_MONDO': 1})
+        legacy_edge = ['CHEBI:24433', 'biolink:affects', 'MONDO:0005070', 'biolink:contributes_to', '', '', '',
+                       'gain_of_function_variant_form', '', '', '', '', '']
+        self.assertEqual(services.update_operations(legacy_edge, {}), {'CHEBI_gain_of_function_contributes_to_MONDO': 1})
+
+    def test_predicate_mappings(self):
+        for predicate, (columns, operation) in services.PREDICATE_MAPPINGS.items():
+            self.assertEqual(len(columns), 1 + len(services.QUALIFIER_COLUMNS))
+            edge = ['CHEBI:24433', columns[0], 'UniProtKB:Q13464', *columns[1:]]
+            self.assertEqual(services.get_operation_predicate(edge), operation)
+        self.assertIn('biolink:gain_of_function_contributes_to', services.DROPPED_PREDICATES)
+        with self.assertRaises(ValueError):
+            services.get_predicate_columns('biolink:affects', object_qualifier='increased')
+
+    def test_get_edge_unmapped_predicate(self):
+        row = services.EdgeRecord('a1', 'e1', 'biolink:ChemicalToGeneAssociation', 'biolink:loss_of_function_contributes_to',
+                                  'CHEBI:24433', 'MONDO:0005070', 'PMID:1', 'abstract', 2000, 0.9, 'sentence',
+                                  '0|5', '10|15', 1)
+        self.assertIsNone(services.get_edge([row], 'biolink:loss_of_function_contributes_to'))
+        unmapped = services.EdgeRecord('a1', 'e1', 'biolink:ChemicalToGeneAssociation', 'biolink:contributes_to',
+                                       'CHEBI:24433', 'MONDO:0005070', 'PMID:1', 'abstract', 2000, 0.9, 'sentence',
+                                       '0|5', '10|15', 1)
+        services.score_edge_dict({'a1': [unmapped]})
+        edge = services.get_edge([unmapped], 'biolink:contributes_to')  # passed through with no qualifiers
+        self.assertEqual(edge[:13], ['CHEBI:24433', 'biolink:contributes_to', 'MONDO:0005070'] + [''] * 10)
+        self.assertEqual(services.get_operation_predicate(edge), 'contributes_to')
+
+    def test_merge_operations(self):
+        partials = [
+            {'CHEBI_treats_MONDO': 2, 'CHEBI_positively_regulates_UniProtKB': 1},
+            {},
+            {'CHEBI_treats_MONDO': 3, 'UniProtKB_contributes_to_MONDO': 4}
+        ]
+        expected = {'CHEBI_positively_regulates_UniProtKB': 1, 'CHEBI_treats_MONDO': 5, 'UniProtKB_contributes_to_MONDO': 4}
+        self.assertEqual(services.merge_operations(partials), expected)
+        self.assertEqual(list(services.merge_operations(reversed(partials)).keys()), list(expected.keys()))
+
+    def test_operations_match_full_scan(self):
+        expected = {}
+        with gzip.open('data/edges.tsv.gz', 'rt') as infile:
+            lines = infile.readlines()
+        for line in lines:
+            services.update_operations(line.split('\t'), expected)
+        midpoint = int(len(lines) / 2)
+        first, second = {}, {}
+        for line in lines[:midpoint]:
+            services.update_operations(line.split('\t'), first)
+        for line in lines[midpoint:]:
+            services.update_operations(line.split('\t'), second)
+        self.assertEqual(services.merge_operations([first, second]), expected)
+
+    def test_update_edge_metadata_from_categories(self):
+        categories = {"PR:000000015": "biolink:Protein", "CHEBI:24433": "biolink:ChemicalEntity"}
+        edge = ["PR:000000015", "biolink:entity_negatively_regulates_entity", "CHEBI:24433"]
+        expected = services.update_edge_metadata(edge, {}, self.normalized_nodes, "infores:text-mining-provider-targeted")
+        result = services.update_edge_metadata_from_categories(edge, {}, categories, "infores:text-mining-provider-targeted")
+        self.assertEqual(result, expected)
+
+    def test_get_node_category_default(self):
+        self.assertEqual(services.get_node_category("DRUGBANK:24444", {}), "biolink:SmallMolecule")
+        self.assertEqual(services.get_node_category("CHEBI:24444", {}), "biolink:NamedThing")
+
+    def test_merge_edge_metadata_matches_full_scan(self):
+        with gzip.open('data/nodes.tsv.gz', 'rt') as infile:
+            categories = dict((line.strip().split('\t')[0], line.strip().split('\t')[2]) for line in infile)
+        normalized_nodes = dict((curie, {"type": [category]}) for curie, category in categories.items())
+        with gzip.open('data/edges.tsv.gz', 'rt') as infile:
+            edges = [line.split('\t') for line in infile]
+        full = {}
+        for edge in edges:
+            services.update_edge_metadata(edge, full, normalized_nodes, "infores:text-mining-provider-targeted")
+        partials = [{}, {}, {}]
+        for i, edge in enumerate(edges):
+            services.update_edge_metadata_from_categories(edge, partials[i % 3], categories,
+                                                          "infores:text-mining-provider-targeted")
+        merged = services.merge_edge_metadata(partials)
+        self.assertEqual(merged, services.merge_edge_metadata([full]))
+        self.assertEqual(list(merged.keys()), list(services.merge_edge_metadata(reversed(partials)).keys()))
+        self.assertEqual(sum(metadata["count"] for metadata in merged.values()), len(edges))
+
+    def make_scored_edge_dict(self):
+        random.seed(36)
+        predicates = ['biolink:entity_negatively_regulates_entity', 'biolink:entity_positively_regulates_entity',
+                      'biolink:treats']
+        edge_dict = {}
+        for i in range(200):
+            assertion_id = f'assertion{i}'
+            weights = [random.choice([None, 0.0, random.uniform(0, 2)]) for _ in range(2)]
+            edge_dict[assertion_id] = [
+                services.EdgeRecord(assertion_id, f'evidence{i}_{j}', 'biolink:ChemicalToGeneAssociation',
+                                    random.choice(predicates), 'CHEBI:24433', 'UniProtKB:P19883', f'PMID:{j}',
+                                    'abstract', 2000, str(random.random()), f'sentence {j}', '0|5', '10|15', 5,
+                                    weights[0], weights[1])
+                for j in range(random.randint(1, 12))]
+        return edge_dict
+
+    def test_score_edge_dict_matches_per_row_scores(self):
+        edge_dict = self.make_scored_edge_dict()
+        expected = {}
+        for assertion_id, rows in edge_dict.items():
+            for predicate in set(row.predicate_curie for row in rows):
+                expected[(assertion_id, predicate)] = services.get_edge(rows, predicate)
+        scores = [services.get_score(row) for rows in edge_dict.values() for row in rows]
+        services.score_edge_dict(edge_dict)
+        self.assertEqual([row.weighted_score for rows in edge_dict.values() for row in rows], scores)
+        for (assertion_id, predicate), edge in expected.items():
+            rows = [row for row in edge_dict[assertion_id] if row.predicate_curie == predicate]
+            self.assertEqual(rows[0].aggregate_score, edge[15])
+            self.assertEqual(services.get_edge(edge_dict[assertion_id], predicate), edge)
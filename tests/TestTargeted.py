@@ -3,12 +3,22 @@ import unittest
 import hashlib
 import random
 import json
+import math
+import sqlite3
+import tempfile
+import time
+from unittest import mock
 from shutil import copyfile
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, bindparam, event, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 from typing import Iterator
 import targeted
 import services
+import snapshot
+import chunking
+import querylog
+import db
 
 
 class TargetedTestCase(unittest.TestCase):
@@ -74,6 +84,341 @@ class TargetedTestCase(unittest.TestCase):
                 }
             }
         }
+    def populate_supersession_tables(self):
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE assertion (assertion_id TEXT PRIMARY KEY, subject_curie TEXT, object_curie TEXT)')
+            connection.exec_driver_sql('CREATE TABLE evidence (evidence_id TEXT PRIMARY KEY, assertion_id TEXT, document_id TEXT, '
+                                       'sentence TEXT, document_zone TEXT, superseded_by TEXT)')
+            connection.exec_driver_sql('CREATE TABLE top_evidence_scores (evidence_id TEXT, predicate_curie TEXT, score REAL)')
+            connection.exec_driver_sql('CREATE TABLE pubmed_to_pmc (pmid TEXT, pmcid TEXT)')
+            connection.exec_driver_sql("INSERT INTO assertion VALUES ('a1', 'CHEBI:1', 'PR:1'), ('a2', 'CHEBI:1', 'PR:1'), ('a3', 'CHEBI:2', 'PR:2')")
+            connection.exec_driver_sql("INSERT INTO pubmed_to_pmc VALUES ('PMID:1', 'PMC1'), ('PMID:2', 'PMC2')")
+            evidence = [
+                ('e1', 'a1', 'PMID:1', 'sentence one', 'abstract', 'biolink:treats'),
+                ('e2', 'a2', 'PMC1', 'sentence one', 'abstract', 'biolink:treats'),
+                ('e3', 'a1', 'PMID:1', 'sentence two', 'abstract', 'biolink:treats'),
+                ('e4', 'a2', 'PMC1', 'sentence two', 'title', 'biolink:treats'),
+                ('e5', 'a3', 'PMID:2', 'sentence three', 'abstract', 'biolink:treats'),
+                ('e6', 'a3', 'PMC2', 'sentence three', 'abstract', 'biolink:contributes_to'),
+                ('e7', 'a3', 'PMID:3', 'sentence three', 'abstract', 'biolink:contributes_to'),
+                ('e8', 'a3', 'PMID:2', 'sentence four', 'abstract', 'biolink:treats'),
+                ('e9', 'a3', 'PMC2', 'sentence four', 'abstract', 'biolink:treats'),
+            ]
+            for evidence_id, assertion_id, document_id, sentence, zone, predicate in evidence:
+                connection.exec_driver_sql('INSERT INTO evidence VALUES (?, ?, ?, ?, ?, NULL)',
+                                           (evidence_id, assertion_id, document_id, sentence, zone))
+                connection.exec_driver_sql('INSERT INTO top_evidence_scores VALUES (?, ?, 0.9)', (evidence_id, predicate))
+            connection.exec_driver_sql("INSERT INTO top_evidence_scores VALUES ('e8', 'biolink:contributes_to', 0.5)")
+
+    def get_superseded(self):
+        with self.engine.connect() as connection:
+            return dict(connection.exec_driver_sql('SELECT evidence_id, superseded_by FROM evidence '
+                                                   'WHERE superseded_by IS NOT NULL').fetchall())
+
+    def test_supersede_evidence(self):
+        self.populate_supersession_tables()
+        updated = targeted.supersede_evidence(self.session, batch_size=2)
+        self.assertEqual(updated, 2)
+        self.assertEqual(self.get_superseded(), {'e1': 'PMC1', 'e8': 'PMC2'})
+
+    def test_supersede_evidence_unscored(self):
+        self.populate_supersession_tables()
+        with self.engine.begin() as connection:
+            # the same sentence in PubMed and PMC, but neither has a top_evidence_scores row
+            connection.exec_driver_sql("INSERT INTO evidence VALUES ('e10', 'a1', 'PMID:1', 'sentence five', "
+                                       "'abstract', NULL), ('e11', 'a2', 'PMC1', 'sentence five', 'abstract', NULL)")
+        self.assertEqual(targeted.supersede_evidence(self.session, batch_size=2), 2)
+        self.assertEqual(self.get_superseded(), {'e1': 'PMC1', 'e8': 'PMC2'})
+
+    def test_supersede_evidence_query_log(self):
+        self.populate_supersession_tables()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'queries.jsonl')
+            with querylog.QueryRecorder(filename) as recorder:
+                self.assertEqual(targeted.supersede_evidence(self.session, batch_size=2, query_recorder=recorder), 2)
+            with open(filename, 'r') as infile:
+                entries = [json.loads(line) for line in infile]
+        summaries = dict((entry['name'], entry) for entry in entries if entry['event'] == 'summary')
+        self.assertEqual(sorted(summaries), ['supersession_pmc', 'supersession_pubmed'])
+        self.assertTrue(all(summary['queries'] > 1 and summary['rows'] > 0 for summary in summaries.values()))
+        self.assertEqual(len([entry for entry in entries if entry['event'] == 'plan']), 2)
+
+    def test_supersede_evidence_resume(self):
+        self.populate_supersession_tables()
+        self.assertEqual(targeted.supersede_evidence(self.session, batch_size=3, start_after='e5'), 1)
+        self.assertEqual(self.get_superseded(), {'e8': 'PMC2'})
+        self.assertEqual(targeted.supersede_evidence(self.session, batch_size=3), 1)
+        self.assertEqual(self.get_superseded(), {'e1': 'PMC1', 'e8': 'PMC2'})
+
+    def populate_edge_rows(self):
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(f'CREATE TABLE edge_rows ({", ".join(services.EDGE_QUERY_FIELDS)})')
+            connection.exec_driver_sql('CREATE TABLE concept_idf (concept_curie TEXT, idf REAL)')
+            connection.exec_driver_sql("INSERT INTO concept_idf VALUES ('CHEBI:24433', 10.5), ('UniProtKB:P19883', 3.25), "
+                                       "('CHEBI:5292', 1.0), ('UniProtKB:P00000', 0), ('UniProtKB:P11111', NULL)")
+            for i in range(12):
+                connection.exec_driver_sql(f'INSERT INTO edge_rows VALUES ({", ".join("?" * len(services.EDGE_QUERY_FIELDS))})', (
+                    f'assertion{i % 3}', f'evidence{i}', 'biolink:ChemicalToGeneAssociation',
+                    'biolink:entity_negatively_regulates_entity' if i % 2 else 'biolink:entity_positively_regulates_entity',
+                    'CHEBI:24433' if i % 4 else 'CHEBI:5292', 'UniProtKB:P19883' if i % 3 else 'UniProtKB:P00000',
+                    f'PMC{1000 + i}', 'abstract', 2000 + i, 0.5 + i / 100, f'sentence {i}', '0|5', '10|15', 4))
+        return text(f'SELECT {", ".join(services.EDGE_QUERY_FIELDS)} FROM edge_rows WHERE assertion_id IN :ids '
+                    'ORDER BY assertion_id, evidence_id').bindparams(bindparam('ids', expanding=True))
+
+    def test_fetch_raw_rows(self):
+        query = self.populate_edge_rows()
+        rows = list(targeted.fetch_raw_rows(self.session, query, {'ids': ['assertion0', 'assertion2']}, fetch_size=5))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows, [tuple(row) for row in self.session.execute(query, {'ids': ['assertion0', 'assertion2']})])
+
+    def test_create_edge_dict_interns_rows(self):
+        query = self.populate_edge_rows()
+        rows = [row for row in self.session.execute(query, {'ids': ['assertion0', 'assertion1']})]
+        edge_dict = targeted.create_edge_dict(rows)
+        records = [record for records in edge_dict.values() for record in records]
+        self.assertEqual(len(records), 8)
+        self.assertTrue(all(isinstance(record, services.EdgeRecord) for record in records))
+        self.assertEqual(len(set(id(record.subject_curie) for record in records)), 2)
+        self.assertEqual(len(set(id(record.assertion_id) for record in records)), 2)
+        self.assertEqual([record.evidence_id for record in edge_dict['assertion1']],
+                         [row.evidence_id for row in rows if row.assertion_id == 'assertion1'])
+
+    def test_get_idf_weights(self):
+        self.populate_edge_rows()
+        weights = targeted.get_idf_weights(self.session)
+        self.assertEqual(weights, {'CHEBI:24433': math.log10(10.5), 'UniProtKB:P19883': math.log10(3.25),
+                                   'CHEBI:5292': 0.0})
+
+    def test_idf_weight_scores_match_joined_idf(self):
+        query = self.populate_edge_rows()
+        ids = ['assertion0', 'assertion1', 'assertion2']
+        weights = targeted.get_idf_weights(self.session)
+        idf = dict(self.session.execute(text('SELECT concept_curie, idf FROM concept_idf')).fetchall())
+        rows = [row for row in self.session.execute(query, {'ids': ids})]
+        records = [services.make_edge_record(row, {}, weights)
+                   for row in targeted.fetch_raw_rows(self.session, query, {'ids': ids})]
+        for row, record in zip(rows, records):
+            # the score the edge query computed when it joined concept_idf for each row
+            subject_idf, object_idf = idf.get(row.subject_curie), idf.get(row.object_curie)
+            if not subject_idf or not object_idf:
+                expected = float(row.score)
+            else:
+                expected = abs(math.log10(subject_idf) * math.log10(object_idf) * float(row.score))
+            self.assertEqual(services.get_score(record), expected)
+        row_dict = targeted.create_edge_dict(rows, weights)
+        record_dict = targeted.create_edge_dict(records)
+        for assertion_id in ids:
+            for predicate in ['biolink:entity_negatively_regulates_entity', 'biolink:entity_positively_regulates_entity']:
+                self.assertEqual(services.get_edge(row_dict[assertion_id], predicate),
+                                 services.get_edge(record_dict[assertion_id], predicate))
+
+    def populate_targeted_schema(self):
+        random.seed(37)
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql("ATTACH DATABASE ':memory:' AS targeted")
+            connection.exec_driver_sql('CREATE TABLE targeted.assertion (assertion_id TEXT PRIMARY KEY, association_curie TEXT, '
+                                       'subject_curie TEXT, object_curie TEXT)')
+            connection.exec_driver_sql('CREATE TABLE targeted.evidence (evidence_id TEXT PRIMARY KEY, assertion_id TEXT, '
+                                       'predicate_curie TEXT, document_id TEXT, document_zone TEXT, '
+                                       'document_year_published INTEGER, score REAL, sentence TEXT, subject_span TEXT, '
+                                       'object_span TEXT)')
+            for i in range(6):
+                connection.exec_driver_sql('INSERT INTO targeted.assertion VALUES (?, ?, ?, ?)',
+                                           (f'assertion{i}', 'biolink:ChemicalToGeneAssociation', 'CHEBI:24433', 'UniProtKB:P19883'))
+                for j in range(i * 2):
+                    connection.exec_driver_sql('INSERT INTO targeted.evidence VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                        f'evidence{i}_{j}', f'assertion{i}', random.choice(['biolink:treats', 'biolink:entity_positively_regulates_entity']),
+                        f'PMID:{j}', 'REF' if j % 5 == 4 else 'abstract', 2000 + j, random.random(), f'sentence {j}', '0|5', '10|15'))
+        return [f'assertion{i}' for i in range(6)]
+
+    def get_top_evidence(self, ids, top_k, edge_limit):
+        top = {}
+        for rows in targeted.get_edge_data(self.session, ids, chunk_size=4, edge_limit=edge_limit, idf_weights={},
+                                           top_k=top_k):
+            for row in rows:
+                top.setdefault(row.assertion_id, []).append((row.evidence_id, row.evidence_count))
+        return dict((assertion_id, sorted(evidence)) for assertion_id, evidence in top.items())
+
+    def test_top_k_strategies_match(self):
+        ids = self.populate_targeted_schema()
+        for edge_limit in [3, 0]:
+            window = self.get_top_evidence(ids, 'window', edge_limit)
+            heap = self.get_top_evidence(ids, 'heap', edge_limit)
+            self.assertEqual(window, heap)
+            self.assertNotIn('assertion0', heap)
+            expected_counts = dict((f'assertion{i}', len([j for j in range(i * 2) if j % 5 != 4])) for i in range(1, 6))
+            for assertion_id, evidence in heap.items():
+                self.assertEqual(len(evidence), min(edge_limit, expected_counts[assertion_id]) if edge_limit else expected_counts[assertion_id])
+        with self.engine.connect() as connection:
+            scores = dict(connection.exec_driver_sql('SELECT evidence_id, score FROM targeted.evidence '
+                                                     "WHERE assertion_id = 'assertion5' AND document_zone <> 'REF'").fetchall())
+        top_three = sorted(scores, key=scores.get, reverse=True)[:3]
+        self.assertEqual([evidence_id for evidence_id, _ in self.get_top_evidence(ids, 'heap', 3)['assertion5']], sorted(top_three))
+
+    def test_get_edge_data_adaptive_chunks(self):
+        ids = self.populate_targeted_schema()
+        sizer = chunking.AdaptiveChunkSizer(1, memory_budget=chunking.get_rss_bytes() + 1024 * 1024 * 1024,
+                                            target_seconds=60, min_size=1)
+        chunks = list(targeted.get_edge_data(self.session, ids, chunk_size=1, edge_limit=0, idf_weights={},
+                                             top_k='heap', chunk_sizer=sizer))
+        self.assertEqual([len(set(row.assertion_id for row in rows)) for rows in chunks], [0, 2, 3])
+        self.assertEqual(sorted(row.assertion_id for rows in chunks for row in rows),
+                         sorted(row.assertion_id for rows in targeted.get_edge_data(
+                             self.session, ids, chunk_size=6, edge_limit=0, idf_weights={}, top_k='heap') for row in rows))
+
+    def test_fetch_raw_rows_retry(self):
+        failures = []
+
+        class FlakyCursor(sqlite3.Cursor):
+            def execute(self, *args):
+                if failures:
+                    raise failures.pop()
+                return super().execute(*args)
+
+        class FlakyConnection(sqlite3.Connection):
+            def cursor(self, factory=FlakyCursor):
+                return super().cursor(factory)
+
+        directory = tempfile.TemporaryDirectory()  # a file, since an invalidated connection is replaced
+        filename = os.path.join(directory.name, 'numbers.db')
+        engine = create_engine('sqlite://', creator=lambda: sqlite3.connect(filename, factory=FlakyConnection))
+        invalidated = []
+        event.listen(engine, 'invalidate', lambda dbapi_connection, record, error: invalidated.append(error))
+        router = db.EndpointRouter([engine])
+        session = db.RoutingSession(router=router)
+        session.execute(text('CREATE TABLE numbers (n INTEGER)'))
+        session.execute(text('INSERT INTO numbers VALUES (1), (2), (3)'))
+        session.commit()
+        query = text('SELECT n FROM numbers WHERE n > :n ORDER BY n')
+        attempts = []
+
+        def fetch():
+            attempts.append(1)
+            return list(targeted.fetch_raw_rows(session, query, {'n': 1}, fetch_size=1))
+
+        # a lost connection is invalidated, its endpoint marked as failed, and the chunk retried
+        failures.append(sqlite3.OperationalError(2013, 'Lost connection to MySQL server during query'))
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertEqual(db.run_with_retry(session, fetch, retries=2, delay=0), [(2,), (3,)])
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual([error.args[0] for error in invalidated], [2013])
+        self.assertTrue(any('Database endpoint 0 failed' in line for line in logs.output))
+        # the retry succeeded on the only endpoint, which is working again
+        self.assertEqual([(stats['outstanding'], stats['available']) for stats in router.get_stats()], [(0, True)])
+        # a lock wait timeout is retried on the same connection
+        failures.append(sqlite3.OperationalError(1205, 'Lock wait timeout exceeded'))
+        self.assertEqual(db.run_with_retry(session, fetch, retries=2, delay=0), [(2,), (3,)])
+        self.assertEqual((len(attempts), len(invalidated)), (4, 1))
+        # other driver errors are raised as SQLAlchemy errors without a retry
+        failures.append(sqlite3.OperationalError('database is locked'))
+        with self.assertRaises(OperationalError) as context:
+            db.run_with_retry(session, fetch, retries=2, delay=0)
+        self.assertFalse(context.exception.connection_invalidated)
+        self.assertEqual(len(attempts), 5)
+        session.close()
+        engine.dispose()
+        directory.cleanup()
+
+    def test_get_edge_data_adaptive_chunks_retry(self):
+        ids = self.populate_targeted_schema()
+        sizer = chunking.AdaptiveChunkSizer(2, memory_budget=chunking.get_rss_bytes() + 1024 * 1024 * 1024,
+                                            target_seconds=0.1, min_size=1)
+        execute = self.session.execute
+        sleep = time.sleep
+        failures = [OperationalError('SELECT', {}, Exception(2013, 'Lost connection to MySQL server during query'))]
+
+        def flaky_execute(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return execute(*args, **kwargs)
+
+        # the retry delay is longer than the target query time, but only the successful query is timed
+        with mock.patch.object(self.session, 'execute', side_effect=flaky_execute), \
+                mock.patch('db.time.sleep', side_effect=lambda seconds: sleep(0.3)) as retry_sleep:
+            chunks = targeted.get_edge_data(self.session, ids, chunk_size=2, edge_limit=0, idf_weights={},
+                                            top_k='heap', chunk_sizer=sizer)
+            next(chunks)
+        retry_sleep.assert_called_once()
+        self.assertGreaterEqual(sizer.next_size(), 2)
+
+    def test_get_edge_data_query_log(self):
+        ids = self.populate_targeted_schema()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'queries.jsonl')
+            with querylog.QueryRecorder(filename) as recorder:
+                for raw_fetch in [False, True]:
+                    chunks = list(targeted.get_edge_data(self.session, ids, chunk_size=4, edge_limit=3,
+                                                         raw_fetch=raw_fetch, idf_weights={}, top_k='window',
+                                                         query_recorder=recorder))
+            with open(filename, 'r') as infile:
+                entries = [json.loads(line) for line in infile]
+        queries = [entry for entry in entries if entry['event'] == 'query']
+        self.assertEqual([(entry['name'], entry['assertions'], entry['raw_fetch']) for entry in queries],
+                         [('edge_data', 4, False), ('edge_data', 2, False), ('edge_data', 4, True),
+                          ('edge_data', 2, True)])
+        self.assertEqual(sum(entry['rows'] for entry in queries[2:]), sum(len(rows) for rows in chunks))
+        self.assertTrue(all(entry['bytes'] > 0 for entry in queries))
+        plans = [entry for entry in entries if entry['event'] == 'plan']
+        self.assertEqual(len(plans), 1)  # one query shape
+        self.assertEqual(plans[0]['dialect'], 'sqlite')
+        self.assertGreater(len(plans[0]['plan']), 0)
+        summaries = [entry for entry in entries if entry['event'] == 'summary']
+        self.assertEqual([(entry['queries'], entry['rows']) for entry in summaries],
+                         [(4, sum(entry['rows'] for entry in queries))])
+
+    def test_get_edge_query_unlimited(self):
+        self.assertIn(':edge_limit', str(targeted.get_edge_query('lateral', 5)))
+        self.assertNotIn('LIMIT', str(targeted.get_edge_query('lateral', 0)))
+        self.assertNotIn(':edge_limit', str(targeted.get_edge_query('window', 0)))
+        with self.assertRaises(ValueError):
+            targeted.get_edge_query('unknown', 5)
+
+    def test_get_edge_data_drops_excluded_predicates(self):
+        ids = self.populate_targeted_schema()
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('INSERT INTO targeted.evidence VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                'gain_evidence', 'assertion5', 'biolink:gain_of_function_contributes_to', 'PMID:1', 'abstract', 2000,
+                2.0, 'sentence', '0|5', '10|15'))
+            connection.exec_driver_sql('INSERT INTO targeted.evidence VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                'contributes_evidence', 'assertion4', 'biolink:contributes_to', 'PMID:1', 'abstract', 2000,
+                2.0, 'sentence', '0|5', '10|15'))
+        top = self.get_top_evidence(ids, 'heap', 3)
+        # the dropped evidence still takes one of the top three places
+        self.assertEqual(len(top['assertion5']), 2)
+        self.assertNotIn('gain_evidence', [evidence_id for evidence_id, _ in top['assertion5']])
+        # a predicate without a mapping is exported as it is
+        self.assertIn('contributes_evidence', [evidence_id for evidence_id, _ in top['assertion4']])
+
+    def test_snapshot_matches_database(self):
+        ids = self.populate_targeted_schema()
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE concept_idf (concept_curie TEXT, idf REAL)')
+            connection.exec_driver_sql("INSERT INTO concept_idf VALUES ('CHEBI:24433', 10.5), ('UniProtKB:P19883', 3.25)")
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'snapshot.db')
+            connection = sqlite3.connect(filename)
+            snapshot.create_snapshot_tables(connection)
+            self.assertEqual(snapshot.copy_assertions(self.session, connection, ids[:4]), (4, 12))
+            self.assertEqual(snapshot.copy_assertions(self.session, connection, ids[4:]), (2, 18))
+            self.assertEqual(snapshot.copy_concept_idf(self.session, connection), 2)
+            snapshot.finish_snapshot(connection)
+            self.assertFalse(snapshot.is_complete(filename))
+            snapshot.decompress_snapshot(snapshot.compress_snapshot(filename), filename)
+            self.assertTrue(snapshot.is_complete(filename))
+
+            session_maker = snapshot.open_snapshot(filename, pool_size=1)
+            snapshot_session = session_maker()
+            self.assertEqual(targeted.get_snapshot_assertion_ids(snapshot_session, limit=3, offset=2), ids[2:5])
+            self.assertEqual(targeted.get_idf_weights(snapshot_session), targeted.get_idf_weights(self.session))
+            for top_k in ['window', 'heap']:
+                expected = [repr(row) for rows in targeted.get_edge_data(self.session, ids, 4, 3, top_k=top_k) for row in rows]
+                actual = [repr(row) for rows in targeted.get_edge_data(snapshot_session, ids, 4, 3, top_k=top_k) for row in rows]
+                self.assertEqual(actual, expected)
+            session_maker.remove()
+            with open(filename, 'ab') as outfile:  # a file that changed after it was written is not reused
+                outfile.write(b'\0')
+            self.assertFalse(snapshot.is_complete(filename))
+
 #
 # #region DB-dependent Tests
 #
@@ -0,0 +1,87 @@
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import mock
+import edge_index
+import validate
+
+
+def make_line(assertion_id: str, predicate: str = 'biolink:treats_or_applied_or_studied_to_treat',
+              subject: str = 'CHEBI:1', attributes: str = '[]') -> str:
+    columns = [subject, predicate, 'MONDO:1'] + [''] * 10 + [assertion_id, 'RO:0000001', '0.5', '', '', attributes]
+    return '\t'.join(columns) + '\n'
+
+
+class ValidateTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None: # pragma: no cover
+        if 'tests' not in os.getcwd():
+            os.chdir(f'{os.getcwd()}/tests')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.nodes_filename = os.path.join(self.directory.name, 'nodes.tsv.gz')
+        with gzip.open(self.nodes_filename, 'wt') as outfile:
+            outfile.write('CHEBI:1\taspirin\tbiolink:SmallMolecule\nMONDO:1\tpain\tbiolink:Disease\n')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def get_lines(self) -> list[str]:
+        lines = [make_line(f'{i:04d}') for i in range(200)]
+        lines[10] = make_line('0010', subject='CHEBI:2')
+        lines[20] = make_line('0020', attributes='[{"attribute_type_id": ')
+        lines[30] = make_line('0030').replace('\tRO:0000001', '\tRO:\t0000001')  # a tab in a column
+        lines[150] = make_line('0149')  # duplicates the previous edge
+        lines[199] = make_line('0000')  # duplicates an edge in another unit
+        lines.append(make_line('0000', predicate='biolink:affects'))  # the same id with another predicate is valid
+        return lines
+
+    def check_report(self, report: dict) -> None:
+        self.assertEqual(report['nodes'], 2)
+        self.assertEqual(report['edges'], 201)
+        self.assertEqual(report['errors'], {'subject': 1, 'attributes': 1, 'columns': 1, 'duplicate': 2})
+        self.assertFalse(validate.is_valid(report))
+        self.assertIn('line 31', report['samples']['columns'][0])
+
+    def test_validate_plain_file(self):
+        edges_filename = os.path.join(self.directory.name, 'edges.tsv')
+        with open(edges_filename, 'w') as outfile:
+            outfile.writelines(self.get_lines())
+        with mock.patch('validate.UNIT_BYTES', 5000):
+            self.assertGreater(len(list(validate.get_edge_units(edges_filename))), 2)
+            self.check_report(validate.validate_files(self.nodes_filename, edges_filename))
+
+    def test_validate_gzip_lines(self):
+        edges_filename = os.path.join(self.directory.name, 'edges.tsv.gz')
+        with gzip.open(edges_filename, 'wt') as outfile:
+            outfile.writelines(self.get_lines())
+        with mock.patch('validate.UNIT_LINES', 64):
+            self.check_report(validate.validate_files(self.nodes_filename, edges_filename, workers=2))
+
+    def test_validate_indexed_blocks(self):
+        edges_filename = os.path.join(self.directory.name, 'edges.tsv.gz')
+        lines = sorted(self.get_lines(), key=edge_index.get_assertion_id)
+        with edge_index.BlockGzipWriter(edges_filename, block_size=2000) as writer:
+            for line in lines:
+                writer.write_assertion(edge_index.get_assertion_id(line), [line])
+        edge_index.write_index(edges_filename + '.index', writer.blocks)
+        with mock.patch('validate.UNIT_BLOCKS', 2):
+            units = list(validate.get_edge_units(edges_filename))
+            self.assertTrue(all(unit[0] == 'blocks' for unit in units))
+            report = validate.validate_files(self.nodes_filename, edges_filename, workers=2)
+        self.assertEqual(report['edges'], 201)
+        self.assertEqual(report['errors'], {'subject': 1, 'attributes': 1, 'columns': 1, 'duplicate': 2})
+
+    def test_validate_valid_files(self):
+        edges_filename = os.path.join(self.directory.name, 'edges.tsv.gz')
+        with gzip.open(edges_filename, 'wt') as outfile:
+            outfile.writelines([make_line('0001'), make_line('0002', attributes='[{"value": 1}]')])
+        report = validate.validate_files(self.nodes_filename, edges_filename)
+        self.assertTrue(validate.is_valid(report))
+        self.assertEqual(report['errors'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+"""
+Validation of the KGX nodes and edges files before they are published.
+
+Every edge line is checked for the number of columns (a tab or newline in a sentence changes it), for a subject and
+object that are in the nodes file, for an id, for _attributes that parse as a JSON list, and for duplicate edges (the
+same id, predicate and qualifiers). The edges file is split into units that are validated by a pool of processes:
+groups of blocks for an indexed edges.tsv.gz, byte ranges for an uncompressed file, and batches of lines read by the
+main process otherwise.
+
+Usage: python validate.py nodes.tsv.gz edges.tsv.gz [-w WORKERS] [-o REPORT]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator
+
+import edge_index
+import merge
+import scan
+
+NODE_COLUMN_COUNT = 3
+EDGE_COLUMN_COUNT = 19
+SUBJECT_COLUMN = 0
+OBJECT_COLUMN = 2
+ID_COLUMN = 13
+ATTRIBUTES_COLUMN = 18
+KEY_COLUMNS = (ID_COLUMN, 1) + tuple(range(3, 13))  # the id, predicate and qualifiers identify an edge
+UNIT_BLOCKS = 16  # about 16 MiB of edges per unit for an indexed file
+UNIT_BYTES = 16 * 1024 * 1024
+UNIT_LINES = 10000
+MAX_SAMPLES = 20  # error messages kept for each kind of error
+
+_node_ids = None  # the node ids, set in each worker process by init_worker
+
+
+def init_worker(node_ids: set[str]) -> None:
+    global _node_ids
+    _node_ids = node_ids
+
+
+def create_report() -> dict:
+    return {'nodes': 0, 'edges': 0, 'errors': {}, 'samples': {}}
+
+
+def add_error(report: dict, kind: str, message: str, count: bool = True) -> None:
+    """
+    Record an error in a validation report
+
+    :param report: the report from create_report
+    :param kind: the kind of error
+    :param message: a description of the error, kept if there are fewer than MAX_SAMPLES of this kind
+    :param count: whether to count the error (duplicates are counted once all of the units are done)
+    """
+    if count:
+        report['errors'][kind] = report['errors'].get(kind, 0) + 1
+    samples = report['samples'].setdefault(kind, [])
+    if len(samples) < MAX_SAMPLES:
+        samples.append(message)
+
+
+def merge_report(report: dict, part: dict) -> None:
+    report['nodes'] += part['nodes']
+    report['edges'] += part['edges']
+    for kind, count in part['errors'].items():
+        report['errors'][kind] = report['errors'].get(kind, 0) + count
+    for kind, messages in part['samples'].items():
+        samples = report['samples'].setdefault(kind, [])
+        samples.extend(messages[:MAX_SAMPLES - len(samples)])
+
+
+def is_valid(report: dict) -> bool:
+    return not any(report['errors'].values())
+
+
+def get_key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def validate_nodes(nodes_filename: str, report: dict) -> set[str]:
+    """
+    Validate the nodes file and collect its node ids
+
+    :param nodes_filename: the gzipped nodes filename
+    :param report: the report to add the node count and errors to
+    :returns the node ids
+    """
+    node_ids = set()
+    with gzip.open(nodes_filename, 'rt', encoding='utf-8') as infile:
+        for line_number, line in enumerate(infile, start=1):
+            report['nodes'] += 1
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) != NODE_COLUMN_COUNT:
+                add_error(report, 'node_columns', f'{nodes_filename} line {line_number}: {len(columns)} columns, '
+                                                  f'expected {NODE_COLUMN_COUNT}')
+            if not columns[0]:
+                add_error(report, 'node_id', f'{nodes_filename} line {line_number}: no id')
+            elif columns[0] in node_ids:
+                add_error(report, 'duplicate_node', f'{nodes_filename} line {line_number}: duplicate id {columns[0]}')
+            node_ids.add(columns[0])
+    return node_ids
+
+
+def validate_edge_lines(lines, location: str, first_line: int = 1):
+    """
+    Validate a sequence of edge lines against the node ids set by init_worker
+
+    :param lines: the edge lines
+    :param location: where the lines come from, for the error messages
+    :param first_line: the line number of the first line, counted from the start of the location
+    :returns the report for the lines and an array of the hashes of their edge keys
+    """
+    import numpy as np
+
+    report = create_report()
+    hashes = []
+    keys = set()
+    for line_number, line in enumerate(lines, start=first_line):
+        report['edges'] += 1
+        where = f'{location} line {line_number}'
+        columns = line.rstrip('\n').split('\t')
+        if len(columns) != EDGE_COLUMN_COUNT:
+            add_error(report, 'columns', f'{where}: {len(columns)} columns, expected {EDGE_COLUMN_COUNT}')
+            continue
+        if columns[SUBJECT_COLUMN] not in _node_ids:
+            add_error(report, 'subject', f'{where}: subject {columns[SUBJECT_COLUMN]} is not in the nodes file')
+        if columns[OBJECT_COLUMN] not in _node_ids:
+            add_error(report, 'object', f'{where}: object {columns[OBJECT_COLUMN]} is not in the nodes file')
+        if not columns[ID_COLUMN]:
+            add_error(report, 'id', f'{where}: no id')
+        try:
+            if not isinstance(json.loads(columns[ATTRIBUTES_COLUMN]), list):
+                add_error(report, 'attributes', f'{where}: _attributes is not a list')
+        except ValueError as error:
+            add_error(report, 'attributes', f'{where}: _attributes is not valid JSON ({error})')
+        key = '\t'.join(columns[column] for column in KEY_COLUMNS)
+        if key in keys:  # duplicates across units are found from the hashes
+            add_error(report, 'duplicate', f'{where}: duplicate edge {columns[ID_COLUMN]} {columns[1]}', count=False)
+        keys.add(key)
+        hashes.append(get_key_hash(key))
+    return report, np.array(hashes, dtype=np.uint64)
+
+
+def read_blocks(filename: str, offsets: list[int]) -> Iterator[str]:
+    with open(filename, 'rb') as infile:
+        for offset in offsets:
+            yield from edge_index.read_block(infile, offset)
+
+
+def validate_edge_unit(unit: tuple):
+    """
+    Validate one unit of an edges file
+
+    :param unit: ('blocks', filename, block offsets), ('bytes', filename, start, end) or ('lines', filename,
+    first line number, lines)
+    :returns the report for the unit and an array of the hashes of its edge keys
+    """
+    kind, filename = unit[0], unit[1]
+    if kind == 'blocks':
+        return validate_edge_lines(read_blocks(filename, unit[2]), f'{filename} block at byte {unit[2][0]}')
+    if kind == 'bytes':
+        return validate_edge_lines(scan.read_lines(filename, unit[2], unit[3]), f'{filename} byte {unit[2]}')
+    return validate_edge_lines(unit[3], filename, first_line=unit[2])
+
+
+def get_edge_units(edges_filename: str, index_filename: str = None) -> Iterator[tuple]:
+    """
+    Split an edges file into units that can be validated independently
+
+    :param edges_filename: the edges filename (plain or gzip)
+    :param index_filename: the block index of a gzipped edges file (edges_filename + '.index' if it exists)
+    :returns an iterator of units for validate_edge_unit
+    """
+    if not edges_filename.endswith('.gz'):
+        for start, end in scan.get_line_ranges(edges_filename, UNIT_BYTES):
+            yield 'bytes', edges_filename, start, end
+        return
+    index_filename = index_filename if index_filename else edges_filename + '.index'
+    if os.path.exists(index_filename):
+        _, offsets = edge_index.read_index(index_filename)
+        for start in range(0, len(offsets), UNIT_BLOCKS):
+            yield 'blocks', edges_filename, offsets[start:start + UNIT_BLOCKS]
+        return
+    lines = []
+    first_line = 1
+    with merge.open_edge_file(edges_filename) as infile:
+        for line in infile:
+            lines.append(line)
+            if len(lines) == UNIT_LINES:
+                yield 'lines', edges_filename, first_line, lines
+                first_line += len(lines)
+                lines = []
+    if lines:
+        yield 'lines', edges_filename, first_line, lines
+
+
+def validate_files(nodes_filename: str, edges_filename: str, workers: int = 1, index_filename: str = None) -> dict:
+    """
+    Validate a KGX nodes file and edges file
+
+    :param nodes_filename: the gzipped nodes filename
+    :param edges_filename: the edges filename (plain or gzip)
+    :param workers: the number of processes validating edges
+    :param index_filename: the block index of a gzipped edges file (edges_filename + '.index' if it exists)
+    :returns the validation report: node and edge counts, error counts by kind, and sample error messages
+    """
+    import numpy as np
+
+    report = create_report()
+    node_ids = validate_nodes(nodes_filename, report)
+    hash_arrays = []
+    units = get_edge_units(edges_filename, index_filename)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(node_ids,)) as executor:
+            pending = set()
+            for unit in units:
+                pending.add(executor.submit(validate_edge_unit, unit))
+                if len(pending) >= workers * 2:  # only a few units of lines are held at a time
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        part, hashes = future.result()
+                        merge_report(report, part)
+                        hash_arrays.append(hashes)
+            for future in pending:
+                part, hashes = future.result()
+                merge_report(report, part)
+                hash_arrays.append(hashes)
+    else:
+        init_worker(node_ids)
+        for unit in units:
+            part, hashes = validate_edge_unit(unit)
+            merge_report(report, part)
+            hash_arrays.append(hashes)
+    hashes = np.sort(np.concatenate(hash_arrays)) if hash_arrays else np.array([], dtype=np.uint64)
+    duplicates = int(np.count_nonzero(hashes[1:] == hashes[:-1]))
+    if duplicates:
+        report['errors']['duplicate'] = duplicates
+    logging.info(f'Validated {report["nodes"]} nodes and {report["edges"]} edges: {report["errors"]}')
+    return report
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(module)s:%(funcName)s:%(levelname)s: %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('nodes', help='the gzipped nodes file')
+    parser.add_argument('edges', help='the edges file (plain or gzip)')
+    parser.add_argument('-w', '--workers', help='number of validating processes', default=os.cpu_count(), type=int)
+    parser.add_argument('-o', '--output', help='file to write the JSON report to')
+    args = parser.parse_args()
+    validation_report = validate_files(args.nodes, args.edges, workers=args.workers)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            outfile.write(json.dumps(validation_report, indent=2))
+    else:
+        json.dump(validation_report, sys.stdout, indent=2)
+    sys.exit(0 if is_valid(validation_report) else 1)